@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Async HTTP API around the rewordify pipeline, for integrations that do not go through the browser.
+
+    OPENAI_API_KEY=... WEB_CONCURRENCY=4 uvicorn api_service:app --host 0.0.0.0 --port 8000
+
+Each worker process serves many requests at once: ChatGPT calls are async (under the shared
+rate_limit scheduler), PDF parsing runs in a process pool, and PII masking and prompt building
+(token counting) run in threads, so none of them blocks the event loop. Token encodings are
+loaded at startup.
+Workers keep no per-user state, so the service can be scaled out behind a load balancer.
+Each worker uses an equal share of the rate limits, so the worker count must be set with
+WEB_CONCURRENCY (which uvicorn also reads) or REWORDIFY_API_WORKERS rather than only --workers.
+
+Endpoints:
+- POST /v1/rewordify/pdf       multipart upload of an intake PDF
+- POST /v1/rewordify/sections  JSON with raw section text keyed by section key
+- GET  /v1/prompts             default prompt versions
+- GET  /healthz
+
+Both rewordify endpoints return JSON, or with stream=true newline delimited JSON events
+("delta" per token, "section" when a section is finished, then "done").
+"""
+import asyncio
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+import model_routing
+import rate_limit
+import token_budget
+import tracing
+import util_v2
+
+
+OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL")
+DEFAULT_MODEL = os.environ.get("REWORDIFY_MODEL", "gpt-3.5-turbo")
+
+# Number of uvicorn worker processes sharing the account's rate limits
+API_WORKERS = int(os.environ.get("REWORDIFY_API_WORKERS", os.environ.get("WEB_CONCURRENCY", 1)))
+
+# Processes parsing PDFs for this worker
+PARSE_WORKERS = int(os.environ.get("REWORDIFY_PARSE_WORKERS", os.cpu_count() or 1))
+
+# Largest PDF accepted
+MAX_UPLOAD_BYTES = int(os.environ.get("REWORDIFY_MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+
+# Header and temperature of every section key accepted by /v1/rewordify/sections, in output order
+SECTION_SETTINGS = {
+    'questionaire': ('**Questionaire Summary**', 0.7),
+    'icbc': ('**ICBC/WBC**', 0),
+    **{key: (display_header, 0) for key, pdf_header, display_header in util_v2.DOCUMENT_SECTIONS}
+}
+
+_parse_pool = None
+
+
+def parse_pdf_bytes(pdf_bytes):
+    """
+    Extract and parse a PDF. Runs in a parse pool process.
+
+    Parameters:
+    - pdf_bytes (bytes): PDF content
+
+    Returns:
+    - tuple: The extracted text, and the util_v2.parse_document dict
+    """
+    # The pool already spreads documents over the CPUs, so pages are not split further
+    pdf_txt = util_v2.pdf_file_extract_text(pdf_bytes, max_workers=1)
+    return pdf_txt, util_v2.parse_document(pdf_txt)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global _parse_pool
+    # Every worker process runs its own scheduler, so each gets its share of the limits
+    rate_limit.use_share_of_limits(API_WORKERS)
+    # Load (or download) the token encodings before serving, not during the first request
+    for model in (DEFAULT_MODEL, model_routing.SMALL_MODEL):
+        await asyncio.get_running_loop().run_in_executor(None, token_budget.load_encoding, model)
+    _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        yield
+    finally:
+        _parse_pool.shutdown(cancel_futures=True)
+        _parse_pool = None
+
+
+app = FastAPI(title="enable rewordify", lifespan=lifespan)
+
+
+class SectionsRequest(BaseModel):
+    sections: Dict[str, str]
+    model: str = DEFAULT_MODEL
+    prompts: Optional[Dict[str, str]] = None
+    use_cache: bool = True
+    routing: bool = False
+    stream: bool = False
+
+
+def prepare_routed_document(pdf_txt, parsed, model, raw_questionaire_txt, raw_icbc_txt, routing):
+    """
+    Section jobs of a parsed PDF with the default prompts, each routed to a model. Runs in a
+    thread, as PII masking and token counting would otherwise block the event loop.
+
+    Returns:
+    - dict: util_v2.prepare_document result
+    """
+    document = util_v2.prepare_document(pdf_txt, util_v2.load_default_prompts(), raw_questionaire_txt, raw_icbc_txt, parsed)
+    document['section_jobs'] = model_routing.route_section_jobs(document['section_jobs'], model, model_routing.routing_policy() if routing else None)
+    return document
+
+
+def _require_api_key():
+    if not OPENAI_API_KEY:
+        raise HTTPException(status_code=503, detail="OPENAI_API_KEY is not set")
+
+
+async def _reword_json(model, section_jobs, use_cache, combine):
+    """
+    Reword every section and build the JSON response.
+
+    Parameters:
+    - model (str): ChatGPT model
+    - section_jobs (list): Section jobs (see util_v2.prepare_document)
+    - use_cache (bool): Reuse cached responses for unchanged sections
+    - combine (function): Turns the reworded sections (keyed by section key) into the final text
+
+    Returns:
+    - dict: 'sections', 'rewordified_text', 'routes', 'default_prompt_versions' and 'timings'
+    """
+    with tracing.start_trace() as trace:
+        outputs = await util_v2.reword_sections_async(OPENAI_API_KEY, model, section_jobs, OPENAI_BASE_URL, use_cache)
+        reworded = dict(zip([job['key'] for job in section_jobs], outputs))
+        rewordified_text = combine(reworded)
+
+    return {
+        'sections': reworded,
+        'rewordified_text': rewordified_text,
+        'routes': {job['key']: job['route'] for job in section_jobs},
+        'default_prompt_versions': util_v2.default_prompt_versions(),
+        'timings': trace.rows()
+    }
+
+
+async def _reword_events(model, section_jobs, use_cache, combine, finish_section):
+    """
+    Reword every section at once, yielding newline delimited JSON events as tokens arrive.
+
+    Parameters:
+    - model (str): ChatGPT model
+    - section_jobs (list): Section jobs (see util_v2.prepare_document)
+    - use_cache (bool): Reuse cached responses for unchanged sections
+    - combine (function): Turns the reworded sections (keyed by section key) into the final text
+    - finish_section (function): Final form of one reworded section (e.g. with PII put back)
+
+    Yields:
+    - string: One JSON event per line
+    """
+    queue = asyncio.Queue()
+
+    async def stream_section(job):
+        tokens = []
+        try:
+            async for token in util_v2.reword_section_text_stream_async(OPENAI_API_KEY, job['model'], job['temperature'], job['prompt'], job['section_header'], job['section_text'], OPENAI_BASE_URL, use_cache):
+                tokens.append(token)
+                await queue.put({'type': 'delta', 'section': job['key'], 'text': token})
+            await queue.put({'type': 'section', 'section': job['key'], 'text': "".join(tokens)})
+        except Exception as e:
+            await queue.put({'type': 'error', 'section': job['key'], 'error': f"{type(e).__name__}: {e}"})
+
+    tasks = [asyncio.create_task(stream_section(job)) for job in section_jobs]
+    reworded = {}
+    failed = False
+    try:
+        for _ in range(len(section_jobs)):
+            # Deltas until this task's section (or error) event arrives
+            while True:
+                event = await queue.get()
+                if event['type'] == 'section':
+                    reworded[event['section']] = event['text']
+                    event['text'] = finish_section(event['text'])
+                failed = failed or event['type'] == 'error'
+                yield json.dumps(event) + "\n"
+                if event['type'] != 'delta':
+                    break
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    if not failed:
+        yield json.dumps({'type': 'done', 'rewordified_text': combine(reworded)}) + "\n"
+
+
+@app.get("/healthz")
+async def healthz():
+    return {'status': 'ok'}
+
+
+@app.get("/v1/prompts")
+async def prompt_versions():
+    return util_v2.default_prompt_versions()
+
+
+@app.post("/v1/rewordify/pdf")
+async def rewordify_pdf(
+    file: UploadFile = File(...),
+    model: str = Form(DEFAULT_MODEL),
+    raw_questionaire_txt: str = Form('N/A'),
+    raw_icbc_txt: str = Form('N/A'),
+    use_cache: bool = Form(True),
+    routing: bool = Form(False),
+    stream: bool = Form(False)
+):
+    """
+    Rewordify an intake PDF with the default prompts.
+    """
+    _require_api_key()
+
+    pdf_bytes = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(pdf_bytes) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"PDF is larger than {MAX_UPLOAD_BYTES} bytes")
+
+    try:
+        pdf_txt, parsed = await asyncio.get_running_loop().run_in_executor(_parse_pool, parse_pdf_bytes, pdf_bytes)
+    except Exception as e:
+        raise HTTPException(status_code=422, detail=f"Could not read the PDF: {type(e).__name__}: {e}")
+
+    document = await asyncio.get_running_loop().run_in_executor(
+        None, prepare_routed_document, pdf_txt, parsed, model, raw_questionaire_txt, raw_icbc_txt, routing
+    )
+
+    def combine(reworded):
+        return util_v2.combine_reworded_sections(document, reworded)
+
+    def finish_section(text):
+        return util_v2.unmask_pii(text, document['pii_replacements'])
+
+    if stream:
+        return StreamingResponse(_reword_events(model, document['section_jobs'], use_cache, combine, finish_section), media_type="application/x-ndjson")
+
+    response = await _reword_json(model, document['section_jobs'], use_cache, combine)
+    response['sections'] = {key: finish_section(text) for key, text in response['sections'].items()}
+    response['original_text'] = document['original_txt']
+    return response
+
+
+@app.post("/v1/rewordify/sections")
+async def rewordify_sections(request: SectionsRequest):
+    """
+    Rewordify raw section text keyed by section key (see SECTION_SETTINGS). The text is sent as
+    given: no PII masking is done, as there is no patient information to mask it with.
+    """
+    _require_api_key()
+
+    unknown_keys = sorted(set(request.sections) - set(SECTION_SETTINGS))
+    if len(unknown_keys) > 0:
+        raise HTTPException(status_code=422, detail=f"Unknown section keys: {', '.join(unknown_keys)}")
+
+    prompts = util_v2.load_default_prompts()
+    prompts.update(request.prompts or {})
+
+    section_jobs = [
+        {'key': key, 'temperature': temperature, 'prompt': prompts[key], 'section_header': section_header, 'section_text': request.sections[key]}
+        for key, (section_header, temperature) in SECTION_SETTINGS.items()
+        if key in request.sections
+    ]
+    section_jobs = await asyncio.get_running_loop().run_in_executor(
+        None, model_routing.route_section_jobs, section_jobs, request.model, model_routing.routing_policy() if request.routing else None
+    )
+
+    def combine(reworded):
+        return '\n\n'.join(reworded[job['key']] for job in section_jobs)
+
+    if request.stream:
+        return StreamingResponse(_reword_events(request.model, section_jobs, request.use_cache, combine, lambda text: text), media_type="application/x-ndjson")
+
+    return await _reword_json(request.model, section_jobs, request.use_cache, combine)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Headless batch runner for rewordify.
+
+Rewords every intake PDF in a folder (or glob) and writes one output file per document
+plus a manifest.json summary. Finished documents are recorded in the manifest as they
+complete, so re-running the same command after a crash only processes what is left.
+
+Example:
+    python batch_rewordify.py intake_pdfs/ --output-dir rewordified/ --workers 4
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import model_routing
+import util_v2
+
+
+def find_pdf_files(inputs):
+    """
+    Expand folders and glob patterns into a sorted list of PDF file paths.
+
+    Parameters:
+    - inputs (list): Folder paths, PDF file paths or glob patterns
+
+    Returns:
+    - list: PDF file paths
+    """
+    pdf_paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, "*.pdf")) + glob.glob(os.path.join(item, "*.PDF"))
+        else:
+            matches = glob.glob(item)
+        pdf_paths.update(path for path in matches if path.lower().endswith(".pdf") and os.path.isfile(path))
+    return sorted(pdf_paths)
+
+
+def load_manifest(manifest_path):
+    """
+    Load the manifest from a previous run, or start a new one.
+
+    Parameters:
+    - manifest_path (str): manifest.json path
+
+    Returns:
+    - dict: Manifest with a 'documents' entry keyed by PDF path
+    """
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r") as file:
+            return json.load(file)
+    return {"documents": {}}
+
+
+def save_manifest(manifest, manifest_path):
+    """
+    Write the manifest atomically so a crash never leaves a half written file.
+
+    Parameters:
+    - manifest (dict): Manifest to write
+    - manifest_path (str): manifest.json path
+    """
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def output_name(pdf_path):
+    """
+    Output file name for a PDF: <pdf name>-<hash>.txt, where hash is a short SHA-256 of the PDF's
+    absolute path. PDFs with the same name in different folders (intake/a.pdf and intake/sub/a.pdf)
+    never share an output file, whether they are in one run or in separate runs into the same
+    folder, and a re-run of the same PDF finds the same file.
+
+    Parameters:
+    - pdf_path (str): PDF file path
+
+    Returns:
+    - string: Output file name
+    """
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    path_hash = hashlib.sha256(os.path.abspath(pdf_path).encode('utf-8')).hexdigest()[:8]
+    return f"{stem}-{path_hash}.txt"
+
+
+def run_key(sha256, model, prompts, batched=False, routing=None):
+    """
+    Key of one document's run: its content and every setting that changes the output, so a
+    document is only skipped as finished if it would be reworded the same way again.
+
+    Parameters:
+    - sha256 (str): Hash of the PDF
+    - model (str): ChatGPT model
+    - prompts (dict): Prompt text keyed by section key
+    - batched (bool): Reword all sections in one request
+    - routing (dict): Model routing policy, or None
+
+    Returns:
+    - string: SHA-256 hex digest
+    """
+    payload = json.dumps([sha256, model, prompts, batched, routing], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def is_finished(entry, key, output_path):
+    """
+    Check if a manifest entry shows this exact PDF was already rewordified into output_path with
+    the same settings.
+
+    Parameters:
+    - entry (dict): Manifest entry of the PDF, or None
+    - key (str): run_key of the PDF with the current settings
+    - output_path (str): Expected output file path
+
+    Returns:
+    - bool: True if the document can be skipped
+    """
+    return (
+        entry is not None
+        and entry.get("status") == "done"
+        and entry.get("run_key") == key
+        and entry.get("output") == output_path
+        and os.path.exists(output_path)
+    )
+
+
+def rewordify_pdf_file(pdf_path, output_path, prompts, api_key, model, section_workers, base_url, use_cache, batched=False, routing=None):
+    """
+    Rewordify one PDF and write the raw rewordified text to output_path.
+
+    Parameters:
+    - pdf_path (str): PDF file path
+    - output_path (str): Output file path
+    - prompts (dict): Prompt text keyed by section key
+    - api_key
+    - model
+    - section_workers (int): Maximum number of ChatGPT calls in flight for this document
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - use_cache (bool): Reuse cached responses for unchanged sections.
+    - batched (bool): Reword all sections in one request
+    - routing (dict): Model routing policy (see model_routing.routing_policy), or None
+    """
+    # PyMuPDF reads the file itself, it is never loaded into memory as a whole
+    pdf_txt = util_v2.pdf_file_extract_text(pdf_path)
+
+    document, combine_sections = util_v2.rewordify_document(
+        pdf_txt, prompts, api_key, model,
+        max_workers=section_workers, base_url=base_url, use_cache=use_cache, batched=batched, routing=routing
+    )
+
+    tmp_path = output_path + ".tmp"
+    with open(tmp_path, "w") as file:
+        file.write(combine_sections.replace('**', ''))
+    os.replace(tmp_path, output_path)
+
+
+def run_batch(pdf_paths, output_dir, api_key, model, workers=4, section_workers=10, base_url=None,
+              use_cache=True, force=False, batched=False, routing=None):
+    """
+    Rewordify a list of PDFs with bounded concurrency, recording progress in <output_dir>/manifest.json.
+
+    Parameters:
+    - pdf_paths (list): PDF file paths
+    - output_dir (str): Output folder
+    - api_key
+    - model
+    - workers (int): Number of documents processed at the same time
+    - section_workers (int): Maximum number of ChatGPT calls in flight per document
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - use_cache (bool): Reuse cached responses for unchanged sections.
+    - force (bool): Process every document again, even if the manifest shows it as done
+    - batched (bool): Reword all sections of a document in one request
+    - routing (dict): Model routing policy (see model_routing.routing_policy), or None
+
+    Returns:
+    - dict: The final manifest
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, "manifest.json")
+    manifest = load_manifest(manifest_path)
+    manifest_lock = threading.Lock()
+    prompts = util_v2.load_default_prompts()
+    prompt_versions = util_v2.default_prompt_versions()
+
+    def process(pdf_path):
+        sha256 = util_v2.document_hash(pdf_path)
+        key = run_key(sha256, model, prompts, batched, routing)
+        output_path = os.path.join(output_dir, output_name(pdf_path))
+
+        with manifest_lock:
+            entry = manifest["documents"].get(pdf_path)
+        if not force and is_finished(entry, key, output_path):
+            return pdf_path, "skipped"
+
+        start_time = time.time()
+        entry = {"sha256": sha256, "run_key": key, "output": output_path}
+        try:
+            rewordify_pdf_file(pdf_path, output_path, prompts, api_key, model, section_workers, base_url, use_cache, batched, routing)
+            entry["status"] = "done"
+        except Exception as e:
+            entry["status"] = "failed"
+            entry["error"] = f"{type(e).__name__}: {e}"
+        entry["seconds"] = round(time.time() - start_time, 3)
+
+        with manifest_lock:
+            manifest["documents"][pdf_path] = entry
+            save_manifest(manifest, manifest_path)
+        return pdf_path, entry["status"]
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(process, pdf_path) for pdf_path in pdf_paths]
+        for future in as_completed(futures):
+            pdf_path, status = future.result()
+            print(f"{status:>7}  {pdf_path}", flush=True)
+
+    statuses = [manifest["documents"].get(pdf_path, {}).get("status") for pdf_path in pdf_paths]
+    manifest["summary"] = {
+        "total": len(pdf_paths),
+        "done": statuses.count("done"),
+        "failed": statuses.count("failed"),
+        "model": model,
+        "prompt_versions": prompt_versions,
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+    }
+    save_manifest(manifest, manifest_path)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rewordify a folder of intake PDFs.")
+    parser.add_argument("inputs", nargs="+", help="PDF folders, files or glob patterns")
+    parser.add_argument("--output-dir", default="rewordified", help="Folder for output files and manifest.json")
+    parser.add_argument("--model", default="gpt-3.5-turbo", help="ChatGPT model")
+    parser.add_argument("--workers", type=int, default=4, help="Documents processed at the same time")
+    parser.add_argument("--section-workers", type=int, default=10, help="ChatGPT calls in flight per document")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="Defaults to $OPENAI_API_KEY")
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"), help="Defaults to $OPENAI_BASE_URL")
+    parser.add_argument("--no-cache", action="store_true", help="Do not reuse cached responses")
+    parser.add_argument("--force", action="store_true", help="Process documents already marked done in the manifest")
+    parser.add_argument("--batched", action="store_true", help="Reword all sections of a document in one request")
+    parser.add_argument("--route", action="store_true", help="Send short and list sections to --small-model")
+    parser.add_argument("--small-model", default=model_routing.SMALL_MODEL, help="Model for short and list sections with --route")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("an API key is required (--api-key or $OPENAI_API_KEY)")
+
+    pdf_paths = find_pdf_files(args.inputs)
+    if len(pdf_paths) == 0:
+        parser.error("no PDF files found")
+
+    manifest = run_batch(
+        pdf_paths, args.output_dir, args.api_key, args.model,
+        workers=args.workers, section_workers=args.section_workers, base_url=args.base_url,
+        use_cache=not args.no_cache, force=args.force, batched=args.batched,
+        routing=model_routing.routing_policy(args.small_model) if args.route else None
+    )
+
+    summary = manifest["summary"]
+    print(f"{summary['done']}/{summary['total']} done, {summary['failed']} failed")
+    return 1 if summary["failed"] > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
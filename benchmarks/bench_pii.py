@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Micro-benchmark for PII masking.
+
+Compares the original str.replace chain (copied below as legacy_*) against pii_masking.PiiMasker,
+masking and unmasking every section of large documents. The sections mention the patient in
+every line. The legacy chain masks fewer values (no first or last name on its own), so it is
+also run over the same values as PiiMasker ("same values"): PiiMasker's extra cost over the
+legacy column is the scans for the name parts, its cost over the same-values column is the
+engine's own.
+
+Example:
+    python benchmarks/bench_pii.py --sizes 10 100 1000 --repeat 20
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pii_masking
+
+
+SECTIONS = 9
+
+
+def legacy_replacements(name_txt, occupation_txt, employer_txt, live_with_people_txt):
+    replacements = []
+    if len(occupation_txt) > 0 and pii_masking.contains_relationship_keyword(occupation_txt) == False:
+        replacements.append(("<occupation>", occupation_txt))
+    if len(employer_txt) > 0 and pii_masking.contains_relationship_keyword(employer_txt) == False:
+        replacements.append(("<employer>", employer_txt))
+    if len(live_with_people_txt) > 0 and pii_masking.contains_relationship_keyword(live_with_people_txt) == False:
+        replacements.append(("<live_with_people>", live_with_people_txt))
+    if len(name_txt) > 0:
+        replacements.append(("<name>", name_txt))
+    return replacements
+
+
+def legacy_round_trip(texts, replacements):
+    masked = []
+    for text in texts:
+        for placeholder, value in replacements:
+            text = text.replace(value, placeholder)
+        masked.append(text)
+    unmasked = []
+    for text in masked:
+        for placeholder, value in replacements:
+            text = text.replace(placeholder, value)
+        unmasked.append(text)
+    return unmasked
+
+
+def current_round_trip(texts, replacements):
+    # As util_v2.mask_document_pii and unmask_pii: only the values that were masked are unmasked
+    masked, used_replacements = pii_masking.PiiMasker(replacements).mask_texts(texts)
+    unmasker = pii_masking.PiiMasker(used_replacements)
+    return [unmasker.unmask(text) for text in masked]
+
+
+def make_sections(paragraphs):
+    """
+    Build section texts mentioning the patient's name, occupation and employer in many paragraphs.
+    """
+    filler = "Jane Doe ({0}) works as a carpenter at Acme Builders and reports pain of 4/10 in the morning.\n"
+    return ["".join(filler.format(i) for i in range(paragraphs)) for _ in range(SECTIONS)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PII masking.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Paragraphs per section")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per measurement")
+    args = parser.parse_args(argv)
+
+    legacy = legacy_replacements("Jane Doe", "carpenter", "Acme Builders", "alone")
+    current = pii_masking.patient_replacements("Jane Doe", "carpenter", "Acme Builders", "alone")
+
+    print(f"{'paragraphs':>10} {'chars':>10} {'legacy ms':>10} {'same ms':>10} {'current ms':>10} {'vs legacy':>10} {'vs same':>8}")
+    for size in args.sizes:
+        texts = make_sections(size)
+        assert legacy_round_trip(texts, legacy) == legacy_round_trip(texts, current) == current_round_trip(texts, current) == texts
+
+        legacy_seconds = min(timeit.repeat(lambda: legacy_round_trip(texts, legacy), number=1, repeat=args.repeat))
+        same_seconds = min(timeit.repeat(lambda: legacy_round_trip(texts, current), number=1, repeat=args.repeat))
+        current_seconds = min(timeit.repeat(lambda: current_round_trip(texts, current), number=1, repeat=args.repeat))
+        print(f"{size:>10} {sum(len(text) for text in texts):>10} {legacy_seconds * 1000:>10.3f} {same_seconds * 1000:>10.3f} {current_seconds * 1000:>10.3f}"
+              f" {legacy_seconds / current_seconds:>9.2f}x {same_seconds / current_seconds:>7.2f}x")
+
+if __name__ == '__main__':
+    main()
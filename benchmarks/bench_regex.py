@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Micro-benchmark for the util_v2 field extraction patterns.
+
+Compares the original per-call re.search/re.sub code (copied below as legacy_*) against the
+precompiled pattern registry and the single scan_intake_tags pass, on large extracted texts.
+
+Example:
+    python benchmarks/bench_regex.py --sizes 10 100 1000 --repeat 20
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import util_v2
+
+
+def legacy_extract_patient_info(pdf_text):
+    patterns = {
+        'name': r'\[-name-\]\s*(.*)',
+        'age': r'\[-age-\]\s*(.*)',
+        'gender': r'\[-gender-\]\s*(.*)',
+        'pronouns': r'\[-pronouns-\]\s*(.*)'
+    }
+    values = {}
+    for field, pattern in patterns.items():
+        match = re.search(pattern, pdf_text)
+        values[field] = match.group(1) if match else ""
+    return values['name'], values['age'], values['gender'], values['pronouns']
+
+
+def legacy_extract_text_between_markers(pdf_text, start_marker, end_marker):
+    start_marker_escaped = re.escape(start_marker)
+    end_marker_escaped = re.escape(end_marker)
+    if re.search(start_marker_escaped, pdf_text, re.DOTALL) is None:
+        start_marker_escaped = r'\[-pronouns-\].*?(?=\n|$)'
+    if re.search(end_marker_escaped, pdf_text, re.DOTALL) is None:
+        end_marker_escaped = re.escape('1.\nName')
+    match = re.search(rf'{start_marker_escaped}(.*?){end_marker_escaped}', pdf_text, re.DOTALL)
+    return match.group(1).strip() if match else ""
+
+
+def legacy_is_na_string(text):
+    return re.sub(r'[^a-zA-Z]', '', text).lower() in ["none", "no", "na", "n", ""]
+
+
+def legacy_pipeline(pdf_text):
+    info = legacy_extract_patient_info(pdf_text)
+    between = legacy_extract_text_between_markers(pdf_text, '[-enable start-]', '[-enable end-]')
+    return info, between, legacy_is_na_string(between[:200])
+
+
+def current_pipeline(pdf_text):
+    tags = util_v2.scan_intake_tags(pdf_text)
+    info = util_v2.extract_patient_info(pdf_text, tags)
+    between = util_v2.extract_enable_text(pdf_text, tags)
+    return info, between, util_v2.is_na_string(between[:200])
+
+
+def make_text(paragraphs):
+    """
+    Build an extracted-text-like document with the intake tags at the top and many paragraphs of answers.
+    """
+    filler = "31.{0} The patient reports n a for question {0}. Pain is 4/10 and worse in the morning.\n"
+    return (
+        "[-name-] First Last\n[-age-] 42\n[-gender-] female\n[-pronouns-] she her herself\n"
+        "[-enable start-]\n"
+        + "".join(filler.format(i) for i in range(paragraphs))
+        + "[-enable end-]\n1.\nName\n"
+        + "".join(filler.format(i) for i in range(paragraphs))
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark util_v2 field extraction.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Paragraphs per document")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per measurement")
+    args = parser.parse_args(argv)
+
+    print(f"{'paragraphs':>10} {'chars':>10} {'legacy ms':>10} {'current ms':>10} {'speedup':>8}")
+    for size in args.sizes:
+        text = make_text(size)
+        assert legacy_pipeline(text) == current_pipeline(text)
+
+        legacy_seconds = min(timeit.repeat(lambda: legacy_pipeline(text), number=1, repeat=args.repeat))
+        current_seconds = min(timeit.repeat(lambda: current_pipeline(text), number=1, repeat=args.repeat))
+        print(f"{size:>10} {len(text):>10} {legacy_seconds * 1000:>10.3f} {current_seconds * 1000:>10.3f} {legacy_seconds / current_seconds:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Shared fixtures of the pytest-benchmark suites, and a throughput table at the end of the run.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic_intake
+import util_v2
+
+
+# Page counts of the synthetic documents, e.g. REWORDIFY_BENCH_PAGES=1,10,500
+BENCH_PAGES = [int(pages) for pages in os.environ.get("REWORDIFY_BENCH_PAGES", "1,10,50,100,500").split(",")]
+
+_throughput_rows = []
+
+
+@pytest.fixture(scope="session")
+def intake_documents():
+    """
+    Synthetic intake document for a page count, built once per session: a dict with 'pages',
+    'pdf_bytes', 'pdf_txt' (extracted text), 'enable_txt' (text between the enable markers) and 'patient'.
+    """
+    documents = {}
+
+    def get(pages):
+        if pages not in documents:
+            pdf_bytes, patient = synthetic_intake.make_intake_pdf(pages, seed=pages)
+            pdf_txt = util_v2.pdf_file_extract_text(pdf_bytes, max_workers=1)
+            parsed = util_v2.parse_document(pdf_txt)
+            # The benchmarks only mean something if the document parses like a real one
+            assert parsed['name'] == patient['name'] and parsed['occupation'] == patient['occupation']
+            documents[pages] = {
+                'pages': pages,
+                'pdf_bytes': pdf_bytes,
+                'pdf_txt': pdf_txt,
+                'enable_txt': parsed['txt_between_markers'],
+                'patient': patient
+            }
+        return documents[pages]
+
+    return get
+
+
+@pytest.fixture
+def record_throughput():
+    """
+    Add a row (stage, pages, pages/s, docs/s, peak MiB) to the table printed at the end of the run.
+    """
+    return lambda *row: _throughput_rows.append(row)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if len(_throughput_rows) == 0:
+        return
+    terminalreporter.section("throughput")
+    terminalreporter.write_line(f"{'stage':<34} {'pages':>6} {'pages/s':>12} {'docs/s':>10} {'peak MiB':>9}")
+    for stage, pages, pages_per_second, docs_per_second, peak_mib in sorted(_throughput_rows):
+        terminalreporter.write_line(f"{stage:<34} {pages:>6} {pages_per_second:>12.1f} {docs_per_second:>10.2f} {peak_mib:>9.2f}")
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+pytest-benchmark suite for the extraction stages, on synthetic intake PDFs (see synthetic_intake)
+from 1 to 500 pages.
+
+Each stage is timed by pytest-benchmark. Its throughput (pages/s and docs/s, from the mean time)
+and peak memory (Python allocations during one run, measured with tracemalloc) are added to the
+benchmark's extra_info and printed in a table at the end.
+
+Example:
+    pip install pytest pytest-benchmark
+    python -m pytest benchmarks/ --benchmark-json=extraction.json
+    REWORDIFY_BENCH_PAGES=1,500 python -m pytest benchmarks/ -k parse_document
+
+Compare two saved runs with --benchmark-save / --benchmark-compare.
+"""
+import tracemalloc
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+import util_v2
+from conftest import BENCH_PAGES
+
+
+def extract_all_sections(enable_txt):
+    return [util_v2.extract_section_text(enable_txt, section_header) for section_header in util_v2.SECTION_HEADERS]
+
+
+# Stage name: function of a synthetic document (see conftest.intake_documents)
+STAGES = {
+    'pdf_file_extract_text': lambda document: util_v2.pdf_file_extract_text(document['pdf_bytes'], max_workers=1),
+    'pdf_file_extract_text (parallel)': lambda document: util_v2.pdf_file_extract_text(document['pdf_bytes']),
+    'extract_text_between_markers': lambda document: util_v2.extract_text_between_markers(document['pdf_txt'], '[-enable start-]', '[-enable end-]'),
+    'extract_section_text (all headers)': lambda document: extract_all_sections(document['enable_txt']),
+    'parse_document': lambda document: util_v2.parse_document(document['pdf_txt'])
+}
+
+
+def peak_memory_mib(function, document):
+    """
+    Peak Python memory allocated during one call, in MiB.
+    """
+    tracemalloc.start()
+    try:
+        function(document)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / (1024 * 1024)
+
+
+@pytest.mark.parametrize("pages", BENCH_PAGES)
+@pytest.mark.parametrize("stage", list(STAGES))
+def test_extraction_stage(benchmark, intake_documents, record_throughput, stage, pages):
+    document = intake_documents(pages)
+    function = STAGES[stage]
+
+    # Measured before timing, so tracemalloc does not slow down the timed runs
+    peak_mib = peak_memory_mib(function, document)
+
+    benchmark.group = stage
+    benchmark(function, document)
+
+    if benchmark.stats is None:  # --benchmark-disable
+        return
+    mean_seconds = benchmark.stats.stats.mean
+    benchmark.extra_info.update(
+        pages=pages,
+        pages_per_second=pages / mean_seconds,
+        docs_per_second=1 / mean_seconds,
+        peak_memory_mib=peak_mib
+    )
+    record_throughput(stage, pages, pages / mean_seconds, 1 / mean_seconds, peak_mib)
@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Offline bulk rewordify using the OpenAI Batch API.
+
+For overnight backlogs where latency does not matter but cost and rate limits do. Every
+reword_section_text call of every document becomes one line of a batch request JSONL file
+(custom_id "<document>/<section>"), which is submitted as a single batch job. Once the
+batch completes, the responses are reassembled into one output file per document, named
+like batch_rewordify's (see batch_rewordify.output_name).
+
+All state lives in a job folder, so each step can be run (or re-run) separately:
+
+    python bulk_jobs.py prepare intake_pdfs/ --job-dir bulk_job/
+    python bulk_jobs.py submit --job-dir bulk_job/
+    python bulk_jobs.py wait --job-dir bulk_job/
+    python bulk_jobs.py collect --job-dir bulk_job/
+
+or all at once with "run". --base-url points the job at a local stand-in server.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import batch_rewordify
+import response_cache
+import util_v2
+
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+def _job_file(job_dir, name):
+    return os.path.join(job_dir, name)
+
+
+def _read_json(path):
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def _write_json(data, path):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        json.dump(data, file, indent=2)
+    os.replace(tmp_path, path)
+
+
+def document_ids(pdf_paths):
+    """
+    Give each PDF a short unique id (its file name without extension) for use in custom ids.
+
+    Parameters:
+    - pdf_paths (list): PDF file paths
+
+    Returns:
+    - dict: PDF path keyed by document id
+    """
+    documents = {}
+    for pdf_path in pdf_paths:
+        stem = os.path.splitext(os.path.basename(pdf_path))[0].replace("/", "_")
+        doc_id = stem
+        suffix = 2
+        while doc_id in documents:
+            doc_id = f"{stem}_{suffix}"
+            suffix += 1
+        documents[doc_id] = pdf_path
+    return documents
+
+
+def batch_request_line(custom_id, model, temperature, chatgpt_prompt):
+    """
+    One line of the batch request file, using the same messages as call_chatgpt.
+
+    Parameters:
+    - custom_id (str): "<document>/<section>"
+    - model (str): ChatGPT model
+    - temperature (float): Sampling temperature
+    - chatgpt_prompt (str): Full prompt (see util_v2.build_section_prompt)
+
+    Returns:
+    - dict: Batch API request
+    """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_ENDPOINT,
+        "body": {
+            "model": model,
+            "messages": util_v2.build_chat_messages(chatgpt_prompt),
+            "temperature": temperature
+        }
+    }
+
+
+def prepare_job(pdf_paths, job_dir, model, prompts=None):
+    """
+    Extract and split every PDF, and write the batch request file and document state to job_dir.
+
+    Parameters:
+    - pdf_paths (list): PDF file paths
+    - job_dir (str): Job folder
+    - model (str): ChatGPT model
+    - prompts (dict): Prompt text keyed by section key. Defaults to the prompts/ files.
+
+    Returns:
+    - int: Number of requests written
+    """
+    os.makedirs(job_dir, exist_ok=True)
+    prompt_versions = None
+    if prompts is None:
+        prompts = util_v2.load_default_prompts()
+        prompt_versions = util_v2.default_prompt_versions()
+
+    documents = {}
+    request_count = 0
+    with open(_job_file(job_dir, "batch_input.jsonl"), "w") as requests_file:
+        for doc_id, pdf_path in document_ids(pdf_paths).items():
+            try:
+                pdf_txt = util_v2.pdf_file_extract_text(pdf_path)
+                document = util_v2.prepare_document(pdf_txt, prompts)
+            except Exception as e:
+                documents[doc_id] = {"pdf": pdf_path, "error": f"{type(e).__name__}: {e}"}
+                continue
+
+            for job in document['section_jobs']:
+                if util_v2.is_na_string(job['section_text']) == True:
+                    continue
+                # Sections too long for one request are sent as chunks "<document>/<section>/<chunk>"
+                chatgpt_prompts = util_v2.build_section_prompts(model, job['prompt'], job['section_text'])
+                job['chunks'] = len(chatgpt_prompts)
+                for i, chatgpt_prompt in enumerate(chatgpt_prompts):
+                    custom_id = f"{doc_id}/{job['key']}" if len(chatgpt_prompts) == 1 else f"{doc_id}/{job['key']}/{i}"
+                    line = batch_request_line(custom_id, model, job['temperature'], chatgpt_prompt)
+                    requests_file.write(json.dumps(line) + "\n")
+                    request_count += 1
+
+            documents[doc_id] = {
+                "pdf": pdf_path,
+                # Named when prepared, as collect may run from another folder
+                "output_name": batch_rewordify.output_name(pdf_path),
+                "section_jobs": document['section_jobs'],
+                "pii_replacements": document['pii_replacements']
+            }
+
+    _write_json({"model": model, "prompt_versions": prompt_versions, "documents": documents}, _job_file(job_dir, "documents.json"))
+    return request_count
+
+
+def submit_job(job_dir, api_key, base_url=None):
+    """
+    Upload the batch request file and create the batch.
+
+    Parameters:
+    - job_dir (str): Job folder prepared by prepare_job
+    - api_key
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+
+    Returns:
+    - string: Batch id
+    """
+    client = util_v2.get_openai_client(api_key, base_url)
+
+    with open(_job_file(job_dir, "batch_input.jsonl"), "rb") as requests_file:
+        input_file = client.files.create(file=requests_file, purpose="batch")
+
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW,
+        metadata={"description": "rewordify bulk job"}
+    )
+
+    _write_json({"batch_id": batch.id, "input_file_id": input_file.id, "status": batch.status}, _job_file(job_dir, "batch.json"))
+    return batch.id
+
+
+def wait_for_job(job_dir, api_key, base_url=None, poll_seconds=60, timeout_seconds=None):
+    """
+    Poll the batch until it reaches a final status.
+
+    Parameters:
+    - job_dir (str): Job folder with a submitted batch
+    - api_key
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - poll_seconds (float): Seconds between status checks
+    - timeout_seconds (float): Give up after this long. None waits indefinitely.
+
+    Returns:
+    - string: Final batch status (or the last status seen if timeout_seconds passed)
+    """
+    client = util_v2.get_openai_client(api_key, base_url)
+    batch_state = _read_json(_job_file(job_dir, "batch.json"))
+    start_time = time.time()
+
+    while True:
+        batch = client.batches.retrieve(batch_state["batch_id"])
+        batch_state.update(status=batch.status, output_file_id=batch.output_file_id, error_file_id=batch.error_file_id)
+        _write_json(batch_state, _job_file(job_dir, "batch.json"))
+
+        counts = batch.request_counts
+        if counts is not None:
+            print(f"{batch.status}: {counts.completed}/{counts.total} completed, {counts.failed} failed", flush=True)
+
+        if batch.status in BATCH_FINAL_STATUSES:
+            return batch.status
+        if timeout_seconds is not None and time.time() - start_time > timeout_seconds:
+            return batch.status
+        time.sleep(poll_seconds)
+
+
+def parse_batch_output(output_text):
+    """
+    Parse the batch output JSONL.
+
+    Parameters:
+    - output_text (str): Content of the batch output (or error) file
+
+    Returns:
+    - tuple: Response text keyed by custom_id, and error message keyed by custom_id
+    """
+    responses = {}
+    errors = {}
+    for line in output_text.splitlines():
+        if line.strip() == "":
+            continue
+        result = json.loads(line)
+        custom_id = result["custom_id"]
+        response = result.get("response") or {}
+        if result.get("error") is None and response.get("status_code") == 200:
+            responses[custom_id] = response["body"]["choices"][0]["message"]["content"]
+        else:
+            errors[custom_id] = json.dumps(result.get("error") or response.get("body"))
+    return responses, errors
+
+
+def _section_error(errors, section_id):
+    """
+    Error message for a failed section, whether it was sent whole or in chunks.
+    """
+    for custom_id, error in errors.items():
+        if custom_id == section_id or custom_id.startswith(section_id + "/"):
+            return error
+    return "no response"
+
+
+def collect_job(job_dir, output_dir, api_key, base_url=None, use_cache=True):
+    """
+    Download the batch results and write one output file per document plus manifest.json.
+    Successful temperature 0 responses are also stored in the response cache.
+
+    Parameters:
+    - job_dir (str): Job folder with a completed batch
+    - output_dir (str): Output folder
+    - api_key
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - use_cache (bool): Store responses in the response cache
+
+    Returns:
+    - dict: The manifest
+    """
+    client = util_v2.get_openai_client(api_key, base_url)
+    state = _read_json(_job_file(job_dir, "documents.json"))
+    batch_state = _read_json(_job_file(job_dir, "batch.json"))
+
+    responses = {}
+    errors = {}
+    for file_key in ("output_file_id", "error_file_id"):
+        if batch_state.get(file_key):
+            file_responses, file_errors = parse_batch_output(client.files.content(batch_state[file_key]).text)
+            responses.update(file_responses)
+            errors.update(file_errors)
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {"batch_id": batch_state["batch_id"], "prompt_versions": state.get("prompt_versions"), "documents": {}}
+
+    for doc_id, document in state["documents"].items():
+        entry = {"pdf": document["pdf"]}
+        if "error" in document:
+            entry.update(status="failed", error=document["error"])
+            manifest["documents"][doc_id] = entry
+            continue
+
+        reworded = {}
+        failed_sections = []
+        for job in document["section_jobs"]:
+            custom_ids = [f"{doc_id}/{job['key']}"]
+            if job.get('chunks', 1) > 1:
+                custom_ids = [f"{doc_id}/{job['key']}/{i}" for i in range(job['chunks'])]
+
+            if util_v2.is_na_string(job['section_text']) == True:
+                reworded[job['key']] = f"{job['section_header']}:\nN/A"
+            elif all(custom_id in responses for custom_id in custom_ids):
+                response = "\n".join(responses[custom_id] for custom_id in custom_ids)
+                reworded[job['key']] = f"{job['section_header']}:\n" + response
+                if use_cache and job['temperature'] == 0:
+                    response_cache.set_cached_response(
+                        response_cache.make_cache_key(state["model"], job['temperature'], job['prompt'], job['section_text'], base_url),
+                        response
+                    )
+            else:
+                failed_sections.append(job['key'])
+
+        if len(failed_sections) > 0:
+            entry.update(status="failed", failed_sections=failed_sections,
+                         error="; ".join(_section_error(errors, f"{doc_id}/{key}") for key in failed_sections))
+        else:
+            output_path = os.path.join(output_dir, document["output_name"])
+            combine_sections = util_v2.combine_reworded_sections(document, reworded)
+            with open(output_path, "w") as file:
+                file.write(combine_sections.replace('**', ''))
+            entry.update(status="done", output=output_path)
+
+        manifest["documents"][doc_id] = entry
+
+    statuses = [entry["status"] for entry in manifest["documents"].values()]
+    manifest["summary"] = {"total": len(statuses), "done": statuses.count("done"), "failed": statuses.count("failed")}
+    _write_json(manifest, os.path.join(output_dir, "manifest.json"))
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rewordify intake PDFs with the OpenAI Batch API.")
+    parser.add_argument("step", choices=("prepare", "submit", "wait", "collect", "run"))
+    parser.add_argument("inputs", nargs="*", help="PDF folders, files or glob patterns (prepare and run)")
+    parser.add_argument("--job-dir", default="bulk_job", help="Folder holding the job state")
+    parser.add_argument("--output-dir", default="rewordified", help="Folder for output files and manifest.json")
+    parser.add_argument("--model", default="gpt-3.5-turbo", help="ChatGPT model")
+    parser.add_argument("--poll-seconds", type=float, default=60, help="Seconds between batch status checks")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="Defaults to $OPENAI_API_KEY")
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"), help="Defaults to $OPENAI_BASE_URL")
+    args = parser.parse_args(argv)
+
+    if args.step in ("prepare", "run"):
+        pdf_paths = batch_rewordify.find_pdf_files(args.inputs)
+        if len(pdf_paths) == 0:
+            parser.error("no PDF files found")
+        request_count = prepare_job(pdf_paths, args.job_dir, args.model)
+        print(f"{request_count} requests for {len(pdf_paths)} documents written to {args.job_dir}")
+
+    if args.step != "prepare" and not args.api_key:
+        parser.error("an API key is required (--api-key or $OPENAI_API_KEY)")
+
+    if args.step in ("submit", "run"):
+        print(f"submitted batch {submit_job(args.job_dir, args.api_key, args.base_url)}")
+
+    if args.step in ("wait", "run"):
+        status = wait_for_job(args.job_dir, args.api_key, args.base_url, poll_seconds=args.poll_seconds)
+        if status != "completed":
+            print(f"batch {status}")
+            return 1
+
+    if args.step in ("collect", "run"):
+        summary = collect_job(args.job_dir, args.output_dir, args.api_key, args.base_url)["summary"]
+        print(f"{summary['done']}/{summary['total']} done, {summary['failed']} failed")
+        return 1 if summary["failed"] > 0 else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Local SQLite job queue for rewordify runs.
+
+A submission becomes a job with an id. A pool of worker processes picks jobs up, runs the
+extraction and reword stages and stores the result, so the caller (e.g. the Streamlit app)
+only polls for status and is not tied up for the whole run. Closing the browser tab does not
+stop a job.
+
+Workers can be started by the app (start_workers) or on their own:
+
+    OPENAI_API_KEY=... python job_queue.py --workers 4
+
+Each worker gets an equal share of the rate limits in rate_limit, so the worker count can be
+sized to the account's limits without the workers together going over them.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import closing
+
+import rate_limit
+import tracing
+import util_v2
+
+
+JOB_QUEUE_PATH = os.environ.get("REWORDIFY_JOB_QUEUE", ".cache/jobs.sqlite3")
+JOB_WORKERS = int(os.environ.get("REWORDIFY_JOB_WORKERS", 4))
+
+# Seconds an idle worker waits before checking for new jobs
+JOB_POLL_SECONDS = 1.0
+
+# A running job whose worker has not been heard from for this long is given to another worker
+JOB_STALE_SECONDS = 600
+
+# Seconds between heartbeats of a running job, well under JOB_STALE_SECONDS
+JOB_HEARTBEAT_SECONDS = 30
+
+# Finished jobs are deleted after this long
+JOB_RETENTION_SECONDS = 7 * 24 * 60 * 60  # 7 days
+
+JOB_FINAL_STATUSES = ("done", "failed")
+
+
+def _connect(path):
+    """
+    Open the queue database, creating the folder and table if needed.
+
+    Parameters:
+    - path (str): SQLite database file path
+
+    Returns:
+    - sqlite3.Connection: Open connection
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs ("
+        " job_id TEXT PRIMARY KEY,"
+        " status TEXT NOT NULL,"
+        " stage TEXT,"
+        " request TEXT NOT NULL,"
+        " pdf BLOB,"
+        " result TEXT,"
+        " error TEXT,"
+        " worker_pid INTEGER,"
+        " created_at REAL NOT NULL,"
+        " started_at REAL,"
+        " heartbeat_at REAL,"
+        " finished_at REAL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+    return conn
+
+
+def submit_job(pdf_bytes, prompts, model, raw_questionaire_txt='N/A', raw_icbc_txt='N/A', use_cache=True,
+               batched=False, routing=None, path=JOB_QUEUE_PATH):
+    """
+    Queue a rewordify run of one PDF.
+
+    Parameters:
+    - pdf_bytes (bytes): PDF content
+    - prompts (dict): Prompt text keyed by section key (see util_v2.SECTION_PROMPT_NAMES)
+    - model (str): ChatGPT model
+    - raw_questionaire_txt (str): Optional questionaire notes, 'N/A' to skip
+    - raw_icbc_txt (str): Optional ICBC/WBC notes, 'N/A' to skip
+    - use_cache (bool): Reuse cached responses for unchanged sections
+    - batched (bool): Reword all sections in one request
+    - routing (dict): Model routing policy (see model_routing.routing_policy), or None
+    - path (str): SQLite database file path
+
+    Returns:
+    - string: Job id
+    """
+    job_id = uuid.uuid4().hex
+    request = {
+        'prompts': prompts,
+        'model': model,
+        'raw_questionaire_txt': raw_questionaire_txt,
+        'raw_icbc_txt': raw_icbc_txt,
+        'use_cache': use_cache,
+        'batched': batched,
+        'routing': routing
+    }
+    now = time.time()
+    with closing(_connect(path)) as conn, conn:
+        conn.execute(
+            "INSERT INTO jobs (job_id, status, request, pdf, created_at) VALUES (?, 'queued', ?, ?, ?)",
+            (job_id, json.dumps(request), sqlite3.Binary(pdf_bytes), now)
+        )
+        conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (now - JOB_RETENTION_SECONDS,)
+        )
+    return job_id
+
+
+def get_job(job_id, path=JOB_QUEUE_PATH):
+    """
+    Status (and result, once done) of a job.
+
+    Parameters:
+    - job_id (str): Id from submit_job
+    - path (str): SQLite database file path
+
+    Returns:
+    - dict: 'job_id', 'status' (queued, running, done or failed), 'stage', 'result', 'error' and
+      the 'created_at', 'started_at' and 'finished_at' times, or None if there is no such job
+    """
+    with closing(_connect(path)) as conn:
+        row = conn.execute(
+            "SELECT job_id, status, stage, result, error, created_at, started_at, finished_at FROM jobs WHERE job_id = ?",
+            (job_id,)
+        ).fetchone()
+
+    if row is None:
+        return None
+    job = dict(zip(('job_id', 'status', 'stage', 'result', 'error', 'created_at', 'started_at', 'finished_at'), row))
+    job['result'] = json.loads(job['result']) if job['result'] is not None else None
+    return job
+
+
+def claim_next_job(path=JOB_QUEUE_PATH):
+    """
+    Take the oldest queued job (or a running job whose worker went quiet) and mark it as running.
+
+    Parameters:
+    - path (str): SQLite database file path
+
+    Returns:
+    - tuple: Job id, request dict and PDF bytes, or None if there is nothing to do
+    """
+    now = time.time()
+    with closing(_connect(path)) as conn:
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never claim the same job
+        conn.isolation_level = None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT job_id, request, pdf FROM jobs"
+                " WHERE status = 'queued' OR (status = 'running' AND heartbeat_at < ?)"
+                " ORDER BY created_at LIMIT 1",
+                (now - JOB_STALE_SECONDS,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', stage = 'queued', worker_pid = ?, started_at = ?, heartbeat_at = ? WHERE job_id = ?",
+                    (os.getpid(), now, now, row[0])
+                )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    if row is None:
+        return None
+    return row[0], json.loads(row[1]), bytes(row[2])
+
+
+def _set_stage(job_id, stage, path):
+    with closing(_connect(path)) as conn, conn:
+        conn.execute("UPDATE jobs SET stage = ?, heartbeat_at = ? WHERE job_id = ?", (stage, time.time(), job_id))
+
+
+def _send_heartbeats(job_id, stop, path):
+    """
+    Refresh a running job's heartbeat every JOB_HEARTBEAT_SECONDS until stop is set, so a long
+    stage is not mistaken for a dead worker and the job is not given to a second worker.
+    """
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        try:
+            with closing(_connect(path)) as conn, conn:
+                conn.execute("UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND status = 'running'", (time.time(), job_id))
+        except sqlite3.Error:
+            # e.g. the database is locked for longer than the timeout; the next beat tries again
+            pass
+
+
+def _finish_job(job_id, status, result, error, path):
+    with closing(_connect(path)) as conn, conn:
+        # The PDF is not needed any more once the job has finished
+        conn.execute(
+            "UPDATE jobs SET status = ?, stage = NULL, result = ?, error = ?, pdf = NULL, finished_at = ? WHERE job_id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+        )
+
+
+def run_job(job_id, request, pdf_bytes, api_key, base_url=None, path=JOB_QUEUE_PATH):
+    """
+    Run the extraction and reword stages of one claimed job and store the result.
+
+    Parameters:
+    - job_id (str): Job id
+    - request (dict): Job request (see submit_job)
+    - pdf_bytes (bytes): PDF content
+    - api_key
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - path (str): SQLite database file path
+    """
+    stop_heartbeats = threading.Event()
+    heartbeats = threading.Thread(target=_send_heartbeats, args=(job_id, stop_heartbeats, path), daemon=True)
+    heartbeats.start()
+    try:
+        with tracing.start_trace() as trace:
+            _set_stage(job_id, 'extracting', path)
+            # Each worker is one process, documents are spread over workers rather than pages over processes
+            pdf_txt = util_v2.pdf_file_extract_text(pdf_bytes, max_workers=1)
+
+            _set_stage(job_id, 'rewording', path)
+            document, combine_sections = util_v2.rewordify_document(
+                pdf_txt, request['prompts'], api_key, request['model'],
+                request['raw_questionaire_txt'], request['raw_icbc_txt'],
+                base_url=base_url, use_cache=request['use_cache'], batched=request['batched'], routing=request.get('routing')
+            )
+    except Exception as e:
+        _finish_job(job_id, 'failed', None, f"{type(e).__name__}: {e}", path)
+        return
+    finally:
+        stop_heartbeats.set()
+        heartbeats.join()
+
+    result = {
+        'original_txt': document['original_txt'],
+        'rewordified_txt': combine_sections,
+        'txt_between_markers': document['txt_between_markers'],
+        'section_jobs': document['section_jobs'],
+        'timings': trace.rows(),
+        'trace_json': trace.to_json(),
+        'trace_otel_json': trace.to_otel_json()
+    }
+    _finish_job(job_id, 'done', result, None, path)
+
+
+def worker_loop(api_key, base_url=None, workers=1, path=JOB_QUEUE_PATH):
+    """
+    Run jobs one after another until the process is stopped.
+
+    Parameters:
+    - api_key
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - workers (int): Number of worker processes sharing the rate limits, this one included
+    - path (str): SQLite database file path
+    """
+    rate_limit.use_share_of_limits(workers)
+
+    while True:
+        claimed = claim_next_job(path)
+        if claimed is None:
+            time.sleep(JOB_POLL_SECONDS)
+            continue
+        job_id, request, pdf_bytes = claimed
+        run_job(job_id, request, pdf_bytes, api_key, base_url, path)
+
+
+def start_workers(api_key, base_url=None, workers=JOB_WORKERS, path=JOB_QUEUE_PATH):
+    """
+    Start worker processes in the background. They keep running jobs until this process exits.
+
+    Parameters:
+    - api_key
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - workers (int): Number of worker processes
+    - path (str): SQLite database file path
+
+    Returns:
+    - list: The started processes
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for _ in range(max(1, workers)):
+        process = context.Process(target=worker_loop, args=(api_key, base_url, workers, path), daemon=True)
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run rewordify job queue workers.")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS, help="Worker processes")
+    parser.add_argument("--queue", default=JOB_QUEUE_PATH, help="Job queue database")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"), help="Defaults to $OPENAI_API_KEY")
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"), help="Defaults to $OPENAI_BASE_URL")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("an API key is required (--api-key or $OPENAI_API_KEY)")
+
+    processes = start_workers(args.api_key, args.base_url, args.workers, args.queue)
+    print(f"{len(processes)} workers running jobs from {args.queue}", flush=True)
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
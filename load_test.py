@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Load test of the end-to-end rewordify pipeline with simultaneous virtual users.
+
+Each virtual user is a thread in this process, as each Streamlit session is a thread of the one
+Streamlit server process. A user repeatedly does what a Rewordify click does: pdf_file_extract_text
+on a synthetic intake PDF (see synthetic_intake), prepare_document, the reword_section_text calls
+in the selected reword mode, and combine_reworded_sections. The run is repeated for each user count.
+
+The backend is the bundled mock server (started in its own process, so its CPU and memory are not
+counted), or any OpenAI-compatible base URL:
+
+    python load_test.py --users 1 4 16 32 --latency lognormal:0.8,0.5 --tokens-per-second 60
+    OPENAI_API_KEY=... python load_test.py --users 1 4 --base-url https://api.openai.com/v1 --requests-per-user 1
+
+Per user count it reports p50/p95/p99 document latency, throughput, errors, CPU use and peak RSS.
+Results are saved as JSON (--output), and --compare prints the change from an earlier result file.
+"""
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+import model_routing
+import rate_limit
+import synthetic_intake
+import util_v2
+
+
+RESULTS_DIRECTORY = "load_results"
+
+# Seconds between CPU and memory samples while a user count runs
+SAMPLE_SECONDS = 0.2
+
+# Seconds to wait for the mock server to start
+MOCK_START_SECONDS = 10
+
+REWORD_MODES = ("parallel", "sequential", "stream", "batched")
+
+
+def percentile(values, percent):
+    """
+    Nearest-rank percentile.
+
+    Parameters:
+    - values (list): Measurements
+    - percent (float): Percentile, 0 to 100
+
+    Returns:
+    - float: The percentile, or None if there are no values
+    """
+    if len(values) == 0:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def current_rss_bytes():
+    """
+    Resident memory of this process, or its peak so far where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class ResourceSampler:
+    """
+    Samples the process RSS in the background and measures CPU time over a run.
+    """
+
+    def __init__(self, interval=SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak_rss = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, current_rss_bytes())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, current_rss_bytes())
+        self.wall_seconds = time.perf_counter() - self._start_wall
+        self.cpu_seconds = time.process_time() - self._start_cpu
+
+
+def start_mock_server(latency, tokens_per_second, rate_limit_error_rate, server_error_rate, seed):
+    """
+    Start mock_openai.py in its own process on a free port.
+
+    Returns:
+    - tuple: The process, and the base URL to use
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_openai.py"),
+        "--port", str(port), "--latency", latency, "--tokens-per-second", str(tokens_per_second),
+        "--rate-limit-error-rate", str(rate_limit_error_rate), "--server-error-rate", str(server_error_rate),
+        "--seed", str(seed)
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}/v1"
+
+    deadline = time.monotonic() + MOCK_START_SECONDS
+    while True:
+        try:
+            urllib.request.urlopen(base_url + "/models", timeout=1).close()
+            return process, base_url
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("mock server did not start")
+            time.sleep(0.1)
+
+
+def rewordify_once(pdf_bytes, prompts, api_key, base_url, model, reword_mode, use_cache, routing):
+    """
+    One Rewordify click: extract, prepare, reword every section and combine.
+
+    Returns:
+    - string: The combined rewordified text
+    """
+    pdf_txt = util_v2.pdf_file_extract_text(pdf_bytes)
+    document = util_v2.prepare_document(pdf_txt, prompts)
+    section_jobs = model_routing.route_section_jobs(document['section_jobs'], model, routing)
+
+    if reword_mode == "stream":
+        # As the Streamlit "Streaming" mode: every section at once, read token by token
+        outputs = [""] * len(section_jobs)
+        for i, token in util_v2.reword_sections_stream(api_key, model, section_jobs, max_workers=len(section_jobs), base_url=base_url, use_cache=use_cache):
+            outputs[i] += token
+    elif reword_mode == "batched":
+        outputs = util_v2.reword_sections_batched(api_key, model, section_jobs, base_url=base_url, use_cache=use_cache)
+    else:
+        max_workers = 1 if reword_mode == "sequential" else len(section_jobs)
+        outputs = util_v2.reword_sections_parallel(api_key, model, section_jobs, max_workers=max_workers, base_url=base_url, use_cache=use_cache)
+
+    return util_v2.combine_reworded_sections(document, dict(zip([job['key'] for job in section_jobs], outputs)))
+
+
+def run_user_count(users, documents, requests_per_user, think_seconds, **pipeline_options):
+    """
+    Run the virtual users at once, each sending requests_per_user documents one after another.
+
+    Parameters:
+    - users (int): Number of simultaneous virtual users
+    - documents (list): PDF contents, given to the users in turn
+    - requests_per_user (int): Documents each user rewordifies
+    - think_seconds (float): Pause of a user between documents
+    - pipeline_options: Arguments of rewordify_once after pdf_bytes
+
+    Returns:
+    - dict: Result row for this user count
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(users)
+
+    def virtual_user(user):
+        start_barrier.wait()
+        for request in range(requests_per_user):
+            pdf_bytes = documents[(user * requests_per_user + request) % len(documents)]
+            start = time.perf_counter()
+            try:
+                rewordify_once(pdf_bytes, **pipeline_options)
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                with lock:
+                    errors.append(f"{type(e).__name__}: {e}")
+            if think_seconds > 0 and request + 1 < requests_per_user:
+                time.sleep(think_seconds)
+
+    threads = [threading.Thread(target=virtual_user, args=(user,), daemon=True) for user in range(users)]
+    with ResourceSampler() as sampler:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    return {
+        'users': users,
+        'documents': len(latencies),
+        'errors': len(errors),
+        'first_error': errors[0] if errors else None,
+        'p50_seconds': percentile(latencies, 50),
+        'p95_seconds': percentile(latencies, 95),
+        'p99_seconds': percentile(latencies, 99),
+        'max_seconds': max(latencies) if latencies else None,
+        'wall_seconds': sampler.wall_seconds,
+        'docs_per_second': len(latencies) / sampler.wall_seconds,
+        'cpu_seconds': sampler.cpu_seconds,
+        'cpu_percent': 100 * sampler.cpu_seconds / sampler.wall_seconds,
+        'peak_rss_mib': sampler.peak_rss / (1024 * 1024)
+    }
+
+
+def _format(value, digits=2):
+    return "-" if value is None else f"{value:.{digits}f}"
+
+
+def print_rows(rows, header=True):
+    if header:
+        print(f"{'users':>5} {'docs':>5} {'errors':>6} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'docs/s':>7} {'cpu %':>6} {'rss MiB':>8}")
+    for row in rows:
+        print(f"{row['users']:>5} {row['documents']:>5} {row['errors']:>6} {_format(row['p50_seconds']):>7} {_format(row['p95_seconds']):>7} "
+              f"{_format(row['p99_seconds']):>7} {_format(row['docs_per_second']):>7} {_format(row['cpu_percent'], 0):>6} {_format(row['peak_rss_mib'], 1):>8}")
+
+
+def print_comparison(rows, previous_rows):
+    """
+    Change of p95 latency, throughput and peak RSS from an earlier run, for the user counts in both.
+    """
+    previous_by_users = {row['users']: row for row in previous_rows}
+
+    def change(new, old):
+        if new is None or old is None or old == 0:
+            return "-"
+        return f"{100 * (new - old) / old:+.0f}%"
+
+    print(f"{'users':>5} {'p95':>8} {'docs/s':>8} {'rss':>8}")
+    for row in rows:
+        old = previous_by_users.get(row['users'])
+        if old is not None:
+            print(f"{row['users']:>5} {change(row['p95_seconds'], old['p95_seconds']):>8} "
+                  f"{change(row['docs_per_second'], old['docs_per_second']):>8} {change(row['peak_rss_mib'], old['peak_rss_mib']):>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the rewordify pipeline with simultaneous virtual users.")
+    parser.add_argument("--users", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="User counts to run, one after another")
+    parser.add_argument("--requests-per-user", type=int, default=3, help="Documents each user rewordifies per user count")
+    parser.add_argument("--think-seconds", type=float, default=0, help="Pause of a user between documents")
+    parser.add_argument("--pages", type=int, default=4, help="Pages of each synthetic intake PDF")
+    parser.add_argument("--model", default="gpt-3.5-turbo", help="ChatGPT model")
+    parser.add_argument("--mode", choices=REWORD_MODES, default="parallel", help="Reword mode, as in the app")
+    parser.add_argument("--route", action="store_true", help="Route short and list-style sections to the small model")
+    parser.add_argument("--use-cache", action="store_true", help="Reuse cached responses (off, so every run calls the backend)")
+    parser.add_argument("--base-url", default=None, help="OpenAI-compatible API to load. Without it the mock server is started.")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY", "mock"), help="Defaults to $OPENAI_API_KEY")
+    mock_group = parser.add_argument_group("mock server")
+    mock_group.add_argument("--latency", default="lognormal:0.8,0.5", help="Time to first token (see mock_openai.parse_latency)")
+    mock_group.add_argument("--tokens-per-second", type=float, default=60, help="Completion token rate")
+    mock_group.add_argument("--rate-limit-error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    mock_group.add_argument("--server-error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    mock_group.add_argument("--seed", type=int, default=0, help="Random seed of the mock server and documents")
+    parser.add_argument("--output", default=None, help=f"Results JSON file. Defaults to {RESULTS_DIRECTORY}/<time>.json")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON file to compare with")
+    args = parser.parse_args(argv)
+
+    previous = None
+    if args.compare is not None:
+        with open(args.compare, "r") as file:
+            previous = json.load(file)
+
+    mock_process = None
+    base_url = args.base_url
+    if base_url is None:
+        mock_process, base_url = start_mock_server(args.latency, args.tokens_per_second, args.rate_limit_error_rate, args.server_error_rate, args.seed)
+
+    settings = {
+        'backend': 'mock' if mock_process is not None else base_url,
+        'model': args.model,
+        'mode': args.mode,
+        'route': args.route,
+        'use_cache': args.use_cache,
+        'pages': args.pages,
+        'requests_per_user': args.requests_per_user,
+        'think_seconds': args.think_seconds,
+        'rate_limits': {
+            'requests_per_minute': rate_limit.REQUESTS_PER_MINUTE,
+            'tokens_per_minute': rate_limit.TOKENS_PER_MINUTE,
+            'max_concurrent_requests': rate_limit.MAX_CONCURRENT_REQUESTS
+        }
+    }
+    if mock_process is not None:
+        settings['mock'] = {
+            'latency': args.latency,
+            'tokens_per_second': args.tokens_per_second,
+            'rate_limit_error_rate': args.rate_limit_error_rate,
+            'server_error_rate': args.server_error_rate,
+            'seed': args.seed
+        }
+
+    # [Run]
+    rows = []
+    try:
+        documents = [synthetic_intake.make_intake_pdf(args.pages, seed=args.seed + i)[0] for i in range(max(args.users))]
+        prompts = util_v2.load_default_prompts()
+        routing = model_routing.routing_policy() if args.route else None
+
+        print(f"Backend {base_url}, {args.mode} mode, {args.requests_per_user} documents of {args.pages} pages per user", flush=True)
+        for users in args.users:
+            row = run_user_count(
+                users, documents, args.requests_per_user, args.think_seconds,
+                prompts=prompts, api_key=args.api_key, base_url=base_url, model=args.model,
+                reword_mode=args.mode, use_cache=args.use_cache, routing=routing
+            )
+            rows.append(row)
+            # A line per user count as soon as it finishes
+            print_rows([row], header=len(rows) == 1)
+    finally:
+        if mock_process is not None:
+            mock_process.terminate()
+            mock_process.wait()
+
+    # [Save]
+    output_path = args.output or os.path.join(RESULTS_DIRECTORY, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    if os.path.dirname(output_path):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    with open(output_path, "w") as file:
+        json.dump({'created_at': datetime.now().isoformat(timespec='seconds'), 'settings': settings, 'rows': rows}, file, indent=2)
+    print(f"Results written to {output_path}")
+
+    if previous is not None:
+        print(f"\nChange from {args.compare}:")
+        print_comparison(rows, previous['rows'])
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
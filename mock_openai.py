@@ -0,0 +1,471 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Local stand-in for the OpenAI API, for load tests and CI runs without a key or network.
+
+    python mock_openai.py --port 8089 --latency lognormal:0.8,0.5 --tokens-per-second 60 --rate-limit-error-rate 0.05
+
+then point the app at it with its base URL setting (base_url in the Streamlit secrets,
+OPENAI_BASE_URL or --base-url elsewhere) set to http://127.0.0.1:8089/v1. Any API key is accepted.
+
+Completions are deterministic: each section is answered with its own GIVEN INFORMATION text (so
+PII placeholders come back and are unmasked as usual), and batched JSON requests with an object
+holding every requested section. Latency, token rate and 429/500 errors are configurable.
+
+Endpoints:
+- POST /v1/chat/completions       plain, JSON mode, and streamed (SSE, with a usage chunk when asked)
+- POST /v1/files, GET /v1/files/<id>, GET /v1/files/<id>/content
+- POST /v1/batches, GET /v1/batches/<id>   (for bulk_jobs)
+- GET  /v1/models
+- GET  /mock/stats                 request and injected error counts
+"""
+import argparse
+import email.parser
+import email.policy
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+MOCK_HOST = os.environ.get("REWORDIFY_MOCK_HOST", "127.0.0.1")
+MOCK_PORT = int(os.environ.get("REWORDIFY_MOCK_PORT", 8089))
+
+# Same estimate as token_budget uses without tiktoken
+CHARACTERS_PER_TOKEN = 4
+
+# Pieces a streamed completion is sent in, about one token each
+STREAM_TOKEN_PATTERN = re.compile(r'\S+\s*|\s+')
+
+GIVEN_INFORMATION_MARKER = "GIVEN INFORMATION:\n\n"
+BATCHED_SECTION_PATTERN = re.compile(r'^### SECTION (\S+)\n', re.MULTILINE)
+
+MOCK_MODELS = ["gpt-3.5-turbo", "gpt-4o", "gpt-4o-mini"]
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution, in seconds:
+    "fixed:0.5", "uniform:0.2,1.0", "normal:0.5,0.1" (mean, sd), "lognormal:0.5,0.4" (median, sigma)
+    or "exponential:0.5" (mean). A bare number is a fixed latency.
+
+    Parameters:
+    - spec (str): Distribution
+
+    Returns:
+    - function: Draws a latency from a random.Random, never below 0
+    """
+    kind, _, arguments = spec.partition(':')
+    if arguments == '':
+        kind, arguments = 'fixed', kind
+    try:
+        values = [float(value) for value in arguments.split(',')]
+    except ValueError:
+        raise ValueError(f"invalid latency {spec!r}")
+
+    samplers = {
+        ('fixed', 1): lambda rng: values[0],
+        ('uniform', 2): lambda rng: rng.uniform(values[0], values[1]),
+        ('normal', 2): lambda rng: rng.gauss(values[0], values[1]),
+        ('lognormal', 2): lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) if values[0] > 0 else 0.0,
+        ('exponential', 1): lambda rng: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    }
+    sampler = samplers.get((kind, len(values)))
+    if sampler is None:
+        raise ValueError(f"invalid latency {spec!r}")
+    return lambda rng: max(0.0, sampler(rng))
+
+
+def server_settings(latency="fixed:0", tokens_per_second=0, rate_limit_error_rate=0.0, server_error_rate=0.0,
+                    retry_after_seconds=1.0, seed=0):
+    """
+    Behaviour of the mock server, for start_server.
+
+    Parameters:
+    - latency (str): Time to first token (see parse_latency)
+    - tokens_per_second (float): Completion token rate after the first token, 0 for no delay
+    - rate_limit_error_rate (float): Share of requests answered with 429
+    - server_error_rate (float): Share of requests answered with 500
+    - retry_after_seconds (float): Retry-After sent with 429s
+    - seed (int): Random seed, for repeatable latencies and errors
+
+    Returns:
+    - dict: The settings
+    """
+    parse_latency(latency)
+    return {
+        'latency': latency,
+        'tokens_per_second': tokens_per_second,
+        'rate_limit_error_rate': rate_limit_error_rate,
+        'server_error_rate': server_error_rate,
+        'retry_after_seconds': retry_after_seconds,
+        'seed': seed
+    }
+
+
+def count_tokens(text):
+    return len(text) // CHARACTERS_PER_TOKEN + 1
+
+
+def completion_text(messages, response_format=None):
+    """
+    Deterministic completion for a chat request.
+
+    Parameters:
+    - messages (list): Chat messages
+    - response_format (dict): Response format of the request
+
+    Returns:
+    - string: The GIVEN INFORMATION text of the last user message (the whole message if it has none),
+      or for JSON requests an object with the GIVEN INFORMATION of each "### SECTION <key>"
+    """
+    prompt = next((message.get('content') or '' for message in reversed(messages) if message.get('role') == 'user'), '')
+    if not isinstance(prompt, str):
+        prompt = ''.join(part.get('text', '') for part in prompt if isinstance(part, dict))
+
+    if response_format is not None and response_format.get('type') == 'json_object':
+        sections = {}
+        section_matches = list(BATCHED_SECTION_PATTERN.finditer(prompt))
+        for i, match in enumerate(section_matches):
+            end = section_matches[i + 1].start() if i + 1 < len(section_matches) else len(prompt)
+            section_prompt = prompt[match.end():end]
+            sections[match.group(1)] = section_prompt.rpartition(GIVEN_INFORMATION_MARKER)[2].strip()
+        return json.dumps(sections)
+
+    return prompt.rpartition(GIVEN_INFORMATION_MARKER)[2].strip()
+
+
+def chat_completion(request):
+    """
+    Chat completion response body for a request body, with usage.
+    """
+    messages = request.get('messages', [])
+    content = completion_text(messages, request.get('response_format'))
+    prompt_tokens = sum(count_tokens(message.get('content') or '') for message in messages if isinstance(message.get('content'), str))
+    completion_tokens = count_tokens(content)
+    return {
+        'id': f"chatcmpl-{uuid.uuid4().hex}",
+        'object': 'chat.completion',
+        'created': int(time.time()),
+        'model': request.get('model', MOCK_MODELS[0]),
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop', 'logprobs': None}],
+        'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens, 'total_tokens': prompt_tokens + completion_tokens}
+    }
+
+
+def _error_body(message, error_type, code=None):
+    return {'error': {'message': message, 'type': error_type, 'param': None, 'code': code}}
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server holding the settings, random state, uploaded files, batches and counters.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, settings):
+        super().__init__(address, MockOpenAIHandler)
+        self.settings = settings
+        self.sample_latency = parse_latency(settings['latency'])
+        self.rng = random.Random(settings['seed'])
+        self.lock = threading.Lock()
+        self.files = {}
+        self.batches = {}
+        self.stats = {'requests': 0, 'completions': 0, 'streams': 0, 'rate_limit_errors': 0, 'server_errors': 0, 'completion_tokens': 0}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, **counts):
+        with self.lock:
+            for name, value in counts.items():
+                self.stats[name] += value
+
+    def draw(self):
+        """
+        Outcome of one request: (status code or None for success, time to first token).
+        """
+        with self.lock:
+            roll = self.rng.random()
+            latency = self.sample_latency(self.rng)
+        if roll < self.settings['rate_limit_error_rate']:
+            return 429, latency
+        if roll < self.settings['rate_limit_error_rate'] + self.settings['server_error_rate']:
+            return 500, latency
+        return None, latency
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    # [Responses]
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_bytes(self, data, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error_status(self, status):
+        if status == 429:
+            self.server.count(rate_limit_errors=1)
+            self._send_json(429, _error_body("Rate limit reached (injected by mock server)", 'requests', 'rate_limit_exceeded'),
+                            {'Retry-After': str(self.server.settings['retry_after_seconds'])})
+        else:
+            self.server.count(server_errors=1)
+            self._send_json(500, _error_body("The server had an error (injected by mock server)", 'server_error'))
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length > 0 else b''
+
+    # [Routing]
+
+    def do_GET(self):
+        self.server.count(requests=1)
+        path = self.path.split('?')[0].rstrip('/')
+        parts = path.split('/')
+
+        if path == '/mock/stats':
+            with self.server.lock:
+                stats = dict(self.server.stats)
+            self._send_json(200, {**stats, 'settings': self.server.settings})
+        elif path == '/v1/models':
+            self._send_json(200, {'object': 'list', 'data': [{'id': model, 'object': 'model', 'created': 0, 'owned_by': 'mock'} for model in MOCK_MODELS]})
+        elif len(parts) == 4 and parts[1:3] == ['v1', 'files'] and parts[3] in self.server.files:
+            self._send_json(200, self.server.files[parts[3]]['object'])
+        elif len(parts) == 5 and parts[1:3] == ['v1', 'files'] and parts[4] == 'content' and parts[3] in self.server.files:
+            self._send_bytes(self.server.files[parts[3]]['content'], 'application/octet-stream')
+        elif len(parts) == 4 and parts[1:3] == ['v1', 'batches'] and parts[3] in self.server.batches:
+            with self.server.lock:
+                batch = json.loads(json.dumps(self.server.batches[parts[3]]))
+            self._send_json(200, batch)
+        else:
+            self._send_json(404, _error_body(f"Unknown path {path}", 'invalid_request_error'))
+
+    def do_POST(self):
+        self.server.count(requests=1)
+        path = self.path.split('?')[0].rstrip('/')
+        body = self._read_body()
+
+        try:
+            if path == '/v1/chat/completions':
+                self._chat_completions(json.loads(body or b'{}'))
+            elif path == '/v1/files':
+                self._upload_file(body)
+            elif path == '/v1/batches':
+                self._create_batch(json.loads(body or b'{}'))
+            else:
+                self._send_json(404, _error_body(f"Unknown path {path}", 'invalid_request_error'))
+        except ValueError as e:
+            self._send_json(400, _error_body(f"Invalid request body: {e}", 'invalid_request_error'))
+
+    # [Chat completions]
+
+    def _chat_completions(self, request):
+        status, latency = self.server.draw()
+        time.sleep(latency)
+        if status is not None:
+            self._send_error_status(status)
+            return
+
+        response = chat_completion(request)
+        tokens_per_second = self.server.settings['tokens_per_second']
+        self.server.count(completions=1, completion_tokens=response['usage']['completion_tokens'])
+
+        if not request.get('stream'):
+            if tokens_per_second > 0:
+                time.sleep(response['usage']['completion_tokens'] / tokens_per_second)
+            self._send_json(200, response)
+            return
+
+        # Server-sent events, without a Content-Length, so the connection ends with the stream
+        self.server.count(streams=1)
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        content = response['choices'][0]['message']['content']
+        pieces = STREAM_TOKEN_PATTERN.findall(content)
+        # Spread the completion's token count over its pieces
+        piece_seconds = response['usage']['completion_tokens'] / tokens_per_second / max(1, len(pieces)) if tokens_per_second > 0 else 0
+
+        def chunk(delta, finish_reason=None, choices=True, usage=None):
+            event = {'id': response['id'], 'object': 'chat.completion.chunk', 'created': response['created'], 'model': response['model'],
+                     'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason, 'logprobs': None}] if choices else []}
+            if usage is not None:
+                event['usage'] = usage
+            self.wfile.write(b"data: " + json.dumps(event).encode('utf-8') + b"\n\n")
+            self.wfile.flush()
+
+        try:
+            chunk({'role': 'assistant', 'content': ''})
+            for piece in pieces:
+                if piece_seconds > 0:
+                    time.sleep(piece_seconds)
+                chunk({'content': piece})
+            chunk({}, finish_reason='stop')
+            if (request.get('stream_options') or {}).get('include_usage'):
+                chunk({}, choices=False, usage=response['usage'])
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client stopped reading
+
+    # [Files and batches]
+
+    def _upload_file(self, body):
+        # Multipart form: 'purpose' and 'file'
+        message = email.parser.BytesParser(policy=email.policy.default).parsebytes(
+            b"Content-Type: " + self.headers.get('Content-Type', '').encode('latin-1') + b"\r\n\r\n" + body
+        )
+        fields = {}
+        for part in message.iter_parts():
+            fields[part.get_param('name', header='content-disposition')] = (part.get_filename(), part.get_payload(decode=True))
+        if 'file' not in fields:
+            self._send_json(400, _error_body("Missing file", 'invalid_request_error'))
+            return
+
+        filename, content = fields['file']
+        purpose = fields.get('purpose', (None, b'batch'))[1].decode('utf-8')
+        file_object = self._store_file(content, filename or 'upload.jsonl', purpose)
+        self._send_json(200, file_object)
+
+    def _store_file(self, content, filename, purpose):
+        file_id = f"file-{uuid.uuid4().hex}"
+        file_object = {'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': int(time.time()),
+                       'filename': filename, 'purpose': purpose, 'status': 'processed'}
+        with self.server.lock:
+            self.server.files[file_id] = {'object': file_object, 'content': content}
+        return file_object
+
+    def _create_batch(self, request):
+        input_file = self.server.files.get(request.get('input_file_id'))
+        if input_file is None:
+            self._send_json(404, _error_body("No such input file", 'invalid_request_error'))
+            return
+
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        now = int(time.time())
+        lines = [json.loads(line) for line in input_file['content'].decode('utf-8').splitlines() if line.strip() != '']
+        batch = {
+            'id': batch_id, 'object': 'batch', 'endpoint': request.get('endpoint', '/v1/chat/completions'), 'errors': None,
+            'input_file_id': request['input_file_id'], 'completion_window': request.get('completion_window', '24h'),
+            'status': 'in_progress', 'output_file_id': None, 'error_file_id': None, 'created_at': now, 'in_progress_at': now,
+            'expires_at': now + 24 * 60 * 60, 'completed_at': None, 'failed_at': None, 'expired_at': None,
+            'request_counts': {'total': len(lines), 'completed': 0, 'failed': 0}, 'metadata': request.get('metadata')
+        }
+        with self.server.lock:
+            self.server.batches[batch_id] = batch
+        threading.Thread(target=self._run_batch, args=(batch_id, lines), daemon=True).start()
+        self._send_json(200, batch)
+
+    def _run_batch(self, batch_id, lines):
+        """
+        Answer every request line of a batch (each with its own latency and error draw, one after
+        another), then store the output and error files.
+        """
+        outputs = []
+        errors = []
+        for line in lines:
+            status, latency = self.server.draw()
+            time.sleep(latency)
+            if status is None:
+                response = {'status_code': 200, 'request_id': uuid.uuid4().hex, 'body': chat_completion(line.get('body', {}))}
+                self.server.count(completions=1, completion_tokens=response['body']['usage']['completion_tokens'])
+                outputs.append({'id': f"batch_req_{uuid.uuid4().hex}", 'custom_id': line.get('custom_id'), 'response': response, 'error': None})
+            else:
+                self.server.count(**{'rate_limit_errors' if status == 429 else 'server_errors': 1})
+                body = _error_body("Injected by mock server", 'rate_limit_exceeded' if status == 429 else 'server_error')
+                response = {'status_code': status, 'request_id': uuid.uuid4().hex, 'body': body}
+                errors.append({'id': f"batch_req_{uuid.uuid4().hex}", 'custom_id': line.get('custom_id'), 'response': response, 'error': None})
+            with self.server.lock:
+                counts = self.server.batches[batch_id]['request_counts']
+                counts['completed' if status is None else 'failed'] += 1
+
+        def jsonl(results):
+            return "".join(json.dumps(result) + "\n" for result in results).encode('utf-8')
+
+        output_file = self._store_file(jsonl(outputs), f"{batch_id}_output.jsonl", 'batch_output') if outputs else None
+        error_file = self._store_file(jsonl(errors), f"{batch_id}_error.jsonl", 'batch_output') if errors else None
+        with self.server.lock:
+            self.server.batches[batch_id].update(
+                status='completed', completed_at=int(time.time()),
+                output_file_id=output_file['id'] if output_file else None,
+                error_file_id=error_file['id'] if error_file else None
+            )
+
+
+def start_server(host=MOCK_HOST, port=MOCK_PORT, settings=None):
+    """
+    Start the mock server on a background thread.
+
+    Parameters:
+    - host (str): Interface to listen on
+    - port (int): Port, 0 for any free port
+    - settings (dict): Result of server_settings, or None for the defaults
+
+    Returns:
+    - MockOpenAIServer: The running server. Its base_url is the API base URL to use, and
+      shutdown() stops it.
+    """
+    server = MockOpenAIServer((host, port), settings or server_settings())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a local mock of the OpenAI API.")
+    parser.add_argument("--host", default=MOCK_HOST, help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=MOCK_PORT, help="Port")
+    parser.add_argument("--latency", default="fixed:0", help="Time to first token, e.g. fixed:0.5, uniform:0.2,1, normal:0.5,0.1, lognormal:0.5,0.4, exponential:0.5")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="Completion token rate, 0 for no delay")
+    parser.add_argument("--rate-limit-error-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args(argv)
+
+    try:
+        settings = server_settings(args.latency, args.tokens_per_second, args.rate_limit_error_rate, args.server_error_rate, args.retry_after, args.seed)
+    except ValueError as e:
+        parser.error(str(e))
+
+    server = MockOpenAIServer((args.host, args.port), settings)
+    print(f"Mock OpenAI API at {server.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# coding: utf-8
+import os
+import re
+
+import token_budget
+
+
+# Faster, cheaper model for short and list-style sections
+SMALL_MODEL = os.environ.get("REWORDIFY_SMALL_MODEL", "gpt-4o-mini")
+
+# Sections up to this many tokens go to the small model, whatever their kind
+SHORT_SECTION_TOKENS = int(os.environ.get("REWORDIFY_SHORT_SECTION_TOKENS", 150))
+
+# List-style sections up to this many tokens go to the small model
+LIST_SECTION_TOKENS = int(os.environ.get("REWORDIFY_LIST_SECTION_TOKENS", 600))
+
+# Narrative sections always go to the selected model
+NARRATIVE_SECTION_KEYS = ('questionaire', 'summary')
+
+# Sections that are usually bullet lists in the intake form
+LIST_SECTION_KEYS = ('surgical_history', 'current_meds', 'allergies', 'fam_history')
+
+# Share of non-empty lines that must be bullets for any other section to count as a list
+LIST_LINE_RATIO = 0.6
+
+LIST_LINE_PATTERN = re.compile(r'^\s*(?:[•\-\*+]|\d+[.)])\s')
+
+
+def routing_policy(small_model=SMALL_MODEL, short_section_tokens=SHORT_SECTION_TOKENS, list_section_tokens=LIST_SECTION_TOKENS):
+    """
+    Routing policy settings, for route_section_jobs.
+
+    Parameters:
+    - small_model (str): Model for short and list-style sections
+    - short_section_tokens (int): Sections up to this many tokens go to the small model
+    - list_section_tokens (int): List-style sections up to this many tokens go to the small model
+
+    Returns:
+    - dict: The policy
+    """
+    return {
+        'small_model': small_model,
+        'short_section_tokens': short_section_tokens,
+        'list_section_tokens': list_section_tokens
+    }
+
+
+def is_list_style(section_text):
+    """
+    Check if a section is mostly bullet points or numbered items.
+
+    Parameters:
+    - section_text (str): Section text
+
+    Returns:
+    - bool: True if at least LIST_LINE_RATIO of its non-empty lines are list items
+    """
+    lines = [line for line in section_text.split('\n') if line.strip() != '']
+    if len(lines) == 0:
+        return False
+    list_lines = sum(1 for line in lines if LIST_LINE_PATTERN.match(line))
+    return list_lines / len(lines) >= LIST_LINE_RATIO
+
+
+def route_section(job, model, policy):
+    """
+    Choose the model for one section job.
+
+    Parameters:
+    - job (dict): Section job (see util_v2.prepare_document)
+    - model (str): Model selected by the user, used for long narrative sections
+    - policy (dict): Result of routing_policy
+
+    Returns:
+    - tuple: The model, the reason it was chosen, and the section's token count
+    """
+    # A section missing from the document has no text to count; it is shown as N/A and never sent
+    if job['section_text'] is None:
+        return model, "no text", 0
+
+    section_tokens = token_budget.count_tokens(job['section_text'], model)
+
+    if job['key'] in NARRATIVE_SECTION_KEYS:
+        return model, "narrative section", section_tokens
+    if section_tokens <= policy['short_section_tokens']:
+        return policy['small_model'], "short section", section_tokens
+    if (job['key'] in LIST_SECTION_KEYS or is_list_style(job['section_text'])) and section_tokens <= policy['list_section_tokens']:
+        return policy['small_model'], "list section", section_tokens
+    return model, "long section", section_tokens
+
+
+def route_section_jobs(section_jobs, model, policy=None):
+    """
+    Add the routed 'model' to every section job, with a 'route' dict ('model', 'reason',
+    'section_tokens') for display. Without a policy every section uses the selected model.
+
+    Parameters:
+    - section_jobs (list): Section jobs (see util_v2.prepare_document)
+    - model (str): Model selected by the user
+    - policy (dict): Result of routing_policy, or None to turn routing off
+
+    Returns:
+    - list: New section jobs, in the same order
+    """
+    routed_jobs = []
+    for job in section_jobs:
+        if policy is None:
+            routed_model, reason, section_tokens = model, "selected model", None
+        else:
+            routed_model, reason, section_tokens = route_section(job, model, policy)
+        routed_jobs.append({
+            **job,
+            'model': routed_model,
+            'route': {'model': routed_model, 'reason': reason, 'section_tokens': section_tokens}
+        })
+    return routed_jobs
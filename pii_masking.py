@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# coding: utf-8
+import re
+from functools import lru_cache
+
+
+# Words that show a value describes people by their relationship to the patient ("wife and son")
+# rather than naming them. Such values carry no PII and are sent as they are.
+RELATIONSHIP_KEYWORDS = ["common law", "self employ", "wife", "husband", "partner",
+                         "son", "daughter", "child", "baby", "girl", "boy"]
+
+# Shortest value (or name part) that is masked
+MIN_MASKED_LENGTH = 2
+
+
+def compile_patterns(patterns, whole_words=None, ignore_case=False):
+    """
+    Compile literal strings into one regular expression that finds any of them in a single pass
+    over a text, in the C regex engine. Longer patterns come first in the alternation, so among
+    occurrences starting at the same place the longest one matches. The whole alternation is one
+    capturing group, so pattern.split(text) alternates between text and matches (see replace_all).
+
+    Parameters:
+    - patterns (list): Strings to look for
+    - whole_words (list): Optional flag per pattern: only match occurrences that are not part of a
+      longer word
+    - ignore_case (bool): Match regardless of case
+
+    Returns:
+    - re.Pattern: The compiled expression, or None if there are no patterns
+    """
+    if len(patterns) == 0:
+        return None
+    if whole_words is None:
+        whole_words = [False] * len(patterns)
+
+    alternatives = []
+    for pattern, whole_word in sorted(zip(patterns, whole_words), key=lambda item: -len(item[0])):
+        if whole_word:
+            # The "no word character before" check comes after the first character, so every
+            # alternative starts with a literal and the engine can skip straight to the characters
+            # a match can start with. Before the first character it makes the engine try every position.
+            first = re.escape(pattern[0])
+            alternative = rf'{first}(?<!\w{first}){re.escape(pattern[1:])}(?!\w)'
+        else:
+            alternative = re.escape(pattern)
+        alternatives.append(alternative)
+    return re.compile('(' + '|'.join(alternatives) + ')', re.IGNORECASE if ignore_case else 0)
+
+
+def replace_all(pattern, replacements, text):
+    """
+    Replace every match of a compile_patterns expression in one pass.
+
+    Parameters:
+    - pattern (re.Pattern): Result of compile_patterns
+    - replacements (dict): Replacement keyed by matched text
+    - text (str): Text to replace in
+
+    Returns:
+    - string: The text with every match replaced
+    """
+    # Faster than pattern.sub with a function, which calls back into Python for every match
+    parts = pattern.split(text)
+    parts[1::2] = [replacements[match] for match in parts[1::2]]
+    return ''.join(parts)
+
+
+RELATIONSHIP_PATTERN = compile_patterns(RELATIONSHIP_KEYWORDS, ignore_case=True)
+
+
+def contains_relationship_keyword(text):
+    """
+    Check if a value describes people by relationship (see RELATIONSHIP_KEYWORDS), in one pass.
+
+    Parameters:
+    - text (str): Value to check
+
+    Returns:
+    - bool: True if any keyword is found, case-insensitively
+    """
+    return RELATIONSHIP_PATTERN.search(text) is not None
+
+
+def _unique_placeholder(name, used, texts):
+    """
+    Placeholder "<name>", numbered if it is already used or already appears in one of the texts.
+    """
+    placeholder = f"<{name}>"
+    number = 2
+    while placeholder in used or any(text is not None and placeholder in text for text in texts):
+        placeholder = f"<{name}_{number}>"
+        number += 1
+    used.add(placeholder)
+    return placeholder
+
+
+def patient_replacements(name_txt, occupation_txt, employer_txt, live_with_people_txt, texts=()):
+    """
+    Placeholders for the patient specific values of one document: the full name and each part of it,
+    the occupation, the employer and the people the patient lives with. Values that describe
+    people by relationship are left out.
+
+    Parameters:
+    - name_txt (str): Patient name
+    - occupation_txt (str): Occupation from 35.1
+    - employer_txt (str): Employer from 35.2
+    - live_with_people_txt (str): People the patient lives with from 31.1
+    - texts (list): Texts that will be masked (None for a missing section). Placeholders already
+      appearing in them are not used.
+
+    Returns:
+    - list: (placeholder, value) pairs, for PiiMasker or unmask
+    """
+    used = set()
+    replacements = []
+
+    for name, value in (("occupation", occupation_txt), ("employer", employer_txt), ("live_with_people", live_with_people_txt)):
+        if len(value) >= MIN_MASKED_LENGTH and contains_relationship_keyword(value) == False:
+            replacements.append((_unique_placeholder(name, used, texts), value))
+
+    if len(name_txt) >= MIN_MASKED_LENGTH:
+        replacements.append((_unique_placeholder("name", used, texts), name_txt))
+
+        # First and last name on their own, e.g. "Jane" in "Jane was seen..."
+        name_parts = [part for part in name_txt.split() if len(part) >= MIN_MASKED_LENGTH]
+        if len(name_parts) > 1:
+            part_names = ["first_name"] + ["middle_name"] * (len(name_parts) - 2) + ["last_name"]
+            for part_name, part in zip(part_names, name_parts):
+                if part not in (value for placeholder, value in replacements):
+                    replacements.append((_unique_placeholder(part_name, used, texts), part))
+
+    return replacements
+
+
+def _is_name_part(placeholder):
+    return placeholder.startswith(("<first_name", "<middle_name", "<last_name"))
+
+
+@lru_cache(maxsize=256)
+def _whole_word_pattern(value):
+    """
+    Expression matching value only where it is not part of a longer word, built like the whole-word
+    alternatives of compile_patterns.
+    """
+    first = re.escape(value[0])
+    return re.compile(rf'{first}(?<!\w{first}){re.escape(value[1:])}(?!\w)')
+
+
+class PiiMasker:
+    """
+    Masks a document's patient specific values in any text, and puts them back.
+
+    Values are replaced one after another with str.replace, longest first, which is the fastest
+    way to mask the handful of values of one document. Name parts go through a whole-word
+    expression instead, only when they still appear in the text. When a value could match text
+    put in by another replacement (a value inside a placeholder, like occupation "name" in
+    "<name>", or a value with angle brackets), all values are replaced in a single pass
+    (compile_patterns) instead, so no replacement is ever matched again.
+    """
+
+    def __init__(self, replacements):
+        """
+        Parameters:
+        - replacements (list): (placeholder, value) pairs, e.g. from patient_replacements
+        """
+        self.replacements = [tuple(replacement) for replacement in replacements]
+        self._placeholders = dict((value, placeholder) for placeholder, value in reversed(self.replacements))
+        self._values = dict(self.replacements)
+
+        # [Replacement chains] longest first, so a value inside a longer one ("Jane" in "Jane Doe") comes after it
+        self._mask_steps = [
+            (value, placeholder, _is_name_part(placeholder))
+            for value, placeholder in sorted(self._placeholders.items(), key=lambda item: -len(item[0]))
+        ]
+        self._unmask_steps = sorted(self._values.items(), key=lambda item: -len(item[0]))
+
+        # [Single pass] only when a chained replacement could match text put in by an earlier one
+        all_placeholders = '\0'.join(self._values)
+        self._single_pass = any('<' in value or '>' in value or value in all_placeholders for value in self._placeholders)
+        self._mask_pattern = None
+        self._unmask_pattern = None
+        if self._single_pass:
+            # Name parts only match whole words, so "Jane" is not masked inside "Janet"
+            self._mask_pattern = compile_patterns(
+                [value for placeholder, value in self.replacements],
+                [_is_name_part(placeholder) for placeholder, value in self.replacements]
+            )
+            self._unmask_pattern = compile_patterns([placeholder for placeholder, value in self.replacements])
+
+    def mask(self, text):
+        """
+        Parameters:
+        - text (str): Text to send to ChatGPT, or None for a missing section
+
+        Returns:
+        - string: The text with every value replaced by its placeholder (None stays None)
+        """
+        return self._mask(text, set())
+
+    def mask_texts(self, texts):
+        """
+        Mask several texts, e.g. every section of a document.
+
+        Parameters:
+        - texts (list): Texts to send to ChatGPT (None for a missing section)
+
+        Returns:
+        - tuple: The masked texts, and the (placeholder, value) pairs that were actually masked in
+          any of them, so unmasking does not look for placeholders that cannot appear
+        """
+        used = set()
+        masked_texts = [self._mask(text, used) for text in texts]
+        return masked_texts, [replacement for replacement in self.replacements if replacement[0] in used]
+
+    def _mask(self, text, used):
+        """
+        mask, adding the placeholder of every value found to used.
+        """
+        if text is None or len(self.replacements) == 0:
+            return text
+        if self._single_pass:
+            parts = self._mask_pattern.split(text)
+            parts[1::2] = [self._placeholders[match] for match in parts[1::2]]
+            used.update(parts[1::2])
+            return ''.join(parts)
+
+        for value, placeholder, whole_word in self._mask_steps:
+            if not whole_word:
+                masked = text.replace(value, placeholder)
+            elif value in text:
+                masked = _whole_word_pattern(value).sub(lambda match: placeholder, text)
+            else:
+                continue
+            if masked != text:
+                used.add(placeholder)
+                text = masked
+        return text
+
+    def unmask(self, text):
+        """
+        Parameters:
+        - text (str): Reworded text containing placeholders
+
+        Returns:
+        - string: Text with the original values restored
+        """
+        if text is None or len(self.replacements) == 0:
+            return text
+        if self._single_pass:
+            return replace_all(self._unmask_pattern, self._values, text)
+
+        for placeholder, value in self._unmask_steps:
+            text = text.replace(placeholder, value)
+        return text
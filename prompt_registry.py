@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# coding: utf-8
+import glob
+import hashlib
+import os
+import threading
+import time
+
+
+# Folder holding the default prompts (prompts/default_<name>.txt), next to this file
+PROMPTS_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+# How often (seconds) a prompt file's mtime is checked for changes
+PROMPT_CHECK_INTERVAL_SECONDS = 1.0
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def text_hash(text):
+    """
+    SHA-256 of a prompt's text, for keying caches and audit logs by the exact prompt used.
+
+    Parameters:
+    - text (str): Prompt text
+
+    Returns:
+    - string: SHA-256 hex digest
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PromptRegistry:
+    """
+    Keeps every prompts/default_<name>.txt file in memory. A file is read again only when its
+    mtime changes, and each reload bumps that prompt's version.
+    """
+
+    def __init__(self, directory=PROMPTS_DIRECTORY, check_interval=PROMPT_CHECK_INTERVAL_SECONDS):
+        self.directory = directory
+        self.check_interval = check_interval
+        self._prompts = {}
+        self._lock = threading.Lock()
+        for path in sorted(glob.glob(os.path.join(directory, "default_*.txt"))):
+            name = os.path.basename(path)[len("default_"):-len(".txt")]
+            self._load(name)
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"default_{name}.txt")
+
+    def _load(self, name):
+        """
+        Read one prompt file into memory. Must be called with the lock held (or from __init__).
+        """
+        path = self._path(name)
+        mtime_ns = os.stat(path).st_mtime_ns
+        with open(path, "r") as file:
+            text = file.read()
+
+        previous = self._prompts.get(name)
+        version = 1 if previous is None else previous['version'] + (previous['sha256'] != text_hash(text))
+        self._prompts[name] = {
+            'text': text,
+            'sha256': text_hash(text),
+            'version': version,
+            'mtime_ns': mtime_ns,
+            'checked_at': time.monotonic()
+        }
+        return self._prompts[name]
+
+    def _entry(self, name):
+        """
+        Return a prompt's entry, reloading the file if its mtime changed since the last check.
+        """
+        with self._lock:
+            entry = self._prompts.get(name)
+            if entry is None:
+                return self._load(name)
+
+            now = time.monotonic()
+            if now - entry['checked_at'] >= self.check_interval:
+                entry['checked_at'] = now
+                if os.stat(self._path(name)).st_mtime_ns != entry['mtime_ns']:
+                    entry = self._load(name)
+            return entry
+
+    def get_text(self, name):
+        """
+        Parameters:
+        - name (str): Prompt name, e.g. "summary_prompt" for prompts/default_summary_prompt.txt
+
+        Returns:
+        - string: The prompt text
+        """
+        return self._entry(name)['text']
+
+    def get_version(self, name):
+        """
+        Parameters:
+        - name (str): Prompt name
+
+        Returns:
+        - string: Version label "v<n>-<first 12 characters of the SHA-256>"
+        """
+        entry = self._entry(name)
+        return f"v{entry['version']}-{entry['sha256'][:12]}"
+
+    def versions(self):
+        """
+        Returns:
+        - dict: For every loaded prompt, its 'version' label and full 'sha256'
+        """
+        with self._lock:
+            names = list(self._prompts)
+        return {name: {'version': self.get_version(name), 'sha256': self._entry(name)['sha256']} for name in names}
+
+
+def get_registry():
+    """
+    Return the prompt registry shared by the whole process, loading the prompts folder on first use.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry()
+    return _registry
@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# coding: utf-8
+import asyncio
+import inspect
+import os
+import random
+import threading
+import time
+
+
+# Process-wide limits for ChatGPT calls. Every Streamlit session, batch worker and API request in
+# the process shares one scheduler, so these should match the account's rate limits.
+REQUESTS_PER_MINUTE = int(os.environ.get("REWORDIFY_REQUESTS_PER_MINUTE", 500))
+TOKENS_PER_MINUTE = int(os.environ.get("REWORDIFY_TOKENS_PER_MINUTE", 200000))
+MAX_CONCURRENT_REQUESTS = int(os.environ.get("REWORDIFY_MAX_CONCURRENT_REQUESTS", 16))
+
+# Retries on 429/5xx/connection errors, with jittered exponential backoff
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 30.0
+
+# Total time allowed for one call, including waiting for capacity and retries
+REQUEST_DEADLINE_SECONDS = 120.0
+
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+# How often async callers check for a free request slot
+ASYNC_SLOT_POLL_SECONDS = 0.01
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a call cannot finish (or get capacity to start) before its deadline.
+    """
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket holding up to capacity tokens, refilled continuously at refill_per_second.
+    """
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def acquire(self, amount, deadline=None):
+        """
+        Take amount tokens, waiting for the bucket to refill if needed.
+
+        Parameters:
+        - amount (float): Tokens to take. Amounts above capacity wait for a full bucket.
+        - deadline (float): time.monotonic() value to give up at. None waits indefinitely.
+        """
+        while True:
+            wait_seconds = self._try_take(amount, deadline)
+            if wait_seconds == 0:
+                return
+            time.sleep(min(wait_seconds, 1.0))
+
+    async def acquire_async(self, amount, deadline=None):
+        """
+        Same as acquire, but waits with asyncio.sleep so the event loop keeps running.
+        """
+        while True:
+            wait_seconds = self._try_take(amount, deadline)
+            if wait_seconds == 0:
+                return
+            await asyncio.sleep(min(wait_seconds, 1.0))
+
+    def _try_take(self, amount, deadline):
+        """
+        Take amount tokens if the bucket has them.
+
+        Returns:
+        - float: 0 if the tokens were taken, otherwise the seconds until they will be available
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0
+            wait_seconds = (amount - self.tokens) / self.refill_per_second
+
+        if deadline is not None and now + wait_seconds > deadline:
+            raise DeadlineExceeded(f"rate limit capacity not available before the deadline (waiting {wait_seconds:.1f}s)")
+        return wait_seconds
+
+    def adjust(self, amount):
+        """
+        Take (or give back, if negative) tokens without waiting, e.g. to correct an estimate
+        once the real usage is known. The bucket may go negative.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+def is_retryable(error):
+    """
+    Check if an API error is worth retrying: rate limits, server errors, timeouts and connection errors.
+
+    Parameters:
+    - error (Exception): Exception raised by the OpenAI client
+
+    Returns:
+    - bool: True if the call should be retried
+    """
+    from openai import APIConnectionError
+
+    if isinstance(error, APIConnectionError):  # includes timeouts
+        return True
+    return getattr(error, 'status_code', None) in RETRYABLE_STATUS_CODES
+
+
+def retry_after_seconds(error):
+    """
+    Seconds the server asked us to wait (Retry-After header), or None.
+    """
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_seconds(attempt, retry_after=None):
+    """
+    Full-jitter exponential backoff, never shorter than the server's Retry-After.
+
+    Parameters:
+    - attempt (int): Number of failed attempts so far (0 for the first retry)
+    - retry_after (float): Retry-After from the server, if any
+
+    Returns:
+    - float: Seconds to wait before retrying
+    """
+    delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class RequestScheduler:
+    """
+    Schedules ChatGPT calls under requests-per-minute and tokens-per-minute limits and a cap on
+    concurrent calls, retrying rate limit and server errors with jittered exponential backoff.
+    """
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 max_concurrent_requests=MAX_CONCURRENT_REQUESTS, max_retries=MAX_RETRIES):
+        self.request_bucket = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.token_bucket = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+        self.concurrency = threading.BoundedSemaphore(max_concurrent_requests)
+        self.max_retries = max_retries
+
+    def run(self, send, estimated_tokens, deadline_seconds=REQUEST_DEADLINE_SECONDS, keep_slot=False):
+        """
+        Run one API call under the limits.
+
+        Parameters:
+        - send (function): Makes the call. Receives the seconds left before the deadline, to use as the request timeout.
+        - estimated_tokens (int): Tokens the call is expected to use (prompt plus response)
+        - deadline_seconds (float): Total time allowed, including waiting and retries
+        - keep_slot (bool): Keep the concurrent request slot after a successful call, for the caller
+          to release (see run_stream)
+
+        Returns:
+        - The result of send
+        """
+        deadline = time.monotonic() + deadline_seconds
+        attempt = 0
+
+        while True:
+            self.request_bucket.acquire(1, deadline)
+            self.token_bucket.acquire(estimated_tokens, deadline)
+
+            if not self.concurrency.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                raise DeadlineExceeded("no free request slot before the deadline")
+            release_slot = True
+            try:
+                result = send(max(0.1, deadline - time.monotonic()))
+                release_slot = not keep_slot
+                return result
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = backoff_seconds(attempt, retry_after_seconds(e))
+                if time.monotonic() + delay > deadline:
+                    raise
+            finally:
+                if release_slot:
+                    self.concurrency.release()
+
+            time.sleep(delay)
+            attempt += 1
+
+    def run_stream(self, send, estimated_tokens, deadline_seconds=REQUEST_DEADLINE_SECONDS):
+        """
+        Run one streaming API call under the limits, yielding the items of the stream. Opening the
+        stream is retried as in run. The request slot is held until the stream has been read to
+        the end, or the generator is closed, so streams in flight count against the concurrency cap.
+
+        Parameters:
+        - send (function): Opens the stream. Receives the seconds left before the deadline, to use as the request timeout.
+        - estimated_tokens (int): Tokens the call is expected to use (prompt plus response)
+        - deadline_seconds (float): Total time allowed for opening the stream, including waiting and retries
+
+        Yields:
+        - The items of the stream returned by send
+        """
+        stream = self.run(send, estimated_tokens, deadline_seconds, keep_slot=True)
+        try:
+            yield from stream
+        finally:
+            try:
+                if hasattr(stream, 'close'):
+                    stream.close()
+            finally:
+                self.concurrency.release()
+
+    async def run_async(self, send, estimated_tokens, deadline_seconds=REQUEST_DEADLINE_SECONDS, keep_slot=False):
+        """
+        Async version of run, sharing the same limits, so async and threaded callers in one
+        process stay within the account's rate limits together.
+
+        Parameters:
+        - send (coroutine function): Makes the call. Receives the seconds left before the deadline, to use as the request timeout.
+        - estimated_tokens (int): Tokens the call is expected to use (prompt plus response)
+        - deadline_seconds (float): Total time allowed, including waiting and retries
+        - keep_slot (bool): Keep the concurrent request slot after a successful call, for the caller
+          to release (see run_stream_async)
+
+        Returns:
+        - The result of send
+        """
+        deadline = time.monotonic() + deadline_seconds
+        attempt = 0
+
+        while True:
+            await self.request_bucket.acquire_async(1, deadline)
+            await self.token_bucket.acquire_async(estimated_tokens, deadline)
+
+            # The slot semaphore is shared with threads, so it is polled instead of awaited
+            while not self.concurrency.acquire(blocking=False):
+                if time.monotonic() >= deadline:
+                    raise DeadlineExceeded("no free request slot before the deadline")
+                await asyncio.sleep(ASYNC_SLOT_POLL_SECONDS)
+            release_slot = True
+            try:
+                result = await send(max(0.1, deadline - time.monotonic()))
+                release_slot = not keep_slot
+                return result
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    raise
+                delay = backoff_seconds(attempt, retry_after_seconds(e))
+                if time.monotonic() + delay > deadline:
+                    raise
+            finally:
+                if release_slot:
+                    self.concurrency.release()
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def run_stream_async(self, send, estimated_tokens, deadline_seconds=REQUEST_DEADLINE_SECONDS):
+        """
+        Async version of run_stream. The request slot is held until the stream has been read to
+        the end, or the generator is closed.
+
+        Parameters:
+        - send (coroutine function): Opens the stream. Receives the seconds left before the deadline, to use as the request timeout.
+        - estimated_tokens (int): Tokens the call is expected to use (prompt plus response)
+        - deadline_seconds (float): Total time allowed for opening the stream, including waiting and retries
+
+        Yields:
+        - The items of the stream returned by send
+        """
+        stream = await self.run_async(send, estimated_tokens, deadline_seconds, keep_slot=True)
+        try:
+            async for item in stream:
+                yield item
+        finally:
+            try:
+                if hasattr(stream, 'close'):
+                    closed = stream.close()
+                    if inspect.isawaitable(closed):
+                        await closed
+            finally:
+                self.concurrency.release()
+
+
+def get_scheduler():
+    """
+    Return the scheduler shared by the whole process, creating it on first use.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+    return _scheduler
+
+
+def use_share_of_limits(processes):
+    """
+    Replace this process's scheduler with one limited to an equal share of the account's limits,
+    for when several worker processes call ChatGPT at the same time.
+
+    Parameters:
+    - processes (int): Number of processes sharing the limits
+    """
+    global _scheduler
+    processes = max(1, processes)
+    with _scheduler_lock:
+        _scheduler = RequestScheduler(
+            requests_per_minute=max(1, REQUESTS_PER_MINUTE // processes),
+            tokens_per_minute=max(1, TOKENS_PER_MINUTE // processes),
+            max_concurrent_requests=max(1, MAX_CONCURRENT_REQUESTS // processes)
+        )
+
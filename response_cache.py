@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# coding: utf-8
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+
+# Local SQLite cache of ChatGPT responses, keyed by a hash of (model, temperature, prompt, section text, API base URL, mode)
+RESPONSE_CACHE_PATH = os.environ.get("REWORDIFY_RESPONSE_CACHE", ".cache/responses.sqlite3")
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+RESPONSE_CACHE_TTL_SECONDS = 30 * 24 * 60 * 60  # 30 days
+
+
+def _connect(path):
+    """
+    Open the cache database, creating the folder and table if needed.
+
+    Parameters:
+    - path (str): SQLite database file path
+
+    Returns:
+    - sqlite3.Connection: Open connection
+    """
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS responses ("
+        " cache_key TEXT PRIMARY KEY,"
+        " response TEXT NOT NULL,"
+        " created_at REAL NOT NULL,"
+        " last_used_at REAL NOT NULL)"
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used_at)")
+    return conn
+
+
+def make_cache_key(model, temperature, prompt, section_text, base_url=None, mode="section"):
+    """
+    Build a content-addressed cache key.
+
+    Parameters:
+    - model (str): ChatGPT model
+    - temperature (float): Sampling temperature
+    - prompt (str): The ChatGPT prompt
+    - section_text (str): Section Text to be reworded
+    - base_url (str): API base URL the response came from. None is the OpenAI default. Answers of
+      another server (e.g. the mock server) are never returned for OpenAI requests.
+    - mode (str): How the section was sent: "section" on its own, or "batched" with other sections
+
+    Returns:
+    - string: SHA-256 hex digest of the inputs
+    """
+    payload = json.dumps([model, float(temperature), prompt, section_text, base_url or "", mode], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def get_cached_response(cache_key, path=RESPONSE_CACHE_PATH, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS):
+    """
+    Look up a cached response and mark it as recently used.
+
+    Parameters:
+    - cache_key (str): Key from make_cache_key
+    - path (str): SQLite database file path
+    - ttl_seconds (int): Entries older than this are treated as missing
+
+    Returns:
+    - string: The cached response, or None if there is no fresh entry
+    """
+    now = time.time()
+    with closing(_connect(path)) as conn, conn:
+        row = conn.execute(
+            "SELECT response, created_at FROM responses WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+
+        if row is None:
+            return None
+
+        response, created_at = row
+        if now - created_at > ttl_seconds:
+            conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+            return None
+
+        conn.execute("UPDATE responses SET last_used_at = ? WHERE cache_key = ?", (now, cache_key))
+        return response
+
+
+def set_cached_response(cache_key, response, path=RESPONSE_CACHE_PATH, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                        ttl_seconds=RESPONSE_CACHE_TTL_SECONDS):
+    """
+    Store a response, then evict expired entries and the least recently used entries over max_entries.
+
+    Parameters:
+    - cache_key (str): Key from make_cache_key
+    - response (str): ChatGPT response to store
+    - path (str): SQLite database file path
+    - max_entries (int): Maximum number of entries kept
+    - ttl_seconds (int): Entries older than this are evicted
+    """
+    now = time.time()
+    with closing(_connect(path)) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (cache_key, response, created_at, last_used_at) VALUES (?, ?, ?, ?)",
+            (cache_key, response, now, now)
+        )
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (now - ttl_seconds,))
+        conn.execute(
+            "DELETE FROM responses WHERE cache_key IN ("
+            " SELECT cache_key FROM responses ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)",
+            (max_entries,)
+        )
+
+
+def clear_cache(path=RESPONSE_CACHE_PATH):
+    """
+    Remove every cached response.
+
+    Parameters:
+    - path (str): SQLite database file path
+    """
+    with closing(_connect(path)) as conn, conn:
+        conn.execute("DELETE FROM responses")
@@ -1,7 +1,13 @@
 import streamlit as st
 import fitz
+import job_queue
+import model_routing
+import prompt_registry
 import util_v2
+import tracing
 import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 st.set_page_config(page_title="enable rewordify", page_icon="🦄", layout="wide")
 
@@ -11,6 +17,32 @@ enable_end = '[-enable end-]'
 icbc_start = '[-icbc start-]'
 icbc_end = '[-icbc end-]'
 
+# Number of documents whose finished sections are kept in the session for retries
+MAX_CHECKPOINTED_DOCUMENTS = 5
+
+# Seconds between status checks while a background job is queued or running
+JOB_STATUS_REFRESH_SECONDS = 2
+
+# Documents rewordified at the same time when several PDFs are uploaded
+MAX_PARALLEL_DOCUMENTS = 4
+
+@st.cache_data(max_entries=20, show_spinner=False)
+def parse_pdf(document_hash, _pdf_file):
+    """
+    Extract and parse an uploaded PDF once per document. Cached by the content hash of the upload,
+    so reruns (e.g. after editing a prompt) skip straight to the ChatGPT calls.
+
+    Parameters:
+    - document_hash (str): util_v2.document_hash of the upload, the cache key
+    - _pdf_file (UploadedFile): The upload (not hashed by st.cache_data)
+
+    Returns:
+    - tuple: Extracted PDF text, and util_v2.parse_document result
+    """
+    pdf_txt = util_v2.pdf_file_extract_text(_pdf_file)
+    return pdf_txt, util_v2.parse_document(pdf_txt)
+
+
 def main():
     # [Image: Logo]
     st.image('rewordify-logo.png')
@@ -23,8 +55,37 @@ def main():
         )
     st.markdown('#')   
 
+    # [Radio: Reword Mode]
+    reword_mode = st.radio(
+        "**Reword mode**",
+        ("Parallel", "One section at a time", "Streaming", "Batched (one request)", "Background job"),
+        horizontal=True,
+        help="Parallel sends every section at once. Streaming also sends every section at once, and shows the text as it arrives "
+             "(with several documents, they are reworded in parallel without streaming). Batched sends all sections in a single request. "
+             "Background job queues the run for a worker process, so it keeps going if the page is closed."
+        )
+
+    # [Checkbox: Response Cache]
+    use_response_cache = st.checkbox("**Reuse cached responses for unchanged sections**", value=True)
+
+    # [Checkbox: Model Routing]
+    use_model_routing = st.checkbox(
+        "**Send short and list sections to a faster model**",
+        value=False,
+        help="Overrides the model selected above for short and list sections. Summary and questionaire notes, "
+             "and other long sections, always use the model selected above."
+        )
+    routing = None
+    if use_model_routing:
+        with st.expander("routing thresholds"):
+            small_model = st.selectbox("**Faster model**", ("gpt-4o-mini", "gpt-3.5-turbo"))
+            short_section_tokens = st.number_input("**Short section (tokens)**", min_value=0, value=model_routing.SHORT_SECTION_TOKENS, step=50)
+            list_section_tokens = st.number_input("**List section (tokens)**", min_value=0, value=model_routing.LIST_SECTION_TOKENS, step=50)
+        routing = model_routing.routing_policy(small_model, short_section_tokens, list_section_tokens)
+    st.markdown('#')
+
     # [PDF File Uploader]
-    pdf_file = st.file_uploader("**Upload a PDF file**", type='pdf', accept_multiple_files=False, disabled=False, label_visibility="visible")
+    pdf_files = st.file_uploader("**Upload PDF files**", type='pdf', accept_multiple_files=True, disabled=False, label_visibility="visible")
     st.markdown('#')
 
     # [Load Default ChatGPT Prompts]
@@ -142,216 +203,364 @@ def main():
 
     # [Rewordify Action Button]
     if st.button("Rewordify"):
+        checkpoint = None
         try:
-            if pdf_file is not None:
-                with st.spinner('Running...'):
-                    
-                    # [Extract PDF]
-                    pdf_txt = util_v2.pdf_file_extract_text(pdf_file)
-                    
-                    # [Get patient info]
-                    name_txt, age_txt, gender_txt, pronouns_txt = util_v2.extract_patient_info(pdf_txt)
-                    
-                    # [Get Occupation/Employer]
-                    occupation_txt = util_v2.extract_occupation(pdf_txt)
-                    employer_txt = util_v2.extract_employer(pdf_txt)
-                    
-                    # [Get Live with People text]
-                    live_with_people_txt = util_v2.extract_live_with_people(pdf_txt)
-                    
-                    # [Get text between Markers]
-                    txt_between_markers = util_v2.extract_text_between_markers(pdf_txt, '[-enable start-]', '[-enable end-]')
-                    
-                    # [Raise exception if no text extracted]
-
-
-                    # [Get Section Text]
-                    summary_txt = util_v2.extract_summary_text(txt_between_markers)
-                    past_medical_txt = util_v2.extract_section_text(txt_between_markers, "past medical")
-                    surgical_history_txt = util_v2.extract_section_text(txt_between_markers, "surgical history")
-                    current_meds_txt = util_v2.extract_section_text(txt_between_markers, "current medications")
-                    allergies_txt = util_v2.extract_section_text(txt_between_markers, "allergies")
-                    fam_history_txt = util_v2.extract_section_text(txt_between_markers, "family history")
-                    soc_history_txt = util_v2.extract_section_text(txt_between_markers, "social history")
-                    func_history_txt = util_v2.extract_section_text(txt_between_markers, "functional history")
-
-                    # [Reword Sections]
-                    original_txt = ''
-
-                    # [Questionaire]
-                    if util_v2.is_na_string(raw_questionaire_txt) == True:
-                        new_questionaire_txt = ''
-                    else:
-                        new_questionaire_txt = util_v2.reword_section_text(st.secrets["api_key"], model, 0.7, questionaire_prompt, '**Questionaire Summary**', raw_questionaire_txt)+'\n\n'
-                        original_txt += '**Questionaire Summary**:\n' + raw_questionaire_txt +'\n\n'
-
-                    # [ICBC]
-                    if util_v2.is_na_string(raw_icbc_txt) == True:
-                        new_icbc_txt = ''
-                    else:
-                        new_icbc_txt = util_v2.reword_section_text(st.secrets["api_key"], model, 0, icbc_prompt, '**ICBC/WBC**', raw_icbc_txt)+'\n\n'
-                        original_txt += '**ICBC/WBC**:\n' + raw_icbc_txt +'\n\n'
-                    
-                    # [Summary]
-                    new_summary_txt = util_v2.reword_section_text(st.secrets["api_key"], model, 0, summary_prompt, '**Summary**', summary_txt)
-                    original_txt += '**Summary**:\n' + summary_txt
-                    
-                    # [Past Medical]
-                    new_past_medical_txt = util_v2.reword_section_text(st.secrets["api_key"], model, 0, past_medical_prompt, '**Past Medical**', past_medical_txt)
-                    original_txt += '\n\n**Past Medical**:\n' + past_medical_txt
-                    
-                    # [Surgical History]
-                    new_surgical_history_txt = util_v2.reword_section_text(st.secrets["api_key"], model, 0, surgical_history_prompt, '**Surgical History**', surgical_history_txt)
-                    original_txt += '\n\n**Surgical History**:\n' + surgical_history_txt
-                    
-                    # [Current Medication]
-                    new_current_meds_txt = util_v2.reword_section_text(st.secrets["api_key"], model, 0, current_medication_prompt, '**Current Medication**', current_meds_txt)
-                    original_txt += '\n\n**Current Medication**:\n' + current_meds_txt
-
-                    # [Allergies]
-                    new_allergies_txt = util_v2.reword_section_text(st.secrets["api_key"], model, 0, allergies_prompt, '**Allergies**', allergies_txt)
-                    original_txt += '\n\n**Allergies**:\n' + allergies_txt
-
-                    # [Family History]
-                    new_fam_history_txt = util_v2.reword_section_text(st.secrets["api_key"], model, 0, family_history_prompt, '**Family History**', fam_history_txt)
-                    original_txt += '\n\n**Family History**:\n' + fam_history_txt
-                    
-
-                    # [Social History]
-                    original_txt += '\n\n**Social History**:\n' + soc_history_txt
-
-                    # Remove PII
-                    if len(occupation_txt) > 0 and util_v2.contains_pii(occupation_txt) == False:
-                        soc_history_txt = soc_history_txt.replace(occupation_txt, "<occupation>")
-                    if len(employer_txt) > 0 and util_v2.contains_pii(employer_txt) == False:
-                        soc_history_txt = soc_history_txt.replace(employer_txt, "<employer>")
-                    if len(live_with_people_txt) > 0 and util_v2.contains_pii(live_with_people_txt) == False:
-                        soc_history_txt = soc_history_txt.replace(live_with_people_txt, "<live_with_people>")
-                    if len(name_txt) > 0:
-                        soc_history_txt = soc_history_txt.replace(name_txt, "<name>")
-
-                    # Reword
-                    new_soc_history_txt = util_v2.reword_section_text(st.secrets["api_key"], model, 0, social_history_prompt, '**Social History**', soc_history_txt)
-                    
-                    # Readd PII
-                    if len(occupation_txt) > 0 and util_v2.contains_pii(occupation_txt) == False:
-                        new_soc_history_txt = new_soc_history_txt.replace("<occupation>", occupation_txt)
-                    if len(employer_txt) > 0 and util_v2.contains_pii(employer_txt) == False:
-                        new_soc_history_txt = new_soc_history_txt.replace("<employer>", employer_txt)
-                    if len(live_with_people_txt) > 0 and util_v2.contains_pii(live_with_people_txt) == False:
-                        new_soc_history_txt = new_soc_history_txt.replace("<live_with_people>", live_with_people_txt)
-                    if len(name_txt) > 0:
-                        new_soc_history_txt = new_soc_history_txt.replace("<name>", name_txt)
-                    
-                    # [Functional History]
-                    if util_v2.is_na_string(func_history_txt) == True:
-                        new_func_history_txt = '**Functional History**:\nN/A'
-                        original_txt += '\n\n**Functional History**:\nN/A'
-                    else:
-                        new_func_history_txt = util_v2.reword_section_text(st.secrets["api_key"], model, 0, functional_history_prompt, '**Functional History**', func_history_txt)
-                        original_txt += '\n\n**Functional History**:\n' + func_history_txt
-                    
-                    # [Combine Sections]
-                    combine_sections = new_questionaire_txt + new_icbc_txt + new_summary_txt +'\n\n'+ new_past_medical_txt +'\n\n'+ new_surgical_history_txt +'\n\n'+ new_current_meds_txt +'\n\n'+ new_allergies_txt +'\n\n'+ new_fam_history_txt +'\n\n'+ new_soc_history_txt +'\n\n'+ new_func_history_txt
-
-                # [Done]
-                st.success('Done!')
-                st.markdown('#')
-                
-                # [Format Text Strings for Display]
-                original_txt_format = original_txt.replace('•\n', '+ ').replace('\n', '  \n')
-                combine_sections_format = combine_sections.replace('•', '+').replace('\n', '  \n')
-
-                original_txt_raw = original_txt.replace('**', '')
-                combine_sections_raw = combine_sections.replace('**', '')
-
-                # [Display Tabs to show Formatted or Raw text]
-                tab1, tab2, tab3, tab4 = st.tabs(["Formatted", "Raw", "Processed Prompts", "Debug"])
-                
-                # Formatted Text
-                with tab1:                
-                    col1, col2 = st.columns(2)
-
-                    with col1:
-                        st.write("**Original Text**")
-                        with st.container(border=True):
-                            st.markdown(original_txt_format)
-
-                    with col2:
-                        st.write("**Rewordified Text**")
-                        with st.container(border=True):
-                            st.markdown(combine_sections_format)
-
-                # Raw Text
-                with tab2:  
-                    col1, col2 = st.columns(2)             
-
-                    with col1:
-                        st.write("**Original Text (Raw)**")
-                        with st.container(border=True):
-                            st.code(original_txt_raw, language=None)
-
-                    with col2:
-                        st.write("**Rewordified Text (Raw)**")
-                        with st.container(border=True):
-                            st.code(combine_sections_raw, language=None)
+            if len(pdf_files) > 0:
+                # [Prompts by section]
+                prompts = {
+                    'questionaire': questionaire_prompt,
+                    'icbc': icbc_prompt,
+                    'summary': summary_prompt,
+                    'past_medical': past_medical_prompt,
+                    'surgical_history': surgical_history_prompt,
+                    'current_meds': current_medication_prompt,
+                    'allergies': allergies_prompt,
+                    'fam_history': family_history_prompt,
+                    'soc_history': social_history_prompt,
+                    'func_history': functional_history_prompt
+                }
+
+                # Raw notes belong to one patient, so they are only used when a single document is uploaded
+                if len(pdf_files) > 1:
+                    if util_v2.is_na_string(raw_questionaire_txt) == False or util_v2.is_na_string(raw_icbc_txt) == False:
+                        st.warning("Optional raw notes are only used when rewording a single document.")
+                    raw_questionaire_txt = raw_icbc_txt = 'N/A'
+
+                if reword_mode == "Background job":
+                    # [Queue the runs, worker processes pick them up and the page polls for the results]
+                    start_job_workers(st.secrets["api_key"], st.secrets.get("base_url"))
+                    for pdf_file in pdf_files:
+                        job_id = job_queue.submit_job(pdf_file.getvalue(), prompts, model, raw_questionaire_txt, raw_icbc_txt, use_response_cache, routing=routing)
+                        st.session_state.setdefault('background_jobs', []).append({'job_id': job_id, 'file_name': pdf_file.name})
+                    st.success(f'Submitted {len(pdf_files)} job(s)')
+                elif len(pdf_files) > 1:
+                    # [Several documents: rewordify them at the same time, results are kept for the selector below]
+                    if reword_mode == "Streaming":
+                        st.info("Several documents are reworded in parallel without streaming. Upload one document to stream it.")
+                    st.session_state['document_results'] = rewordify_documents(pdf_files, prompts, model, reword_mode, use_response_cache, routing)
+                else:
+                    pdf_file = pdf_files[0]
+                    st.session_state.pop('document_results', None)
+                    with st.spinner('Running...'), tracing.start_trace() as trace:
                         
-                # Prompts text sent
-                with tab3:
-                    if util_v2.is_na_string(raw_questionaire_txt) == False:
-                        st.write("**Questionaire**")
-                        with st.container(border=True):
-                            st.markdown("INSTRUCTIONS:\n\n" + questionaire_prompt + "\n\nGIVEN INFORMATION:\n\n" + raw_questionaire_txt)
-
-                    if util_v2.is_na_string(raw_icbc_txt) == False:
-                        st.write("**ICBC**")
-                        with st.container(border=True):
-                            st.markdown("INSTRUCTIONS:\n\n" + icbc_prompt + "\n\nGIVEN INFORMATION:\n\n" + raw_icbc_txt)
-
-                    st.write("**Summary**")
-                    with st.container(border=True):
-                        st.markdown("INSTRUCTIONS:\n\n" + summary_prompt + "\n\nGIVEN INFORMATION:\n\n" + summary_txt)
-
-                    st.write("**Past Medical**")
-                    with st.container(border=True):
-                        st.markdown("INSTRUCTIONS:\n\n" + past_medical_prompt + "\n\nGIVEN INFORMATION:\n\n" + past_medical_txt)
-
-                    st.write("**Surgical History**")
-                    with st.container(border=True):
-                        st.markdown("INSTRUCTIONS:\n\n" + surgical_history_prompt + "\n\nGIVEN INFORMATION:\n\n" + surgical_history_txt)
-
-                    st.write("**Current Medication**")
-                    with st.container(border=True):
-                        st.markdown("INSTRUCTIONS:\n\n" + current_medication_prompt + "\n\nGIVEN INFORMATION:\n\n" + current_meds_txt)
-
-                    st.write("**Allergies**")
-                    with st.container(border=True):
-                        st.markdown("INSTRUCTIONS:\n\n" + allergies_prompt + "\n\nGIVEN INFORMATION:\n\n" + allergies_txt)
-
-                    st.write("**Family History**")
-                    with st.container(border=True):
-                        st.markdown("INSTRUCTIONS:\n\n" + family_history_prompt + "\n\nGIVEN INFORMATION:\n\n" + fam_history_txt)
-
-                    st.write("**Social History**")
-                    with st.container(border=True):
-                        st.markdown("INSTRUCTIONS:\n\n" + social_history_prompt + "\n\nGIVEN INFORMATION:\n\n" + soc_history_txt)
-
-                    st.write("**Functional History**")
-                    with st.container(border=True):
-                        st.markdown("INSTRUCTIONS:\n\n" + functional_history_prompt + "\n\nGIVEN INFORMATION:\n\n" + func_history_txt)
-
-                # Debug
-                with tab4:
-                    st.write("**Text between markers**")
-                    with st.container(border=True):
-                        st.markdown(txt_between_markers)
-
-            elif pdf_file is None:
+                        # [Checkpoint finished sections of this document, so a retry only re-runs failed or changed sections]
+                        document_hash = util_v2.document_hash(pdf_file)
+                        checkpoints = st.session_state.setdefault('section_checkpoints', {})
+                        checkpoint = checkpoints.setdefault(document_hash, {})
+                        while len(checkpoints) > MAX_CHECKPOINTED_DOCUMENTS:
+                            checkpoints.pop(next(iter(checkpoints)))
+
+                        # [Extract PDF and get patient info, markers and section text (cached per document)]
+                        pdf_txt, parsed = parse_pdf(document_hash, pdf_file)
+
+                        # [Get Section Text]
+                        document = util_v2.prepare_document(pdf_txt, prompts, raw_questionaire_txt, raw_icbc_txt, parsed)
+
+                        # [Route each section to a model]
+                        document['section_jobs'] = model_routing.route_section_jobs(document['section_jobs'], model, routing)
+                        section_jobs = document['section_jobs']
+
+                        # [Reword Sections]
+                        if reword_mode == "Streaming":
+                            # Stream every section at once, each into its own place on the page as its tokens arrive
+                            st.write("**Rewordified Text**")
+                            with st.container(border=True):
+                                placeholders = [st.empty() for job in section_jobs]
+                            outputs = [""] * len(section_jobs)
+                            for i, token in util_v2.reword_sections_stream(st.secrets["api_key"], model, section_jobs, max_workers=len(section_jobs), base_url=st.secrets.get("base_url"), use_cache=use_response_cache, checkpoint=checkpoint):
+                                outputs[i] += token
+                                placeholders[i].markdown(outputs[i])
+                            reworded = dict(zip([job['key'] for job in section_jobs], outputs))
+                        else:
+                            # Reword all sections at once (or in one batched request), results come back in section order
+                            reword_sections = util_v2.reword_sections_batched if reword_mode == "Batched (one request)" else util_v2.reword_sections_parallel
+                            max_workers = 1 if reword_mode == "One section at a time" else len(section_jobs)
+                            reworded = dict(zip(
+                                [job['key'] for job in section_jobs],
+                                reword_sections(st.secrets["api_key"], model, section_jobs, max_workers=max_workers, base_url=st.secrets.get("base_url"), use_cache=use_response_cache, checkpoint=checkpoint)
+                            ))
+
+                        # [Combine Sections]
+                        combine_sections = util_v2.combine_reworded_sections(document, reworded)
+
+                    # [Done]
+                    st.success('Done!')
+                    st.markdown('#')
+
+                    show_results(document['original_txt'], combine_sections, section_jobs, document['txt_between_markers'],
+                                 trace.rows(), trace.to_json(), trace.to_otel_json(), key="live")
+
+            else:
                 st.write("Please choose a valid PDF file")
                 
         except Exception as e:
             st.write("Error occurred 😓")
+            if checkpoint:
+                st.write(f"{len(checkpoint)} finished section(s) were saved. Click Rewordify again to re-run only the failed sections.")
             st.exception(e)
+
+    # [Results of a multi-document run]
+    if 'document_results' in st.session_state:
+        show_document_results(st.session_state['document_results'])
+
+    # [Background Jobs]
+    background_jobs = st.session_state.get('background_jobs', [])
+    if len(background_jobs) > 0:
+        jobs = [job_queue.get_job(job['job_id']) for job in background_jobs]
+        pending = any(job is not None and job['status'] not in job_queue.JOB_FINAL_STATUSES for job in jobs)
+        # Poll every few seconds while a job is still queued or running
+        st.fragment(show_background_jobs, run_every=JOB_STATUS_REFRESH_SECONDS if pending else None)(polling=pending)
+
+
+def rewordify_pdf_document(pdf_file, prompts, api_key, base_url, model, reword_mode, use_response_cache, routing, checkpoint):
+    """
+    Rewordify one uploaded document. Runs in a worker thread, so it does not touch the page.
+
+    Returns:
+    - dict: Same keys as a background job result (see job_queue.run_job)
+    """
+    with tracing.start_trace() as trace:
+        pdf_txt = util_v2.pdf_file_extract_text(pdf_file)
+        document, combine_sections = util_v2.rewordify_document(
+            pdf_txt, prompts, api_key, model,
+            max_workers=1 if reword_mode == "One section at a time" else 10,
+            base_url=base_url, use_cache=use_response_cache,
+            batched=reword_mode == "Batched (one request)", checkpoint=checkpoint, routing=routing
+        )
+
+    return {
+        'original_txt': document['original_txt'],
+        'rewordified_txt': combine_sections,
+        'txt_between_markers': document['txt_between_markers'],
+        'section_jobs': document['section_jobs'],
+        'timings': trace.rows(),
+        'trace_json': trace.to_json(),
+        'trace_otel_json': trace.to_otel_json()
+    }
+
+
+def rewordify_documents(pdf_files, prompts, model, reword_mode, use_response_cache, routing):
+    """
+    Rewordify several uploaded documents, MAX_PARALLEL_DOCUMENTS at a time, with a status table
+    that updates as each document starts and finishes. Streaming mode rewords them in parallel.
+
+    Returns:
+    - dict: Per file name, its 'status', 'seconds', and 'result' or 'error'
+    """
+    api_key = st.secrets["api_key"]
+    base_url = st.secrets.get("base_url")
+    checkpoints = st.session_state.setdefault('section_checkpoints', {})
+    documents = {}
+    for pdf_file in pdf_files:
+        # Two uploads with the same name are told apart by a counter
+        name = pdf_file.name
+        suffix = 2
+        while name in documents:
+            name = f"{pdf_file.name} ({suffix})"
+            suffix += 1
+        documents[name] = {'status': 'queued', 'seconds': None, 'result': None, 'error': None}
+
+    def process(name, pdf_file, checkpoint):
+        documents[name]['status'] = 'running'
+        start_time = time.time()
+        try:
+            documents[name]['result'] = rewordify_pdf_document(pdf_file, prompts, api_key, base_url, model, reword_mode, use_response_cache, routing, checkpoint)
+            documents[name]['status'] = 'done'
+        except Exception as e:
+            documents[name]['status'] = 'failed'
+            documents[name]['error'] = f"{type(e).__name__}: {e}"
+        documents[name]['seconds'] = round(time.time() - start_time, 1)
+
+    status_table = st.empty()
+    with ThreadPoolExecutor(max_workers=MAX_PARALLEL_DOCUMENTS) as executor:
+        futures = set()
+        for name, pdf_file in zip(documents, pdf_files):
+            # Finished sections are checkpointed per document, as in a single document run
+            checkpoint = checkpoints.setdefault(util_v2.document_hash(pdf_file), {})
+            futures.add(executor.submit(process, name, pdf_file, checkpoint))
+
+        while len(futures) > 0:
+            status_table.dataframe(document_status_rows(documents), use_container_width=True)
+            futures = wait(futures, timeout=0.5, return_when=FIRST_COMPLETED).not_done
+
+    while len(checkpoints) > MAX_CHECKPOINTED_DOCUMENTS:
+        checkpoints.pop(next(iter(checkpoints)))
+
+    status_table.empty()
+    return documents
+
+
+def document_status_rows(documents):
+    """
+    Rows of the per-document status table.
+    """
+    return [
+        {'file': name, 'status': document['status'], 'seconds': document['seconds'], 'error': document['error']}
+        for name, document in documents.items()
+    ]
+
+
+def show_document_results(documents):
+    """
+    Status table of a multi-document run, and the result of the selected document.
+    """
+    st.markdown('#')
+    st.write("**Documents**")
+    st.dataframe(document_status_rows(documents), use_container_width=True)
+
+    finished = [name for name, document in documents.items() if document['status'] == 'done']
+    if len(finished) > 0:
+        selected = st.selectbox("**Show document**", finished)
+        result = documents[selected]['result']
+        show_results(result['original_txt'], result['rewordified_txt'], result['section_jobs'], result['txt_between_markers'],
+                     result['timings'], result['trace_json'], result['trace_otel_json'], key=f"document-{selected}")
+
+
+@st.cache_resource
+def start_job_workers(api_key, base_url):
+    """
+    Start the background job workers once per server process, shared by every session.
+    """
+    return job_queue.start_workers(api_key, base_url)
+
+
+def show_background_jobs(polling=False):
+    """
+    Status table of this session's background jobs, and the result of a finished job.
+
+    Parameters:
+    - polling (bool): True if the fragment was set up to rerun every JOB_STATUS_REFRESH_SECONDS
+    """
+    st.markdown('#')
+    st.write("**Background jobs**")
+
+    rows = []
+    finished = {}
+    pending = False
+    for submitted in st.session_state.get('background_jobs', []):
+        job = job_queue.get_job(submitted['job_id'])
+        if job is None:
+            continue
+        end_time = job['finished_at'] or time.time()
+        rows.append({
+            'file': submitted['file_name'],
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'stage': job['stage'],
+            'seconds': round(end_time - job['created_at'], 1),
+            'error': job['error']
+        })
+        if job['status'] == 'done':
+            finished[f"{submitted['file_name']} ({job['job_id'][:8]})"] = job
+        pending = pending or job['status'] not in job_queue.JOB_FINAL_STATUSES
+
+    # The fragment's run_every is fixed when the whole page runs, so once every job has finished
+    # the whole page is rerun to set the fragment up again without polling
+    if polling and not pending:
+        st.rerun()
+
+    st.dataframe(rows, use_container_width=True)
+
+    if len(finished) > 0:
+        selected = st.selectbox("**Show result**", list(finished))
+        job = finished[selected]
+        result = job['result']
+        show_results(result['original_txt'], result['rewordified_txt'], result['section_jobs'], result['txt_between_markers'],
+                     result['timings'], result['trace_json'], result['trace_otel_json'], key=f"job-{job['job_id']}")
+
+
+def show_results(original_txt, combine_sections, section_jobs, txt_between_markers, timings, trace_json, trace_otel_json, key):
+    """
+    Formatted, Raw, Processed Prompts and Debug tabs for one rewordified document.
+
+    Parameters:
+    - original_txt (str): Original section text (see util_v2.prepare_document)
+    - combine_sections (str): Combined rewordified text
+    - section_jobs (list): Section jobs sent to ChatGPT
+    - txt_between_markers (str): Text between the enable markers
+    - timings (list): Trace rows (see tracing.Trace.rows)
+    - trace_json (str): Trace as JSON
+    - trace_otel_json (str): Trace in the OpenTelemetry format
+    - key (str): Unique per result shown on the page (e.g. "live", or the job id), so several
+      results can be shown in one run without their widgets clashing
+    """
+    # [Format Text Strings for Display]
+    original_txt_format = original_txt.replace('•\n', '+ ').replace('\n', '  \n')
+    combine_sections_format = combine_sections.replace('•', '+').replace('\n', '  \n')
+
+    original_txt_raw = original_txt.replace('**', '')
+    combine_sections_raw = combine_sections.replace('**', '')
+
+    # [Display Tabs to show Formatted or Raw text]
+    tab1, tab2, tab3, tab4 = st.tabs(["Formatted", "Raw", "Processed Prompts", "Debug"])
+    
+    # Formatted Text
+    with tab1:                
+        col1, col2 = st.columns(2)
+
+        with col1:
+            st.write("**Original Text**")
+            with st.container(border=True):
+                st.markdown(original_txt_format)
+
+        with col2:
+            st.write("**Rewordified Text**")
+            with st.container(border=True):
+                st.markdown(combine_sections_format)
+
+    # Raw Text
+    with tab2:  
+        col1, col2 = st.columns(2)             
+
+        with col1:
+            st.write("**Original Text (Raw)**")
+            with st.container(border=True):
+                st.code(original_txt_raw, language=None)
+
+        with col2:
+            st.write("**Rewordified Text (Raw)**")
+            with st.container(border=True):
+                st.code(combine_sections_raw, language=None)
+            
+    # Prompts text sent
+    with tab3:
+        for job in section_jobs:
+            st.write(job['section_header'])
+            with st.container(border=True):
+                # Sections missing from the document have no text and are not sent
+                section_text = job['section_text'] if job['section_text'] is not None else 'N/A'
+                st.markdown("INSTRUCTIONS:\n\n" + job['prompt'] + "\n\nGIVEN INFORMATION:\n\n" + section_text)
+
+    # Debug
+    with tab4:
+        st.write("**Text between markers**")
+        with st.container(border=True):
+            st.markdown(txt_between_markers)
+
+        st.write("**Timings**")
+        st.dataframe(timings, use_container_width=True, key=f"{key}-timings")
+
+        st.write("**Model routes**")
+        st.dataframe([{'section': job['key'], **job['route']} for job in section_jobs if 'route' in job], use_container_width=True, key=f"{key}-routes")
+
+        st.write("**Prompt versions**")
+        default_versions = util_v2.default_prompt_versions()
+        st.dataframe([
+            {
+                'section': job['key'],
+                'default_version': default_versions[job['key']],
+                'prompt_sha256': prompt_registry.text_hash(job['prompt'])[:12],
+                'edited': not default_versions[job['key']].endswith(prompt_registry.text_hash(job['prompt'])[:12])
+            }
+            for job in section_jobs
+        ], use_container_width=True, key=f"{key}-prompt-versions")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("Download timings (JSON)", trace_json, file_name="rewordify_trace.json", mime="application/json", key=f"{key}-trace-json")
+        with col2:
+            st.download_button("Download timings (OpenTelemetry)", trace_otel_json, file_name="rewordify_trace_otel.json", mime="application/json", key=f"{key}-trace-otel")
+
     
 if __name__ == '__main__': 
-    main()
\ No newline at end of file
+    main()
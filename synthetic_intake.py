@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Synthetic intake PDFs for benchmarks and load tests.
+
+The documents follow the layout the extraction code expects: the [-name-]/[-age-]/[-gender-]/
+[-pronouns-] tags, the [-enable start-] ... [-enable end-] block with every section header,
+the 31.x/32./35.x Social History questions, then "1. Name" and the rest of the numbered form.
+Every page has a header and a footer, which extraction must drop. The text is made up, and the
+same seed always gives the same document.
+
+Example:
+    python synthetic_intake.py --pages 50 --output intake_50.pdf
+"""
+import argparse
+import random
+import sys
+
+import fitz # imports the pymupdf library
+
+
+# US letter, in points
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+
+# Body lines are written between these heights, inside the area pdf_file_extract_text keeps
+# (below the top 10% and above the bottom 5% of the page)
+BODY_TOP = 100
+BODY_BOTTOM = 735
+LINE_HEIGHT = 14
+LINES_PER_PAGE = (BODY_BOTTOM - BODY_TOP) // LINE_HEIGHT + 1
+
+HEADER_TEXT = "Enable Physiotherapy - Patient Intake Form"
+FOOTER_TEXT = "Confidential - page {page} of {pages}"
+
+FIRST_NAMES = ["Jane", "Amir", "Grace", "Tomas", "Priya", "Noah", "Mei", "Oliver", "Fatima", "Lucas"]
+LAST_NAMES = ["Doe", "Singh", "Tremblay", "Nguyen", "Okafor", "Larsen", "Kowalski", "Haddad", "Moreau", "Chen"]
+OCCUPATIONS = ["carpenter", "registered nurse", "bus driver", "accountant", "warehouse supervisor", "teacher"]
+EMPLOYERS = ["Acme Builders", "Fraser Health", "Coast Transit", "Harbour Logistics", "Northside School District"]
+LIVE_WITH = ["husband", "wife and two children", "alone", "partner", "parents", "roommate"]
+
+# Words for filler sentences. No digits, section header words or "n a", so filler never changes
+# what the extraction code finds.
+SUBJECTS = ["Patient", "The pain", "Stiffness", "Sleep", "Walking", "Lifting", "Driving", "The left knee", "The lower back", "The right shoulder"]
+VERBS = ["is worse", "has improved", "is unchanged", "flares up", "eases", "becomes sharp", "feels tight"]
+CONTEXTS = ["after prolonged sitting", "in the morning", "when climbing stairs", "at the end of a shift",
+            "with light stretching", "after heat therapy", "during household chores", "when reaching overhead"]
+LIST_ITEMS = ["Appendectomy", "Knee arthroscopy", "Ibuprofen as needed", "Ramipril daily", "Penicillin",
+              "Shellfish", "Father had diabetes", "Mother had arthritis", "Cholecystectomy", "Vitamin D weekly"]
+QUESTIONS = ["How would you rate your pain today", "What makes your symptoms better", "What makes your symptoms worse",
+             "Have you had physiotherapy before", "Which activities are you unable to do", "What are your goals for treatment"]
+
+
+def _sentence(rng):
+    return f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(CONTEXTS)}."
+
+
+def _paragraph_lines(rng, lines):
+    return [_sentence(rng) + " " + _sentence(rng) for _ in range(lines)]
+
+
+def _list_lines(rng, lines):
+    return ["- " + rng.choice(LIST_ITEMS) for _ in range(lines)]
+
+
+def intake_lines(pages=2, seed=0):
+    """
+    Body lines of a synthetic intake form, split into pages.
+
+    Parameters:
+    - pages (int): Number of pages
+    - seed (int): Random seed. The same seed gives the same document.
+
+    Returns:
+    - tuple: List of pages (each a list of lines), and a dict of the patient values written into
+      the form ('name', 'age', 'gender', 'pronouns', 'occupation', 'employer', 'live_with_people')
+    """
+    rng = random.Random(seed)
+    pages = max(1, pages)
+    patient = {
+        'name': f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        # extract_live_with_people stops at the first "32" in the text, so the age must not contain it
+        'age': str(rng.choice([age for age in range(18, 91) if '32' not in str(age)])),
+        'gender': rng.choice(["female", "male"]),
+        'occupation': rng.choice(OCCUPATIONS),
+        'employer': rng.choice(EMPLOYERS),
+        'live_with_people': rng.choice(LIVE_WITH)
+    }
+    patient['pronouns'] = "she her herself" if patient['gender'] == "female" else "he him himself"
+
+    # Share of the pages taken by the enable section, the rest is the numbered form
+    total_lines = pages * LINES_PER_PAGE
+    section_lines = max(1, (int(total_lines * 0.6) - 20) // 9)
+
+    lines = [
+        f"[-name-] {patient['name']}",
+        f"[-age-] {patient['age']}",
+        f"[-gender-] {patient['gender']}",
+        f"[-pronouns-] {patient['pronouns']}",
+        "[-enable start-]"
+    ]
+    lines += _paragraph_lines(rng, section_lines)
+    lines += ["Past medical"] + _paragraph_lines(rng, section_lines)
+    lines += ["Surgical history"] + _list_lines(rng, section_lines)
+    lines += ["Current medications"] + _list_lines(rng, section_lines)
+    lines += ["Allergies"] + _list_lines(rng, section_lines)
+    lines += ["Family History"] + _list_lines(rng, section_lines)
+    lines += [
+        "Social History",
+        f"31.1 I live with the following people {patient['live_with_people']}",
+        "32. I live in a house with stairs.",
+        f"35.1 My occupation is {patient['occupation']}",
+        f"35.2 I work at an organization called {patient['employer']}",
+        "35.3 I have extended health benefits."
+    ]
+    lines += _paragraph_lines(rng, section_lines)
+    lines += ["Functional History"] + _paragraph_lines(rng, section_lines)
+    lines += ["[-enable end-]", "1.", "Name", patient['name']]
+
+    # Numbered form questions until the last page is full
+    question = 2
+    while len(lines) < total_lines:
+        lines.append(f"{question}. {rng.choice(QUESTIONS)}?")
+        lines += _paragraph_lines(rng, 2)
+        question += 1
+    lines = lines[:total_lines]
+
+    page_lines = [lines[start:start + LINES_PER_PAGE] for start in range(0, len(lines), LINES_PER_PAGE)]
+    return page_lines, patient
+
+
+def make_intake_pdf(pages=2, seed=0, path=None):
+    """
+    Build a synthetic intake PDF (see intake_lines) with a header and footer on every page.
+
+    Parameters:
+    - pages (int): Number of pages
+    - seed (int): Random seed. The same seed gives the same document.
+    - path (str): File to save the PDF to, or None
+
+    Returns:
+    - tuple: The PDF content (bytes), and the patient values written into the form
+    """
+    page_lines, patient = intake_lines(pages, seed)
+
+    doc = fitz.open()
+    for page_number, lines in enumerate(page_lines, start=1):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        page.insert_text((72, 40), HEADER_TEXT, fontsize=10)
+        page.insert_text((72, BODY_TOP), "\n".join(lines), fontsize=11, lineheight=LINE_HEIGHT / 11)
+        page.insert_text((72, PAGE_HEIGHT - 12), FOOTER_TEXT.format(page=page_number, pages=len(page_lines)), fontsize=8)
+
+    pdf_bytes = doc.tobytes(garbage=3, deflate=True)
+    doc.close()
+
+    if path is not None:
+        with open(path, "wb") as f:
+            f.write(pdf_bytes)
+    return pdf_bytes, patient
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic intake PDF.")
+    parser.add_argument("--pages", type=int, default=2, help="Number of pages")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--output", default="synthetic_intake.pdf", help="PDF file to write")
+    args = parser.parse_args(argv)
+
+    pdf_bytes, patient = make_intake_pdf(args.pages, args.seed, args.output)
+    print(f"Wrote {args.output}: {len(pdf_bytes)} bytes, patient {patient['name']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# coding: utf-8
+"""
+Shared fixtures of the unit tests. No test calls the OpenAI API: ChatGPT calls are replaced by fakes.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import util_v2
+
+
+GIVEN_INFORMATION_MARKER = "GIVEN INFORMATION:\n\n"
+
+
+@pytest.fixture(autouse=True)
+def isolated_cwd(tmp_path, monkeypatch):
+    """
+    Run each test in an empty folder, so the response cache and job queue (under .cache/) start empty.
+    """
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def fake_chatgpt(monkeypatch):
+    """
+    Replace util_v2.call_chatgpt with a fake that answers "reworded <section text>".
+    Returns the list of calls made, each a dict of the call's arguments.
+    """
+    calls = []
+
+    def call_chatgpt(prompt, api_key, model, temperature, base_url=None, response_format=None):
+        calls.append({'prompt': prompt, 'model': model, 'temperature': temperature, 'base_url': base_url, 'response_format': response_format})
+        return "reworded " + prompt.rpartition(GIVEN_INFORMATION_MARKER)[2]
+
+    monkeypatch.setattr(util_v2, "call_chatgpt", call_chatgpt)
+    return calls
+
+
+def section_job(key, section_text, temperature=0, prompt="Reword this."):
+    """
+    Section job as built by util_v2.prepare_document.
+    """
+    return {'key': key, 'temperature': temperature, 'prompt': prompt, 'section_header': f"**{key}**", 'section_text': section_text}
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# coding: utf-8
+import os
+
+import pytest
+
+import batch_rewordify
+import util_v2
+
+
+def test_output_names_of_same_named_pdfs_do_not_collide():
+    pdf_paths = ["intake/a.pdf", "intake/sub/a.pdf", "intake/b.pdf"]
+
+    output_names = [batch_rewordify.output_name(pdf_path) for pdf_path in pdf_paths]
+
+    assert len(set(output_names)) == 3
+    for name in output_names[:2]:
+        assert name.startswith("a-") and name.endswith(".txt")
+    # The same file gets the same name on a re-run
+    assert batch_rewordify.output_name("intake/a.pdf") == output_names[0]
+
+
+@pytest.fixture
+def fake_batch(monkeypatch):
+    """Run run_batch without reading PDFs or calling ChatGPT; returns (processed PDFs, prompts used)."""
+    processed = []
+    prompts = {"summary": "Reword this."}
+
+    def fake_rewordify_pdf_file(pdf_path, output_path, prompts, *args):
+        processed.append(pdf_path)
+        with open(output_path, "w") as file:
+            file.write(f"{prompts['summary']} {pdf_path}")
+
+    monkeypatch.setattr(batch_rewordify, "rewordify_pdf_file", fake_rewordify_pdf_file)
+    monkeypatch.setattr(util_v2, "load_default_prompts", lambda: dict(prompts))
+    monkeypatch.setattr(util_v2, "default_prompt_versions", lambda: {})
+    return processed, prompts
+
+
+def write_pdf(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as file:
+        file.write(content)
+
+
+def output_texts(output_dir):
+    return {name: open(os.path.join(output_dir, name)).read() for name in os.listdir(output_dir) if name.endswith(".txt")}
+
+
+def test_separate_runs_of_same_named_pdfs_keep_both_outputs(fake_batch):
+    processed, _ = fake_batch
+    write_pdf("in/a.pdf", b"patient one")
+    write_pdf("in/sub/a.pdf", b"patient two")
+
+    batch_rewordify.run_batch(["in/a.pdf"], "br", "key", "gpt-3.5-turbo")
+    batch_rewordify.run_batch(["in/sub/a.pdf"], "br", "key", "gpt-3.5-turbo")
+    manifest = batch_rewordify.run_batch(["in/a.pdf"], "br", "key", "gpt-3.5-turbo")
+
+    # The third run skips in/a.pdf, and its output still holds in/a.pdf's text
+    assert processed == ["in/a.pdf", "in/sub/a.pdf"]
+    assert sorted(output_texts("br").values()) == ["Reword this. in/a.pdf", "Reword this. in/sub/a.pdf"]
+    with open(manifest["documents"]["in/a.pdf"]["output"]) as file:
+        assert file.read() == "Reword this. in/a.pdf"
+
+
+def test_changed_settings_or_content_are_not_skipped(fake_batch):
+    processed, prompts = fake_batch
+    write_pdf("in/a.pdf", b"patient one")
+
+    batch_rewordify.run_batch(["in/a.pdf"], "br", "key", "gpt-3.5-turbo")
+    batch_rewordify.run_batch(["in/a.pdf"], "br", "key", "gpt-3.5-turbo")
+    assert processed == ["in/a.pdf"]
+
+    batch_rewordify.run_batch(["in/a.pdf"], "br", "key", "gpt-4o")
+    assert len(processed) == 2
+
+    prompts["summary"] = "Reword this differently."
+    batch_rewordify.run_batch(["in/a.pdf"], "br", "key", "gpt-4o")
+    assert len(processed) == 3
+
+    write_pdf("in/a.pdf", b"patient one, corrected")
+    batch_rewordify.run_batch(["in/a.pdf"], "br", "key", "gpt-4o")
+    assert len(processed) == 4
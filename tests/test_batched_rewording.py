@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# coding: utf-8
+import json
+
+import pytest
+
+import util_v2
+from conftest import GIVEN_INFORMATION_MARKER, section_job
+
+
+def test_parse_keeps_requested_non_empty_answers():
+    response = json.dumps({'summary': "  Back pain.  ", 'allergies': "", 'past_medical': 3, 'extra': "Ignored."})
+
+    assert util_v2.parse_batched_response(response, ['summary', 'allergies', 'past_medical']) == {'summary': "Back pain."}
+
+
+@pytest.mark.parametrize("response", ["not json", "[\"a list\"]", "\"a string\"", ""])
+def test_parse_of_anything_but_a_json_object_is_empty(response):
+    assert util_v2.parse_batched_response(response, ['summary']) == {}
+
+
+def batched_chatgpt(monkeypatch, answer):
+    """
+    Fake call_chatgpt: batched (JSON mode) requests get answer(keys), single sections are reworded.
+    Returns the list of calls, each 'batch' or the reworded section text.
+    """
+    calls = []
+
+    def call_chatgpt(prompt, api_key, model, temperature, base_url=None, response_format=None):
+        if response_format is not None:
+            calls.append('batch')
+            keys = [line[len("### SECTION "):] for line in prompt.splitlines() if line.startswith("### SECTION ")]
+            return answer(keys)
+        section_text = prompt.rpartition(GIVEN_INFORMATION_MARKER)[2]
+        calls.append(section_text)
+        return "single " + section_text
+
+    monkeypatch.setattr(util_v2, "call_chatgpt", call_chatgpt)
+    return calls
+
+
+JOBS = [section_job("summary", "Back pain."), section_job("allergies", "Penicillin."), section_job("func_history", "N/A")]
+
+
+def test_all_sections_answered_in_one_request(monkeypatch):
+    calls = batched_chatgpt(monkeypatch, lambda keys: json.dumps({key: "batched " + key for key in keys}))
+
+    outputs = util_v2.reword_sections_batched("key", "model", JOBS, use_cache=False)
+
+    assert outputs == ["**summary**:\nbatched summary", "**allergies**:\nbatched allergies", "**func_history**:\nN/A"]
+    assert calls == ['batch']
+
+
+def test_sections_missing_from_the_answer_fall_back_to_their_own_request(monkeypatch):
+    calls = batched_chatgpt(monkeypatch, lambda keys: json.dumps({'summary': "batched summary"}))
+
+    outputs = util_v2.reword_sections_batched("key", "model", JOBS, use_cache=False)
+
+    assert outputs == ["**summary**:\nbatched summary", "**allergies**:\nsingle Penicillin.", "**func_history**:\nN/A"]
+    assert calls == ['batch', "Penicillin."]
+
+
+def test_invalid_json_falls_back_for_every_section(monkeypatch):
+    calls = batched_chatgpt(monkeypatch, lambda keys: "Sorry, here is the text.")
+
+    outputs = util_v2.reword_sections_batched("key", "model", JOBS, use_cache=False)
+
+    assert outputs == ["**summary**:\nsingle Back pain.", "**allergies**:\nsingle Penicillin.", "**func_history**:\nN/A"]
+    assert calls[0] == 'batch' and sorted(calls[1:]) == ["Back pain.", "Penicillin."]
+
+
+def test_failed_batch_request_falls_back_for_every_section(monkeypatch):
+    def answer(keys):
+        raise RuntimeError("response_format is not supported with this model")
+
+    calls = batched_chatgpt(monkeypatch, answer)
+
+    outputs = util_v2.reword_sections_batched("key", "model", JOBS, use_cache=False)
+
+    assert outputs == ["**summary**:\nsingle Back pain.", "**allergies**:\nsingle Penicillin.", "**func_history**:\nN/A"]
+    assert sorted(calls[1:]) == ["Back pain.", "Penicillin."]
+
+
+def test_sections_of_other_temperatures_are_batched_separately(monkeypatch):
+    calls = batched_chatgpt(monkeypatch, lambda keys: json.dumps({key: "batched " + key for key in keys}))
+    jobs = [section_job("summary", "Back pain.", temperature=0), section_job("allergies", "Penicillin.", temperature=0.5)]
+
+    outputs = util_v2.reword_sections_batched("key", "model", jobs, use_cache=False)
+
+    assert outputs == ["**summary**:\nbatched summary", "**allergies**:\nbatched allergies"]
+    assert calls == ['batch', 'batch']
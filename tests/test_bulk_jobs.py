@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# coding: utf-8
+import json
+import os
+
+import pytest
+
+import bulk_jobs
+import mock_openai
+import pii_masking
+import synthetic_intake
+import util_v2
+
+
+PROMPTS = {key: "Reword this." for key in util_v2.SECTION_PROMPT_NAMES}
+
+
+@pytest.fixture
+def mock_server():
+    server = mock_openai.start_server(port=0)
+    yield server
+    server.shutdown()
+
+
+def write_intake_pdf(path, seed):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    synthetic_intake.make_intake_pdf(seed=seed, path=path)
+
+
+def read_requests(job_dir):
+    with open(os.path.join(job_dir, "batch_input.jsonl")) as file:
+        return [json.loads(line) for line in file]
+
+
+def run_job(pdf_paths, job_dir, output_dir, server):
+    bulk_jobs.prepare_job(pdf_paths, job_dir, "gpt-4o", PROMPTS)
+    bulk_jobs.submit_job(job_dir, "key", server.base_url)
+    assert bulk_jobs.wait_for_job(job_dir, "key", server.base_url, poll_seconds=0.05, timeout_seconds=30) == "completed"
+    return bulk_jobs.collect_job(job_dir, output_dir, "key", server.base_url, use_cache=False)
+
+
+def test_request_file_has_one_request_per_reworded_section():
+    write_intake_pdf("in/a.pdf", seed=1)
+    write_intake_pdf("in/sub/a.pdf", seed=2)
+
+    request_count = bulk_jobs.prepare_job(["in/a.pdf", "in/sub/a.pdf"], "job", "gpt-4o", PROMPTS)
+
+    requests = read_requests("job")
+    with open(os.path.join("job", "documents.json")) as file:
+        documents = json.load(file)["documents"]
+    assert len(requests) == request_count
+    assert sorted(documents) == ["a", "a_2"]
+    assert len({request["custom_id"] for request in requests}) == len(requests)
+
+    for doc_id, document in documents.items():
+        expected_ids = [f"{doc_id}/{job['key']}" for job in document["section_jobs"] if util_v2.is_na_string(job['section_text']) != True]
+        assert [request["custom_id"] for request in requests if request["custom_id"].startswith(doc_id + "/")] == expected_ids
+    for request in requests:
+        assert request["body"]["model"] == "gpt-4o"
+        assert request["body"]["messages"][-1]["content"].startswith("INSTRUCTIONS:\n\nReword this.\n\nGIVEN INFORMATION:\n\n")
+
+
+def section_texts(pdf_path):
+    """Unmasked text of every reworded section of a PDF, which is what the mock answers with."""
+    document = util_v2.prepare_document(util_v2.pdf_file_extract_text(pdf_path), PROMPTS)
+    masker = pii_masking.PiiMasker(document['pii_replacements'])
+    return [masker.unmask(job['section_text']) for job in document['section_jobs'] if util_v2.is_na_string(job['section_text']) != True]
+
+
+def test_responses_are_collected_into_their_own_documents(mock_server):
+    write_intake_pdf("in/a.pdf", seed=1)
+    write_intake_pdf("in/b.pdf", seed=2)
+
+    manifest = run_job(["in/a.pdf", "in/b.pdf"], "job", "out", mock_server)
+
+    assert manifest["summary"] == {"total": 2, "done": 2, "failed": 0}
+    outputs = {}
+    for doc_id in ("a", "b"):
+        with open(manifest["documents"][doc_id]["output"]) as file:
+            outputs[doc_id] = file.read()
+    for text in section_texts("in/a.pdf"):
+        assert text in outputs["a"] and text not in outputs["b"]
+    for text in section_texts("in/b.pdf"):
+        assert text in outputs["b"] and text not in outputs["a"]
+
+
+def test_separate_jobs_of_same_named_pdfs_keep_both_outputs(mock_server):
+    write_intake_pdf("in/a.pdf", seed=1)
+    write_intake_pdf("in/sub/a.pdf", seed=2)
+
+    first = run_job(["in/a.pdf"], "job1", "out", mock_server)
+    second = run_job(["in/sub/a.pdf"], "job2", "out", mock_server)
+
+    first_output, second_output = first["documents"]["a"]["output"], second["documents"]["a"]["output"]
+    assert first_output != second_output
+    with open(first_output) as first_file, open(second_output) as second_file:
+        assert first_file.read() != second_file.read()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding: utf-8
+import io
+import json
+
+import pytest
+
+import util_v2
+from conftest import GIVEN_INFORMATION_MARKER, section_job
+
+
+def test_checkpoint_key_changes_with_every_input():
+    job = section_job("summary", "Back pain.")
+    key = util_v2.section_checkpoint_key("model", job)
+
+    assert util_v2.section_checkpoint_key("model", dict(job)) == key
+    assert util_v2.section_checkpoint_key("other model", job) != key
+    assert util_v2.section_checkpoint_key("model", dict(job, model="routed model")) != key
+    for field, value in [('temperature', 0.5), ('prompt', "Other prompt."), ('section_header', "**other**"), ('section_text', "Neck pain.")]:
+        assert util_v2.section_checkpoint_key("model", dict(job, **{field: value})) != key
+
+
+def flaky_chatgpt(monkeypatch, failing_texts):
+    """
+    Fake call_chatgpt that fails for the section texts in failing_texts. Returns the texts sent.
+    """
+    sent = []
+
+    def call_chatgpt(prompt, api_key, model, temperature, base_url=None, response_format=None):
+        section_text = prompt.rpartition(GIVEN_INFORMATION_MARKER)[2]
+        sent.append(section_text)
+        if section_text in failing_texts:
+            raise RuntimeError("server error")
+        return "reworded " + section_text
+
+    monkeypatch.setattr(util_v2, "call_chatgpt", call_chatgpt)
+    return sent
+
+
+def test_retry_only_reruns_the_failed_section(monkeypatch):
+    jobs = [section_job("summary", "Back pain."), section_job("allergies", "Penicillin.")]
+    checkpoint = {}
+    failing_texts = {"Penicillin."}
+    sent = flaky_chatgpt(monkeypatch, failing_texts)
+
+    with pytest.raises(RuntimeError):
+        util_v2.reword_sections_parallel("key", "model", jobs, use_cache=False, checkpoint=checkpoint)
+    assert list(checkpoint.values()) == ["**summary**:\nreworded Back pain."]
+
+    failing_texts.clear()
+    sent.clear()
+    outputs = util_v2.reword_sections_parallel("key", "model", jobs, use_cache=False, checkpoint=checkpoint)
+
+    assert outputs == ["**summary**:\nreworded Back pain.", "**allergies**:\nreworded Penicillin."]
+    assert sent == ["Penicillin."]
+
+
+def test_changed_section_is_reworded_again(monkeypatch):
+    checkpoint = {}
+    sent = flaky_chatgpt(monkeypatch, set())
+    util_v2.reword_sections_parallel("key", "model", [section_job("summary", "Back pain.")], use_cache=False, checkpoint=checkpoint)
+
+    outputs = util_v2.reword_sections_parallel("key", "model", [section_job("summary", "Neck pain.")], use_cache=False, checkpoint=checkpoint)
+
+    assert outputs == ["**summary**:\nreworded Neck pain."]
+    assert sent == ["Back pain.", "Neck pain."]
+
+
+def test_batched_run_uses_and_fills_the_checkpoint(monkeypatch):
+    jobs = [section_job("summary", "Back pain."), section_job("allergies", "Penicillin.")]
+    checkpoint = {util_v2.section_checkpoint_key("model", jobs[0]): "**summary**:\nfrom checkpoint"}
+    requested = []
+
+    def call_chatgpt(prompt, api_key, model, temperature, base_url=None, response_format=None):
+        keys = [line[len("### SECTION "):] for line in prompt.splitlines() if line.startswith("### SECTION ")]
+        requested.extend(keys)
+        return json.dumps({key: "batched " + key for key in keys})
+
+    monkeypatch.setattr(util_v2, "call_chatgpt", call_chatgpt)
+
+    outputs = util_v2.reword_sections_batched("key", "model", jobs, use_cache=False, checkpoint=checkpoint)
+
+    assert outputs == ["**summary**:\nfrom checkpoint", "**allergies**:\nbatched allergies"]
+    assert requested == ["allergies"]
+    assert checkpoint[util_v2.section_checkpoint_key("model", jobs[1])] == "**allergies**:\nbatched allergies"
+
+
+def test_document_hash_is_the_same_for_every_input_form(tmp_path):
+    pdf_bytes = b"%PDF-1.4 not really a pdf"
+    pdf_path = tmp_path / "intake.pdf"
+    pdf_path.write_bytes(pdf_bytes)
+
+    with open(pdf_path, "rb") as pdf_file:
+        hashes = {
+            util_v2.document_hash(pdf_bytes),
+            util_v2.document_hash(io.BytesIO(pdf_bytes)),
+            util_v2.document_hash(str(pdf_path)),
+            util_v2.document_hash(pdf_file)
+        }
+
+    assert len(hashes) == 1
+    assert util_v2.document_hash(pdf_bytes + b" ") not in hashes
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# coding: utf-8
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import job_queue
+import util_v2
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / "jobs.sqlite3")
+
+
+def heartbeat_at(job_id, path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT heartbeat_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()[0]
+
+
+def test_submitted_job_is_claimed_once(queue_path):
+    job_id = job_queue.submit_job(b"%PDF", {'summary': "Reword."}, "model", path=queue_path)
+    assert job_queue.get_job(job_id, queue_path)['status'] == 'queued'
+
+    claimed_id, request, pdf_bytes = job_queue.claim_next_job(queue_path)
+
+    assert (claimed_id, request['model'], pdf_bytes) == (job_id, "model", b"%PDF")
+    assert job_queue.get_job(job_id, queue_path)['status'] == 'running'
+    assert job_queue.claim_next_job(queue_path) is None
+
+
+def test_jobs_are_claimed_oldest_first(queue_path):
+    first = job_queue.submit_job(b"1", {}, "model", path=queue_path)
+    second = job_queue.submit_job(b"2", {}, "model", path=queue_path)
+
+    assert [job_queue.claim_next_job(queue_path)[0] for _ in range(2)] == [first, second]
+
+
+def test_job_of_a_quiet_worker_is_claimed_again(queue_path, monkeypatch):
+    job_id = job_queue.submit_job(b"%PDF", {}, "model", path=queue_path)
+    job_queue.claim_next_job(queue_path)
+
+    monkeypatch.setattr(job_queue, "JOB_STALE_SECONDS", -1)
+
+    assert job_queue.claim_next_job(queue_path)[0] == job_id
+
+
+def test_heartbeats_keep_a_long_running_job(queue_path, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_HEARTBEAT_SECONDS", 0.01)
+    job_id = job_queue.submit_job(b"%PDF", {}, "model", path=queue_path)
+    job_queue.claim_next_job(queue_path)
+    claimed_at = heartbeat_at(job_id, queue_path)
+
+    stop = threading.Event()
+    heartbeats = threading.Thread(target=job_queue._send_heartbeats, args=(job_id, stop, queue_path))
+    heartbeats.start()
+    time.sleep(0.2)
+    stop.set()
+    heartbeats.join()
+
+    assert heartbeat_at(job_id, queue_path) > claimed_at
+
+
+def run_claimed_job(queue_path, monkeypatch, rewordify_document):
+    monkeypatch.setattr(util_v2, "pdf_file_extract_text", lambda pdf_file, max_workers=None: "pdf text")
+    monkeypatch.setattr(util_v2, "rewordify_document", rewordify_document)
+    job_queue.submit_job(b"%PDF", {'summary': "Reword."}, "model", path=queue_path)
+    job_id, request, pdf_bytes = job_queue.claim_next_job(queue_path)
+    job_queue.run_job(job_id, request, pdf_bytes, "key", path=queue_path)
+    return job_queue.get_job(job_id, queue_path)
+
+
+def test_finished_job_stores_its_result(queue_path, monkeypatch):
+    def rewordify_document(pdf_txt, prompts, api_key, model, *args, **kwargs):
+        document = {'original_txt': pdf_txt, 'txt_between_markers': pdf_txt, 'section_jobs': []}
+        return document, "reworded " + pdf_txt
+
+    job = run_claimed_job(queue_path, monkeypatch, rewordify_document)
+
+    assert job['status'] == 'done'
+    assert job['result']['rewordified_txt'] == "reworded pdf text"
+
+
+def test_failed_job_stores_its_error(queue_path, monkeypatch):
+    def rewordify_document(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    job = run_claimed_job(queue_path, monkeypatch, rewordify_document)
+
+    assert (job['status'], job['error']) == ('failed', "RuntimeError: boom")
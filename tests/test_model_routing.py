@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# coding: utf-8
+import pytest
+
+import model_routing
+import token_budget
+from conftest import section_job
+
+
+POLICY = model_routing.routing_policy("small", short_section_tokens=20, list_section_tokens=200)
+
+
+@pytest.fixture(autouse=True)
+def estimated_counts(monkeypatch):
+    monkeypatch.setattr(token_budget, "_encoding", lambda model: None)
+
+
+def routes(section_jobs, policy=POLICY):
+    return [(job['key'], job['model'], job['route']['reason']) for job in model_routing.route_section_jobs(section_jobs, "large", policy)]
+
+
+def test_sections_are_routed_by_kind_and_length():
+    long_text = "The lower back is worse after prolonged sitting and eases with light stretching. " * 10
+    long_list = "\n".join(f"- Medication {i} taken daily with food" for i in range(12))
+
+    assert routes([
+        section_job("summary", "Back pain."),
+        section_job("past_medical", "Asthma."),
+        section_job("current_meds", long_list),
+        section_job("soc_history", long_list),
+        section_job("func_history", long_text)
+    ]) == [
+        ("summary", "large", "narrative section"),
+        ("past_medical", "small", "short section"),
+        ("current_meds", "small", "list section"),
+        ("soc_history", "small", "list section"),
+        ("func_history", "large", "long section")
+    ]
+
+
+def test_missing_section_uses_the_selected_model():
+    routed = model_routing.route_section_jobs([section_job("allergies", None), section_job("past_medical", "Asthma.")], "large", POLICY)
+
+    assert [job['model'] for job in routed] == ["large", "small"]
+    assert routed[0]['route'] == {'model': "large", 'reason': "no text", 'section_tokens': 0}
+
+
+def test_without_a_policy_every_section_uses_the_selected_model():
+    assert routes([section_job("allergies", None), section_job("past_medical", "Asthma.")], policy=None) == [
+        ("allergies", "large", "selected model"),
+        ("past_medical", "large", "selected model")
+    ]
+
+
+def test_list_style_needs_mostly_bullet_lines():
+    assert model_routing.is_list_style("- one\n- two\n3) three\nnote")
+    assert not model_routing.is_list_style("- one\nplain\nplain")
+    assert not model_routing.is_list_style("\n\n")
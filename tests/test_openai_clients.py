@@ -0,0 +1,21 @@
+#!/usr/bin/env python
+# coding: utf-8
+import asyncio
+
+import util_v2
+
+
+async def client_pair():
+    return util_v2.get_async_openai_client("key"), util_v2.get_async_openai_client("key")
+
+
+def test_async_client_is_shared_on_one_loop_and_dropped_with_it(monkeypatch):
+    monkeypatch.setattr(util_v2, "_async_openai_clients", {})
+
+    first, again = asyncio.run(client_pair())
+    second, _ = asyncio.run(client_pair())
+
+    assert first is again
+    assert second is not first
+    # The first loop was closed, so its clients were dropped
+    assert len(util_v2._async_openai_clients) == 1
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# coding: utf-8
+import os
+import signal
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz
+import pytest
+
+import util_v2
+
+
+@pytest.fixture
+def long_pdf(monkeypatch):
+    """A 16-page PDF that is extracted by two worker processes."""
+    monkeypatch.setattr(util_v2, "PDF_EXTRACT_WORKERS", 2)
+    monkeypatch.setattr(util_v2, "_pdf_process_pool", None)
+    doc = fitz.open()
+    for number in range(2 * util_v2.PDF_MIN_PAGES_PER_WORKER):
+        doc.new_page().insert_text((72, 300), f"Page {number} text")
+    doc.save("long.pdf")
+    doc.close()
+    yield "long.pdf"
+    if util_v2._pdf_process_pool is not None:
+        util_v2._pdf_process_pool.shutdown()
+
+
+def test_extraction_recovers_from_a_dead_worker(long_pdf):
+    expected = util_v2.pdf_file_extract_text(long_pdf, max_workers=1)
+    assert util_v2.pdf_file_extract_text(long_pdf) == expected
+
+    broken_pool = util_v2._pdf_process_pool
+    for process in list(broken_pool._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+        process.join()
+
+    assert util_v2.pdf_file_extract_text(long_pdf) == expected
+    assert util_v2._pdf_process_pool is not broken_pool
+
+
+class BrokenPool:
+    def submit(self, *args):
+        raise BrokenProcessPool("A child process terminated abruptly")
+
+    def shutdown(self, **kwargs):
+        pass
+
+
+def test_extraction_falls_back_to_this_process_when_pools_keep_breaking(long_pdf, monkeypatch):
+    expected = util_v2.pdf_file_extract_text(long_pdf, max_workers=1)
+    created = []
+
+    def get_broken_pool():
+        created.append(BrokenPool())
+        util_v2._pdf_process_pool = created[-1]
+        return created[-1]
+
+    monkeypatch.setattr(util_v2, "_get_pdf_process_pool", get_broken_pool)
+
+    assert util_v2.pdf_file_extract_text(long_pdf) == expected
+    assert len(created) == 2
+    assert util_v2._pdf_process_pool is None
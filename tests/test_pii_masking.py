@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# coding: utf-8
+import model_routing
+import pii_masking
+import synthetic_intake
+import util_v2
+
+
+def masker(name="Jane Doe", occupation="carpenter", employer="Acme Builders", live_with="alone", texts=()):
+    return pii_masking.PiiMasker(pii_masking.patient_replacements(name, occupation, employer, live_with, texts))
+
+
+def test_mask_and_unmask_round_trip():
+    text = "Jane Doe works as a carpenter at Acme Builders and lives alone. Jane reports pain; Doe family history."
+    pii = masker()
+
+    masked = pii.mask(text)
+
+    assert masked == ("<name> works as a <occupation> at <employer> and lives <live_with_people>. "
+                      "<first_name> reports pain; <last_name> family history.")
+    assert pii.unmask(masked) == text
+
+
+def test_name_parts_only_match_whole_words():
+    pii = masker()
+
+    assert pii.mask("Janet and Doerr saw Jane.") == "Janet and Doerr saw <first_name>."
+
+
+def test_values_describing_relationships_are_not_masked():
+    replacements = pii_masking.patient_replacements("Jane Doe", "self employed", "Acme Builders", "husband and son")
+
+    assert [value for placeholder, value in replacements] == ["Acme Builders", "Jane Doe", "Jane", "Doe"]
+
+
+def test_placeholder_already_in_the_text_is_not_reused():
+    text = "Template field <name> was left empty by Jane Doe."
+    pii = masker(texts=[text])
+
+    masked = pii.mask(text)
+
+    assert masked == "Template field <name> was left empty by <name_2>."
+    assert pii.unmask(masked) == text
+
+
+def test_value_inside_another_value_is_not_masked_twice():
+    # The employer contains the last name, and the occupation is part of a placeholder name
+    pii = masker(name="Jane Builders", occupation="name", employer="Acme Builders")
+
+    masked = pii.mask("Jane Builders works at Acme Builders, name tag on.")
+
+    assert masked == "<name> works at <employer>, <occupation> tag on."
+    assert pii.unmask(masked) == "Jane Builders works at Acme Builders, name tag on."
+
+
+def test_missing_and_na_sections_pass_through():
+    texts = ["Jane Doe reports pain.", None, "N/A"]
+
+    masked_texts, replacements = util_v2.mask_document_pii(texts, "Jane Doe", "carpenter", "Acme Builders", "alone")
+
+    assert masked_texts == ["<name> reports pain.", None, "N/A"]
+    assert util_v2.unmask_pii(masked_texts[0], replacements) == texts[0]
+
+
+def test_document_missing_a_section_is_masked_and_routed(fake_chatgpt):
+    pages, patient = synthetic_intake.intake_lines(pages=1)
+    lines = [line for page in pages for line in page]
+    del lines[lines.index("Functional History"):lines.index("[-enable end-]")]
+    pdf_txt = "\n".join(lines) + "\n"
+
+    document, rewordified_txt = util_v2.rewordify_document(
+        pdf_txt, util_v2.load_default_prompts(), "key", "gpt-4o", use_cache=False,
+        routing=model_routing.routing_policy()
+    )
+
+    func_history = [job for job in document['section_jobs'] if job['key'] == 'func_history'][0]
+    assert func_history['section_text'] is None
+    assert func_history['route']['reason'] == "no text"
+    assert rewordified_txt.endswith("**Functional History**:\nN/A")
+    # Nothing sent to ChatGPT names the patient, and the output has the values put back
+    assert not any(patient['occupation'] in call['prompt'] for call in fake_chatgpt)
+    assert patient['occupation'] in rewordified_txt
+
+
+def test_only_masked_values_are_returned_for_unmasking():
+    pii = masker()
+
+    masked_texts, used_replacements = pii.mask_texts(["Jane Doe works as a carpenter.", None])
+
+    assert masked_texts == ["<name> works as a <occupation>.", None]
+    assert used_replacements == [("<occupation>", "carpenter"), ("<name>", "Jane Doe")]
+    assert pii_masking.PiiMasker(used_replacements).unmask(masked_texts[0]) == "Jane Doe works as a carpenter."
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# coding: utf-8
+import asyncio
+import time
+
+import pytest
+
+import rate_limit
+
+
+class FakeApiError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+class FakeStream:
+    """
+    Stream of chunks that records whether it was closed.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.chunks)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeAsyncStream(FakeStream):
+
+    async def __aiter__(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(rate_limit, "backoff_seconds", lambda attempt, retry_after=None: 0)
+
+
+def free_slots(scheduler):
+    return scheduler.concurrency._value
+
+
+def test_bucket_waits_for_refill():
+    bucket = rate_limit.TokenBucket(capacity=2, refill_per_second=20)
+    bucket.acquire(2)
+
+    start_time = time.monotonic()
+    bucket.acquire(1)
+
+    assert time.monotonic() - start_time >= 0.04
+
+
+def test_bucket_raises_when_capacity_comes_after_the_deadline():
+    bucket = rate_limit.TokenBucket(capacity=1, refill_per_second=1)
+    bucket.acquire(1)
+
+    with pytest.raises(rate_limit.DeadlineExceeded):
+        bucket.acquire(1, deadline=time.monotonic() + 0.1)
+
+
+def test_retryable_errors_are_retried():
+    scheduler = rate_limit.RequestScheduler(max_retries=3)
+    attempts = []
+
+    def send(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise FakeApiError(429)
+        return "ok"
+
+    assert scheduler.run(send, 10) == "ok"
+    assert len(attempts) == 3
+    assert free_slots(scheduler) == rate_limit.MAX_CONCURRENT_REQUESTS
+
+
+def test_other_errors_are_raised_at_once():
+    scheduler = rate_limit.RequestScheduler()
+    attempts = []
+
+    def send(timeout):
+        attempts.append(timeout)
+        raise FakeApiError(400)
+
+    with pytest.raises(FakeApiError):
+        scheduler.run(send, 10)
+    assert len(attempts) == 1
+    assert free_slots(scheduler) == rate_limit.MAX_CONCURRENT_REQUESTS
+
+
+def test_stream_holds_its_slot_until_read_to_the_end():
+    scheduler = rate_limit.RequestScheduler(max_concurrent_requests=1)
+    stream = FakeStream(["a", "b"])
+
+    chunks = scheduler.run_stream(lambda timeout: stream, 10)
+    assert next(chunks) == "a"
+    # The one slot is taken while the stream is open
+    with pytest.raises(rate_limit.DeadlineExceeded):
+        scheduler.run(lambda timeout: "ok", 10, deadline_seconds=0.05)
+
+    assert list(chunks) == ["b"]
+    assert stream.closed
+    assert scheduler.run(lambda timeout: "ok", 10) == "ok"
+
+
+def test_closed_stream_gives_back_its_slot():
+    scheduler = rate_limit.RequestScheduler(max_concurrent_requests=1)
+    stream = FakeStream(["a", "b"])
+
+    chunks = scheduler.run_stream(lambda timeout: stream, 10)
+    next(chunks)
+    chunks.close()
+
+    assert stream.closed
+    assert free_slots(scheduler) == 1
+
+
+def test_async_stream_holds_its_slot_until_closed():
+    scheduler = rate_limit.RequestScheduler(max_concurrent_requests=1)
+    stream = FakeAsyncStream(["a", "b"])
+
+    async def send(timeout):
+        return stream
+
+    async def read_one():
+        chunks = scheduler.run_stream_async(send, 10)
+        first = await chunks.__anext__()
+        slots_while_open = free_slots(scheduler)
+        await chunks.aclose()
+        return first, slots_while_open
+
+    assert asyncio.run(read_one()) == ("a", 0)
+    assert stream.closed
+    assert free_slots(scheduler) == 1
+
+
+def test_share_of_limits_divides_the_limits(monkeypatch):
+    monkeypatch.setattr(rate_limit, "_scheduler", None)
+
+    rate_limit.use_share_of_limits(4)
+
+    scheduler = rate_limit.get_scheduler()
+    assert scheduler.request_bucket.capacity == rate_limit.REQUESTS_PER_MINUTE // 4
+    assert free_slots(scheduler) == rate_limit.MAX_CONCURRENT_REQUESTS // 4
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# coding: utf-8
+import time
+
+import response_cache
+import util_v2
+from conftest import section_job
+
+
+def test_key_depends_on_every_input():
+    key = response_cache.make_cache_key("gpt-4o", 0, "Reword this.", "Back pain.")
+
+    assert key == response_cache.make_cache_key("gpt-4o", 0.0, "Reword this.", "Back pain.", None, "section")
+    assert key != response_cache.make_cache_key("gpt-4o-mini", 0, "Reword this.", "Back pain.")
+    assert key != response_cache.make_cache_key("gpt-4o", 0, "Reword that.", "Back pain.")
+    assert key != response_cache.make_cache_key("gpt-4o", 0, "Reword this.", "Neck pain.")
+    assert key != response_cache.make_cache_key("gpt-4o", 0, "Reword this.", "Back pain.", base_url="http://127.0.0.1:8089/v1")
+    assert key != response_cache.make_cache_key("gpt-4o", 0, "Reword this.", "Back pain.", mode="batched")
+
+
+def test_round_trip_and_missing_key():
+    response_cache.set_cached_response("key", "response")
+
+    assert response_cache.get_cached_response("key") == "response"
+    assert response_cache.get_cached_response("other key") is None
+
+
+def test_expired_entries_are_missing():
+    response_cache.set_cached_response("key", "response")
+    time.sleep(0.01)
+
+    assert response_cache.get_cached_response("key", ttl_seconds=0) is None
+    assert response_cache.get_cached_response("key") is None
+
+
+def test_least_recently_used_entries_are_evicted():
+    for key in ("a", "b", "c"):
+        response_cache.set_cached_response(key, key, max_entries=3)
+        time.sleep(0.01)
+    response_cache.get_cached_response("a")  # a is now more recent than b
+    time.sleep(0.01)
+    response_cache.set_cached_response("d", "d", max_entries=3)
+
+    assert [response_cache.get_cached_response(key) for key in "abcd"] == ["a", None, "c", "d"]
+
+
+def test_responses_of_another_server_are_not_reused(fake_chatgpt):
+    util_v2.reword_section_text("key", "model", 0, "Reword this.", "**Summary**", "Back pain.", base_url="http://127.0.0.1:8089/v1")
+    util_v2.reword_section_text("key", "model", 0, "Reword this.", "**Summary**", "Back pain.")
+    util_v2.reword_section_text("key", "model", 0, "Reword this.", "**Summary**", "Back pain.")
+
+    assert [call['base_url'] for call in fake_chatgpt] == ["http://127.0.0.1:8089/v1", None]
+
+
+def test_batched_answers_are_not_reused_for_single_sections(fake_chatgpt, monkeypatch):
+    monkeypatch.setattr(util_v2, "call_chatgpt", lambda prompt, *args, **kwargs: fake_chatgpt.append(prompt) or '{"summary": "batched answer"}')
+    util_v2.reword_sections_batched("key", "model", [section_job("summary", "Back pain.")])
+
+    assert util_v2.reword_sections_batched("key", "model", [section_job("summary", "Back pain.")]) == ["**summary**:\nbatched answer"]
+    assert len(fake_chatgpt) == 1  # the second batched run was answered from the cache
+
+    monkeypatch.setattr(util_v2, "call_chatgpt", lambda prompt, *args, **kwargs: fake_chatgpt.append(prompt) or "single answer")
+    assert util_v2.reword_section_text("key", "model", 0, "Reword this.", "**summary**", "Back pain.") == "**summary**:\nsingle answer"
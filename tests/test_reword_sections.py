@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding: utf-8
+import asyncio
+import threading
+import time
+
+import pytest
+
+import util_v2
+from conftest import section_job
+
+
+def test_parallel_outputs_keep_section_order(monkeypatch):
+    # Earlier sections answer last, so completion order is the reverse of document order
+    delays = {"first": 0.1, "second": 0.05, "third": 0}
+
+    def call_chatgpt(prompt, api_key, model, temperature, base_url=None, response_format=None):
+        section_text = prompt.rpartition("\n\n")[2]
+        time.sleep(delays[section_text])
+        return "reworded " + section_text
+
+    monkeypatch.setattr(util_v2, "call_chatgpt", call_chatgpt)
+    jobs = [section_job(f"s{i}", text) for i, text in enumerate(delays)]
+
+    outputs = util_v2.reword_sections_parallel("key", "model", jobs, use_cache=False)
+
+    assert outputs == ["**s0**:\nreworded first", "**s1**:\nreworded second", "**s2**:\nreworded third"]
+
+
+def test_na_sections_are_not_sent(fake_chatgpt):
+    jobs = [section_job("summary", "Back pain."), section_job("func_history", "N/A")]
+
+    outputs = util_v2.reword_sections_parallel("key", "model", jobs, use_cache=False)
+
+    assert outputs == ["**summary**:\nreworded Back pain.", "**func_history**:\nN/A"]
+    assert len(fake_chatgpt) == 1
+
+
+def test_one_failed_section_raises_after_the_others_finish(monkeypatch):
+    finished = []
+
+    def call_chatgpt(prompt, api_key, model, temperature, base_url=None, response_format=None):
+        if prompt.endswith("bad"):
+            raise RuntimeError("boom")
+        time.sleep(0.05)
+        finished.append(prompt)
+        return "ok"
+
+    monkeypatch.setattr(util_v2, "call_chatgpt", call_chatgpt)
+    jobs = [section_job("a", "bad"), section_job("b", "good"), section_job("c", "good too")]
+
+    with pytest.raises(RuntimeError, match="boom"):
+        util_v2.reword_sections_parallel("key", "model", jobs, use_cache=False)
+    assert len(finished) == 2
+
+
+def test_stream_sends_sections_at_once(monkeypatch):
+    # Both sections must be in flight together for either to finish
+    both_started = threading.Barrier(2, timeout=5)
+
+    def call_chatgpt_stream(prompt, api_key, model, temperature, base_url=None):
+        both_started.wait()
+        section_text = prompt.rpartition("\n\n")[2]
+        yield "reworded "
+        yield section_text
+
+    monkeypatch.setattr(util_v2, "call_chatgpt_stream", call_chatgpt_stream)
+    jobs = [section_job("summary", "Back pain."), section_job("past_medical", "Asthma.")]
+    checkpoint = {}
+
+    outputs = [""] * len(jobs)
+    for i, token in util_v2.reword_sections_stream("key", "model", jobs, use_cache=False, checkpoint=checkpoint):
+        outputs[i] += token
+
+    assert outputs == ["**summary**:\nreworded Back pain.", "**past_medical**:\nreworded Asthma."]
+    assert sorted(checkpoint.values()) == sorted(outputs)
+
+
+def test_every_reword_variant_shares_the_response_cache(monkeypatch, fake_chatgpt):
+    def call_chatgpt_stream(prompt, api_key, model, temperature, base_url=None):
+        raise AssertionError("the cached response should be used")
+
+    async def call_chatgpt_async(prompt, api_key, model, temperature, base_url=None, response_format=None):
+        raise AssertionError("the cached response should be used")
+
+    monkeypatch.setattr(util_v2, "call_chatgpt_stream", call_chatgpt_stream)
+    monkeypatch.setattr(util_v2, "call_chatgpt_async", call_chatgpt_async)
+    monkeypatch.setattr(util_v2, "call_chatgpt_stream_async", call_chatgpt_stream)
+    args = ("key", "model", 0, "Reword this.", "**summary**", "Back pain.")
+
+    expected = util_v2.reword_section_text(*args)
+
+    async def read_async():
+        streamed = "".join([token async for token in util_v2.reword_section_text_stream_async(*args)])
+        return await util_v2.reword_section_text_async(*args), streamed
+
+    assert expected == "**summary**:\nreworded Back pain."
+    assert "".join(util_v2.reword_section_text_stream(*args)) == expected
+    assert asyncio.run(read_async()) == (expected, expected)
+    assert len(fake_chatgpt) == 1
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# coding: utf-8
+import synthetic_intake
+import util_v2
+
+
+TEXT = (
+    "Patient reports back pain.\n"
+    "Past medical\n"
+    "Asthma. No known allergies to report here.\n"
+    "Surgical history\n"
+    "Appendectomy\n"
+    "Allergies\n"
+    "Penicillin\n"
+    "Functional History\n"
+    "Walks 20 minutes.\n"
+)
+
+
+def test_each_section_runs_until_the_next_header():
+    sections = util_v2.split_sections(TEXT)
+
+    assert sections == {
+        "past medical": "Asthma. No known allergies to report here.",
+        "surgical history": "Appendectomy",
+        "allergies": "Penicillin",
+        "functional history": "Walks 20 minutes."
+    }
+
+
+def test_a_mention_inside_another_section_does_not_split_it():
+    # "allergies" first appears mid-line in Past medical, the header is the later line-start match
+    assert util_v2.extract_section_text(TEXT, "Past medical") == "Asthma. No known allergies to report here."
+    assert util_v2.extract_section_text(TEXT, "Allergies") == "Penicillin"
+
+
+def test_headers_in_any_order_and_case():
+    text = "FUNCTIONAL HISTORY\nWalks daily.\npast MEDICAL\nAsthma.\n"
+
+    sections = util_v2.split_sections(text)
+
+    assert sections == {"functional history": "Walks daily.", "past medical": "Asthma."}
+
+
+def test_missing_section_is_none():
+    assert util_v2.extract_section_text(TEXT, "Family History") is None
+    assert "family history" not in util_v2.split_sections(TEXT)
+
+
+def test_header_only_found_mid_line_is_still_used():
+    text = "Notes. Social History lives alone.\nFunctional History\nWalks daily.\n"
+
+    assert util_v2.extract_section_text(text, "Social History") == "lives alone."
+
+
+def test_document_without_allergies_header_shows_it_as_na():
+    pages, patient = synthetic_intake.intake_lines(pages=1)
+    lines = [line for page in pages for line in page]
+    lines.remove("Allergies")
+
+    document = util_v2.prepare_document("\n".join(lines) + "\n", util_v2.load_default_prompts())
+
+    allergies = [job for job in document['section_jobs'] if job['key'] == 'allergies'][0]
+    assert allergies['section_text'] is None
+    assert "**Allergies**:\nN/A\n\n**Family History**" in document['original_txt']
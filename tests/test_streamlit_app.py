@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# coding: utf-8
+from streamlit.testing.v1 import AppTest
+
+import job_queue
+import synthetic_intake
+import tracing
+import util_v2
+
+
+def results_page():
+    import streamlit as st
+    import streamlit_app
+
+    streamlit_app.show_document_results(st.session_state['document_results'])
+    streamlit_app.show_background_jobs()
+
+
+def finished_result():
+    # Without an Allergies header, so one section has no text
+    pdf_txt = util_v2.pdf_file_extract_text(synthetic_intake.make_intake_pdf()[0]).replace("\nAllergies\n", "\n")
+    document = util_v2.prepare_document(pdf_txt, util_v2.load_default_prompts())
+    assert any(job['section_text'] is None for job in document['section_jobs'])
+    with tracing.start_trace() as trace:
+        with tracing.span("reword_section_text"):
+            pass
+    return {
+        'original_txt': document['original_txt'],
+        'rewordified_txt': document['original_txt'],
+        'txt_between_markers': document['txt_between_markers'],
+        'section_jobs': document['section_jobs'],
+        'timings': trace.rows(),
+        'trace_json': trace.to_json(),
+        'trace_otel_json': trace.to_otel_json()
+    }
+
+
+def test_several_results_render_in_one_run():
+    result = finished_result()
+    job_id = job_queue.submit_job(b"%PDF", util_v2.load_default_prompts(), "gpt-4o")
+    job_queue._finish_job(job_id, 'done', result, None, job_queue.JOB_QUEUE_PATH)
+
+    app = AppTest.from_function(results_page)
+    app.session_state['document_results'] = {
+        name: {'status': 'done', 'seconds': 1.0, 'result': result, 'error': None} for name in ("a.pdf", "b.pdf")
+    }
+    app.session_state['background_jobs'] = [{'job_id': job_id, 'file_name': "a.pdf"}]
+    app.run(timeout=30)
+
+    # The same result is shown twice, once for the document run and once for the background job
+    assert not app.exception
+    assert len(app.get("download_button")) == 4
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# coding: utf-8
+import pytest
+
+import token_budget
+import tracing
+import util_v2
+
+
+@pytest.fixture(autouse=True)
+def estimated_counts(monkeypatch):
+    """
+    Count tokens with the offline estimate (CHARACTERS_PER_TOKEN), so results do not depend on tiktoken.
+    """
+    monkeypatch.setattr(token_budget, "_encoding", lambda model: None)
+
+
+def test_text_within_budget_is_one_chunk():
+    assert token_budget.split_text("Back pain.\nNeck pain.", 100, "model") == ["Back pain.\nNeck pain."]
+
+
+def test_chunks_break_between_lines_and_join_back():
+    text = "\n".join(f"- Item number {i} of the list" for i in range(40))
+
+    chunks = token_budget.split_text(text, 50, "model")
+
+    assert len(chunks) > 1
+    assert "\n".join(chunks) == text
+    assert all(token_budget.count_tokens(chunk, "model") <= 50 for chunk in chunks)
+
+
+def test_long_line_breaks_between_words():
+    line = " ".join(f"word{i}" for i in range(200))
+
+    chunks = token_budget.split_text(line, 40, "model")
+
+    assert len(chunks) > 1
+    assert " ".join(chunks) == line
+    assert all(token_budget.count_tokens(chunk, "model") <= 40 for chunk in chunks)
+
+
+def test_prompt_budget_leaves_room_for_the_response():
+    assert token_budget.prompt_token_budget("gpt-4o") == token_budget.MAX_PROMPT_TOKENS
+    assert token_budget.prompt_token_budget("unknown") == min(
+        token_budget.MAX_PROMPT_TOKENS, token_budget.DEFAULT_CONTEXT_TOKENS - token_budget.RESPONSE_RESERVE_TOKENS
+    )
+
+
+def test_long_section_is_sent_in_chunks_within_the_budget(monkeypatch):
+    monkeypatch.setattr(token_budget, "MAX_PROMPT_TOKENS", 200)
+    section_text = "\n".join(f"Visit {i}: the lower back is worse after prolonged sitting." for i in range(60))
+
+    prompts = util_v2.build_section_prompts("gpt-4o", "Reword this.", section_text)
+
+    assert len(prompts) > 1
+    assert all(prompt.startswith("INSTRUCTIONS:\n\nReword this.\n\nGIVEN INFORMATION:\n\n") for prompt in prompts)
+    assert all(token_budget.count_tokens(prompt, "gpt-4o") <= 200 for prompt in prompts)
+    assert "\n".join(prompt.rpartition("GIVEN INFORMATION:\n\n")[2] for prompt in prompts) == section_text
+
+
+def test_chunked_section_is_reworded_in_order(monkeypatch, fake_chatgpt):
+    monkeypatch.setattr(token_budget, "MAX_PROMPT_TOKENS", 100)
+    section_text = "\n".join(f"Line {i} about the patient's shoulder pain." for i in range(30))
+
+    chunks = [prompt.rpartition("GIVEN INFORMATION:\n\n")[2] for prompt in util_v2.build_section_prompts("gpt-4o", "Reword this.", section_text)]
+
+    output = util_v2.reword_section_text("key", "gpt-4o", 0, "Reword this.", "**summary**", section_text, use_cache=False)
+
+    assert len(chunks) > 1 and len(fake_chatgpt) == len(chunks)
+    assert output == "**summary**:\n" + "\n".join("reworded " + chunk for chunk in chunks)
+
+
+def test_section_span_reuses_the_token_count_and_skips_measuring_untraced(monkeypatch, fake_chatgpt):
+    section_text = "The lower back is worse after prolonged sitting."
+    prompts, prompt_tokens = util_v2.build_section_prompts_with_counts("gpt-4o", "Reword this.", section_text)
+    # Counted as instructions plus section text, so within a token of counting the whole prompt
+    assert abs(prompt_tokens - token_budget.count_tokens(prompts[0], "gpt-4o")) <= 1
+
+    counted = []
+    count_tokens = token_budget.count_tokens
+    monkeypatch.setattr(token_budget, "count_tokens", lambda text, model: counted.append(text) or count_tokens(text, model))
+
+    with tracing.start_trace() as trace:
+        util_v2.reword_section_text("key", "gpt-4o", 0, "Reword this.", "**summary**", section_text, use_cache=False)
+    traced_counts = len(counted)
+    assert trace.spans[-1]['attributes']['counted_prompt_tokens'] == prompt_tokens
+
+    counted.clear()
+    util_v2.reword_section_text("key", "gpt-4o", 0, "Reword this.", "**summary**", section_text, use_cache=False)
+    assert len(counted) == traced_counts
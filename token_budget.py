@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# coding: utf-8
+import os
+import re
+import warnings
+from functools import lru_cache
+
+
+# Context window of each model, in tokens. Models not listed use DEFAULT_CONTEXT_TOKENS.
+MODEL_CONTEXT_TOKENS = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-4o': 128000,
+    'gpt-4o-mini': 128000
+}
+DEFAULT_CONTEXT_TOKENS = 8192
+
+# Largest prompt sent in one request. Longer section prompts are split into chunks.
+# Kept well below the context window: very long prompts are slow and expensive even when they fit.
+MAX_PROMPT_TOKENS = int(os.environ.get("REWORDIFY_MAX_PROMPT_TOKENS", 6000))
+
+# Room left in the context window for the response
+RESPONSE_RESERVE_TOKENS = 2000
+
+# Tokens a response is expected to use, reserved up front by the rate limiter
+EXPECTED_RESPONSE_TOKENS = 500
+
+# Offline estimate when tiktoken (or its encoding files) is not available
+CHARACTERS_PER_TOKEN = 4
+
+WORD_PATTERN = re.compile(r'\S+\s*')
+
+
+@lru_cache(maxsize=None)
+def _encoding(model):
+    """
+    tiktoken encoding for a model, or None when tiktoken or its encoding files are not available.
+    Loaded once per model.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # e.g. the encoding file cannot be downloaded on an offline machine
+        warnings.warn(f"tiktoken encoding for {model} not available, estimating token counts instead ({type(e).__name__})")
+        return None
+
+
+def load_encoding(model):
+    """
+    Load a model's encoding ahead of its first use, downloading the encoding file if it is not
+    cached yet, so the first request does not wait for it.
+
+    Parameters:
+    - model (str): ChatGPT model
+
+    Returns:
+    - bool: True if tokens are counted with tiktoken, False if they are estimated
+    """
+    return _encoding(model) is not None
+
+
+def count_tokens(text, model):
+    """
+    Count the tokens of a text for a model, with tiktoken if available, else estimated from its length.
+
+    Parameters:
+    - text (str): Text to count
+    - model (str): ChatGPT model
+
+    Returns:
+    - int: Number of tokens
+    """
+    encoding = _encoding(model)
+    if encoding is None:
+        return len(text) // CHARACTERS_PER_TOKEN + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def estimate_request_tokens(prompt, model, expected_response_tokens=EXPECTED_RESPONSE_TOKENS):
+    """
+    Tokens one request is expected to use (prompt plus response), for rate limiting.
+
+    Parameters:
+    - prompt (str): Prompt text
+    - model (str): ChatGPT model
+    - expected_response_tokens (int): Tokens reserved for the response
+
+    Returns:
+    - int: Estimated tokens
+    """
+    return count_tokens(prompt, model) + expected_response_tokens
+
+
+def prompt_token_budget(model):
+    """
+    Largest prompt, in tokens, to send to a model in one request.
+
+    Parameters:
+    - model (str): ChatGPT model
+
+    Returns:
+    - int: Token budget
+    """
+    context_tokens = MODEL_CONTEXT_TOKENS.get(model, DEFAULT_CONTEXT_TOKENS)
+    return min(MAX_PROMPT_TOKENS, context_tokens - RESPONSE_RESERVE_TOKENS)
+
+
+def split_text(text, max_tokens, model):
+    """
+    Split a text into chunks of at most max_tokens, breaking between lines (so bullet points stay
+    whole), and between words only for a single line that is too long on its own.
+
+    Parameters:
+    - text (str): Text to split
+    - max_tokens (int): Token budget of each chunk
+    - model (str): ChatGPT model (for counting tokens)
+
+    Returns:
+    - list: Chunks, in order. Joined with newlines they give back the text (a line split between
+      words gets a newline in place of the space where it was split).
+    """
+    return split_text_with_counts(text, max_tokens, model)[0]
+
+
+def split_text_with_counts(text, max_tokens, model):
+    """
+    split_text, also returning the token count of each chunk as counted while splitting, so
+    callers do not tokenize the chunks again. A chunk of several lines is counted as the sum of
+    its lines plus their newlines, which can differ from counting the joined chunk by a few tokens.
+
+    Parameters:
+    - text (str): Text to split
+    - max_tokens (int): Token budget of each chunk
+    - model (str): ChatGPT model (for counting tokens)
+
+    Returns:
+    - tuple: (chunks, token count of each chunk)
+    """
+    max_tokens = max(1, max_tokens)
+    text_tokens = count_tokens(text, model)
+    if text_tokens <= max_tokens:
+        return [text], [text_tokens]
+
+    chunks = []
+    chunk_tokens = []
+    lines = []
+    lines_tokens = 0
+
+    def flush():
+        nonlocal lines, lines_tokens
+        if len(lines) > 0:
+            chunks.append('\n'.join(lines))
+            chunk_tokens.append(lines_tokens - 1)  # without the last line's newline
+        lines = []
+        lines_tokens = 0
+
+    for line in text.split('\n'):
+        line_tokens = count_tokens(line, model) + 1  # plus the newline
+        if line_tokens > max_tokens:
+            flush()
+            # Split the line between words into pieces of about max_tokens, using the line's characters per token
+            max_characters = max(1, int(max_tokens * len(line) / line_tokens))
+            piece = ''
+            for word in WORD_PATTERN.findall(line):
+                if len(piece) + len(word) > max_characters and piece != '':
+                    chunks.append(piece.rstrip())
+                    chunk_tokens.append(count_tokens(chunks[-1], model))
+                    piece = ''
+                piece += word
+            if piece != '':
+                chunks.append(piece.rstrip())
+                chunk_tokens.append(count_tokens(chunks[-1], model))
+            continue
+
+        if lines_tokens + line_tokens > max_tokens:
+            flush()
+        lines.append(line)
+        lines_tokens += line_tokens
+
+    flush()
+    return chunks, chunk_tokens
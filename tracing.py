@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# coding: utf-8
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Trace and span currently active in this context. Threads started with contextvars.copy_context().run
+# (see util_v2.reword_sections_parallel) record into the same trace.
+_current_trace = contextvars.ContextVar("rewordify_trace", default=None)
+_current_span = contextvars.ContextVar("rewordify_span", default=None)
+
+# Guards add_to_attributes, which threads sharing a parent span may call at the same time
+_attributes_lock = threading.Lock()
+
+
+class Trace:
+    """
+    Collects the spans recorded during one rewordify run.
+    """
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add_span(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def rows(self):
+        """
+        Returns:
+        - list: One dict per finished span (name, start offset and duration in ms, attributes), in start order
+        """
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span['start_ns'])
+        if len(spans) == 0:
+            return []
+
+        trace_start_ns = spans[0]['start_ns']
+        return [
+            {
+                'name': span['name'],
+                'start_ms': round((span['start_ns'] - trace_start_ns) / 1e6, 1),
+                'duration_ms': round(span['duration_ms'], 1),
+                **span['attributes']
+            }
+            for span in spans
+        ]
+
+    def to_json(self):
+        """
+        Returns:
+        - string: The trace as JSON, with the spans in start order
+        """
+        return json.dumps({'trace_id': self.trace_id, 'spans': self.rows()}, indent=2, default=str)
+
+    def to_otel_json(self, service_name="rewordify"):
+        """
+        Export the spans in the OpenTelemetry (OTLP/JSON) span format.
+
+        Parameters:
+        - service_name (str): service.name resource attribute
+
+        Returns:
+        - string: OTLP/JSON document with one resourceSpans entry
+        """
+        with self._lock:
+            spans = list(self.spans)
+
+        otel_spans = []
+        for span in spans:
+            otel_span = {
+                'traceId': self.trace_id,
+                'spanId': span['span_id'],
+                'name': span['name'],
+                'kind': 1,
+                'startTimeUnixNano': str(span['start_ns']),
+                'endTimeUnixNano': str(span['end_ns']),
+                'attributes': [_otel_attribute(key, value) for key, value in span['attributes'].items()],
+                'status': {'code': 2, 'message': span['error']} if span['error'] else {'code': 1}
+            }
+            if span['parent_id'] is not None:
+                otel_span['parentSpanId'] = span['parent_id']
+            otel_spans.append(otel_span)
+
+        return json.dumps({
+            'resourceSpans': [{
+                'resource': {'attributes': [_otel_attribute('service.name', service_name)]},
+                'scopeSpans': [{'scope': {'name': 'rewordify.tracing'}, 'spans': otel_spans}]
+            }]
+        }, indent=2)
+
+
+def _otel_attribute(key, value):
+    """
+    Convert one attribute to the OTLP/JSON key/value form.
+    """
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+@contextmanager
+def start_trace():
+    """
+    Record every span opened in this context (and in threads that copy it) into a new Trace.
+
+    Yields:
+    - Trace: The trace being recorded
+    """
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def is_active():
+    """
+    Returns:
+    - bool: True if a trace is being recorded in this context
+    """
+    return _current_trace.get() is not None
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a block of work as a span of the current trace. Does nothing when no trace is active.
+
+    Parameters:
+    - name (str): Span name, e.g. "pdf_file_extract_text"
+    - attributes: Initial span attributes, e.g. section="summary"
+
+    Yields:
+    - dict: The span attributes, which the block may add to (token counts, bytes, ...)
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield {}
+        return
+
+    parent = _current_span.get()
+    record = {
+        'name': name,
+        'span_id': os.urandom(8).hex(),
+        'parent_id': parent['span_id'] if parent is not None else None,
+        'attributes': dict(attributes),
+        'error': None
+    }
+    token = _current_span.set(record)
+    record['start_ns'] = time.time_ns()
+    record['start'] = time.perf_counter()
+    try:
+        yield record['attributes']
+    except BaseException as e:
+        record['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record['duration_ms'] = (time.perf_counter() - record['start']) * 1000
+        record['end_ns'] = record['start_ns'] + int(record['duration_ms'] * 1e6)
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # A generator span closed from another context (e.g. an abandoned stream)
+            pass
+        trace.add_span(record)
+
+
+def set_attributes(**attributes):
+    """
+    Add attributes (e.g. token counts reported by the API) to the innermost active span.
+    Does nothing when no trace is active.
+    """
+    record = _current_span.get()
+    if record is not None:
+        record['attributes'].update(attributes)
+
+
+def add_to_attributes(**counts):
+    """
+    Add counts (e.g. token usage of several requests made for one section) to the innermost
+    active span, summing with any value already recorded. Safe to call from several threads.
+    Does nothing when no trace is active.
+    """
+    record = _current_span.get()
+    if record is not None:
+        with _attributes_lock:
+            for key, value in counts.items():
+                record['attributes'][key] = record['attributes'].get(key, 0) + value
+
+
+def elapsed_ms():
+    """
+    Returns:
+    - float: Milliseconds since the innermost active span started, or 0.0 when no trace is active
+    """
+    record = _current_span.get()
+    if record is None:
+        return 0.0
+    return (time.perf_counter() - record['start']) * 1000
+
+
+def traced(name=None):
+    """
+    Decorator that records each call of the function as a span.
+
+    Parameters:
+    - name (str): Span name. Defaults to the function name.
+    """
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
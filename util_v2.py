@@ -1,53 +1,381 @@
 #!/usr/bin/env python
 # coding: utf-8
 import fitz # imports the pymupdf library
+import multiprocessing
+import os
 import re
+import asyncio
+import contextlib
+import contextvars
+import hashlib
+import json
+import queue
+import threading
 import warnings
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from multiprocessing import shared_memory
+
+import model_routing
+import pii_masking
+import prompt_registry
+import rate_limit
+import response_cache
+import token_budget
+import tracing
+
+
+# OpenAI client connection pool settings, shared by every section, document and session in the process
+OPENAI_MAX_CONNECTIONS = 20
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 10
+OPENAI_TIMEOUT_SECONDS = 60.0
+OPENAI_MAX_RETRIES = 0  # retries are handled by rate_limit.RequestScheduler
+
+_openai_clients = {}
+_openai_clients_lock = threading.Lock()
+
+# Async clients are tied to the event loop they were created on, so they are kept per loop object
+_async_openai_clients = {}
+
+# PDF pages are split across worker processes once a document has at least this many pages per worker
+PDF_EXTRACT_WORKERS = os.cpu_count() or 1
+PDF_MIN_PAGES_PER_WORKER = 8
+
+_pdf_process_pool = None
+_pdf_process_pool_lock = threading.Lock()
+
+# Compiled patterns, built once at import time
+NA_TEXT_PATTERN = re.compile(r"\b(n\s+a)\b", re.IGNORECASE)
+NON_ALPHA_PATTERN = re.compile(r'[^a-zA-Z]')
+SUMMARY_PATTERN = re.compile(r'^(.*?)Past medical', re.DOTALL | re.MULTILINE)
+PRONOUNS_LINE_PATTERN = r'\[-pronouns-\].*?(?=\n|$)'
+NAME_QUESTION_PATTERN = re.escape('1.\nName')
+
+# Shared "I am a medical professional..." opening sentence of the section prompts, stated once in batched requests
+PROMPT_PREAMBLE_PATTERN = re.compile(r'^\s*I am a medical professional[^.]*\.\s*', re.IGNORECASE)
+BATCHED_PROMPT_PREAMBLE = "I am a medical professional updating my patient's record."
+
+# Matches every intake form tag in one scan. The value after a field tag is captured in a lookahead,
+# so it does not consume text and a tag on the same line is still found.
+INTAKE_TAG_PATTERN = re.compile(r'\[-(name|age|gender|pronouns|enable start|enable end)-\](?=\s*(.*))')
+
+# Section headers in the intake form, in their expected order
+SECTION_HEADERS = [
+    "Past medical",
+    "Surgical history",
+    "Current medications",
+    "Allergies",
+    "Family History",
+    "Social History",
+    "Functional History"
+]
+
+# Matches any section header, case-insensitively. Group 1 is set when the header starts a line.
+SECTION_HEADER_PATTERN = re.compile(
+    r'(^[ \t]*)?(' + '|'.join(re.escape(header) for header in SECTION_HEADERS) + ')',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# Prompt file (prompts/default_<name>.txt) for each reworded section
+SECTION_PROMPT_NAMES = {
+    'questionaire': 'questionaire_prompt',
+    'icbc': 'icbc_prompt',
+    'summary': 'summary_prompt',
+    'past_medical': 'past_medical_prompt',
+    'surgical_history': 'surgical_history_prompt',
+    'current_meds': 'current_medication_prompt',
+    'allergies': 'allergies_prompt',
+    'fam_history': 'family_history_prompt',
+    'soc_history': 'social_history_prompt',
+    'func_history': 'functional_history_prompt'
+}
+
+# Sections taken from the intake form, in output order: (key, section header in the PDF, display header)
+DOCUMENT_SECTIONS = [
+    ('summary', None, '**Summary**'),
+    ('past_medical', 'past medical', '**Past Medical**'),
+    ('surgical_history', 'surgical history', '**Surgical History**'),
+    ('current_meds', 'current medications', '**Current Medication**'),
+    ('allergies', 'allergies', '**Allergies**'),
+    ('fam_history', 'family history', '**Family History**'),
+    ('soc_history', 'social history', '**Social History**'),
+    ('func_history', 'functional history', '**Functional History**')
+]
+
+
+def _page_main_text(page):
+    """
+    Text of one PDF page, excluding the header and footer blocks.
+
+    Args:
+        page (fitz.Page): PDF page
+
+    Returns:
+        string: Text blocks of the page joined by newlines
+    """
+    # Get the page dimensions
+    page_rect = page.rect
+    top_margin = page_rect.height * 0.1  # Assuming header is within top 10%
+    bottom_margin = page_rect.height * 0.95  # Assuming footer starts after bottom 90%
+
+    # Extract text blocks along with their rectangles
+    text_blocks = page.get_text("blocks")
+
+    # Filter out text blocks that are in the header or footer regions
+    main_content_blocks = [block for block in text_blocks if block[1] > top_margin and block[3] < bottom_margin]
+
+    # Concatenate the text of these blocks
+    return "\n".join([block[4] for block in main_content_blocks])
+
+
+def pdf_source(pdf_file):
+    """
+    Work out how to hand a PDF to PyMuPDF without copying its content.
+
+    Accepts a file path, a Streamlit UploadedFile or io.BytesIO (used through getbuffer()),
+    bytes, bytearray or memoryview, or a binary file object. Files on disk are passed to
+    PyMuPDF by path, so the document is never read into a Python bytes object.
+
+    Args:
+        pdf_file: PDF input in any of the accepted forms
+
+    Returns:
+        tuple: ('path', file path) or ('buffer', memoryview)
+    """
+    if isinstance(pdf_file, (str, os.PathLike)):
+        return 'path', os.fspath(pdf_file)
+    if isinstance(pdf_file, memoryview):
+        return 'buffer', pdf_file
+    if isinstance(pdf_file, (bytes, bytearray)):
+        return 'buffer', memoryview(pdf_file)
+    if hasattr(pdf_file, 'getbuffer'):
+        # io.BytesIO and Streamlit UploadedFile: view the existing buffer instead of read()
+        return 'buffer', pdf_file.getbuffer()
+
+    # Binary file opened from disk: let PyMuPDF read the file itself
+    file_name = getattr(pdf_file, 'name', None)
+    if isinstance(file_name, str) and os.path.isfile(file_name):
+        return 'path', file_name
+
+    return 'buffer', memoryview(pdf_file.read())
+
+
+def document_hash(pdf_file):
+    """
+    SHA-256 of a PDF's content, read without copying it (see pdf_source).
+
+    Args:
+        pdf_file: PDF input in any of the forms pdf_source accepts
+
+    Returns:
+        string: SHA-256 hex digest
+    """
+    source_kind, source = pdf_source(pdf_file)
+    digest = hashlib.sha256()
+    if source_kind == 'path':
+        with open(source, "rb") as file:
+            for block in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(block)
+    else:
+        digest.update(source)
+        # Release the view of an upload's buffer so the UploadedFile/BytesIO can be resized or closed again
+        if hasattr(pdf_file, 'getbuffer'):
+            source.release()
+    return digest.hexdigest()
+
+
+def open_pdf_document(source_kind, source):
+    """
+    Open a PDF from the result of pdf_source.
+
+    Args:
+        source_kind (string): 'path' or 'buffer'
+        source: File path, or a buffer (memoryview, bytes or bytearray)
 
+    Returns:
+        fitz.Document: Open PDF document
+    """
+    if source_kind == 'path':
+        return fitz.open(source, filetype="pdf")
+    return fitz.open(stream=source, filetype="pdf")
 
-def pdf_file_extract_text(pdf_file):
+
+def _extract_page_range_text(source_kind, source, start_page, stop_page):
     """
-    Extract text from a PDF file, excluding the headers and footers
+    Worker process task: open the PDF once and extract the text of pages start_page to stop_page - 1.
+
+    Args:
+        source_kind (string): 'path', 'buffer' or 'shared_memory'
+        source: File path, the PDF content, or (shared memory block name, size) for 'shared_memory'
+        start_page (int): First page number
+        stop_page (int): Page number after the last page
+
+    Returns:
+        list: Text of each page, in page order
+    """
+    shared = None
+    if source_kind == 'shared_memory':
+        # PyMuPDF reads the parent's copy of the PDF in place, nothing is copied into this process
+        shared_name, size = source
+        shared = shared_memory.SharedMemory(name=shared_name)
+        source_kind, source = 'buffer', shared.buf[:size]
+
+    doc = open_pdf_document(source_kind, source)
+    try:
+        return [_page_main_text(doc[page_number]) for page_number in range(start_page, stop_page)]
+    finally:
+        doc.close()
+        if shared is not None:
+            # Every view of the block must be released before it can be closed
+            del doc
+            source.release()
+            shared.close()
+
+
+def _get_pdf_process_pool():
+    """
+    Return the process pool shared by every PDF extraction in this process, creating it on first use.
+    Workers are spawned rather than forked because callers (Streamlit, the batch runner) are multi-threaded.
+    """
+    global _pdf_process_pool
+    with _pdf_process_pool_lock:
+        if _pdf_process_pool is None:
+            _pdf_process_pool = ProcessPoolExecutor(
+                max_workers=PDF_EXTRACT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+    return _pdf_process_pool
+
+
+def _discard_pdf_process_pool(pool):
+    """
+    Drop a broken process pool so the next extraction creates a new one. A pool whose worker died
+    (killed, out of memory) fails every later submit with BrokenProcessPool.
+    Another thread may already have replaced it, in which case the new pool is kept.
+    """
+    global _pdf_process_pool
+    with _pdf_process_pool_lock:
+        if _pdf_process_pool is pool:
+            _pdf_process_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _extract_page_ranges_text(source_kind, source, page_ranges):
+    """
+    Extract the page ranges in the shared process pool and return their page texts in page order.
+    If the pool is broken it is replaced and the extraction retried once; if the new pool breaks
+    as well, the ranges are extracted in this process.
+    """
+    for attempt in range(2):
+        pool = _get_pdf_process_pool()
+        try:
+            futures = [pool.submit(_extract_page_range_text, source_kind, source, start, stop) for start, stop in page_ranges]
+            return [page_text for future in futures for page_text in future.result()]
+        except BrokenProcessPool:
+            _discard_pdf_process_pool(pool)
+    return [page_text for start, stop in page_ranges for page_text in _extract_page_range_text(source_kind, source, start, stop)]
+
+
+def pdf_file_extract_text(pdf_file, max_workers=None):
+    """
+    Extract text from a PDF file, excluding the headers and footers.
+    Long documents are split into page ranges that are extracted in parallel worker processes,
+    each of which opens the document once. The result is the same as extracting page by page.
     
     Args:
-        pdf_file (string): PDF file path
+        pdf_file: PDF file path, Streamlit UploadedFile, bytes/memoryview or binary file object (see pdf_source)
+        max_workers (int): Maximum number of worker processes. Defaults to PDF_EXTRACT_WORKERS, 1 extracts in this process.
     
     Returns:
         string: Extracted text from PDF file, excluding the headers and footers
     """
-    doc = fitz.open(stream=pdf_file.read(), filetype="pdf")  # Open the PDF
-    extracted_text = ""
+    with tracing.span("pdf_file_extract_text") as span_attributes:
+        extracted_text = _pdf_extract_text(pdf_file, max_workers, span_attributes)
+    return extracted_text
+
+
+def _pdf_extract_text(pdf_file, max_workers, span_attributes):
+    """
+    Body of pdf_file_extract_text, recording the source size, page count and worker count in span_attributes.
+    """
+    source_kind, source = pdf_source(pdf_file)
+    doc = open_pdf_document(source_kind, source)  # Open the PDF
+    page_count = doc.page_count
+
+    if max_workers is None:
+        max_workers = PDF_EXTRACT_WORKERS
+    workers = max(1, min(max_workers, PDF_EXTRACT_WORKERS, page_count // PDF_MIN_PAGES_PER_WORKER))
+    span_attributes.update(
+        source=source_kind,
+        bytes=os.path.getsize(source) if source_kind == 'path' else source.nbytes,
+        pages=page_count,
+        workers=workers
+    )
 
-    for page in doc:  # Iterate through each page
-        # Get the page dimensions
-        page_rect = page.rect
-        top_margin = page_rect.height * 0.1  # Assuming header is within top 10%
-        bottom_margin = page_rect.height * 0.95  # Assuming footer starts after bottom 90%
+    if workers == 1:
+        page_texts = [_page_main_text(page) for page in doc]
+        doc.close()
+    else:
+        doc.close()
+
+        # Contiguous page ranges, one per worker, collected back in page order
+        pages_per_worker = -(-page_count // workers)
+        page_ranges = [(start, min(start + pages_per_worker, page_count)) for start in range(0, page_count, pages_per_worker)]
 
-        # Extract text blocks along with their rectangles
-        text_blocks = page.get_text("blocks")
+        # Workers open files on disk by path themselves. Buffers are copied once into a shared
+        # memory block that every worker reads in place, instead of being sent to each worker.
+        shared = None
+        worker_source_kind, worker_source = source_kind, source
+        if source_kind == 'buffer':
+            shared = shared_memory.SharedMemory(create=True, size=source.nbytes)
+            shared.buf[:source.nbytes] = source.cast('B')
+            worker_source_kind, worker_source = 'shared_memory', (shared.name, source.nbytes)
 
-        # Filter out text blocks that are in the header or footer regions
-        main_content_blocks = [block for block in text_blocks if block[1] > top_margin and block[3] < bottom_margin]
+        try:
+            page_texts = _extract_page_ranges_text(worker_source_kind, worker_source, page_ranges)
+        finally:
+            if shared is not None:
+                shared.close()
+                shared.unlink()
 
-        # Concatenate the text of these blocks
-        page_text = "\n".join([block[4] for block in main_content_blocks])
-        extracted_text += page_text + "\n"
+    # Release the view of an upload's buffer so the UploadedFile/BytesIO can be resized or closed again
+    if source_kind == 'buffer' and hasattr(pdf_file, 'getbuffer'):
+        source.release()
 
-    # Remove the specific string " SUMMARY" from the extracted text
-    extracted_text = extracted_text.replace(" SUMMARY", "")
+    extracted_text = "".join([page_text + "\n" for page_text in page_texts])
 
-    # Define the regular expression pattern for " n a "
-    pattern = r"\b(n\s+a)\b"
+    # Remove the specific string " SUMMARY" from the extracted text
+    extracted_text = extracted_text.replace(" SUMMARY", "")
 
-    # Perform case-insensitive replacement using re.sub()
-    extracted_text = re.sub(pattern, "N/A", extracted_text, flags=re.IGNORECASE)
+    # Replace " n a " with "N/A" (case-insensitive)
+    extracted_text = NA_TEXT_PATTERN.sub("N/A", extracted_text)
 
-    doc.close()
+    span_attributes['chars'] = len(extracted_text)
     return extracted_text
 
 
-def extract_patient_info(pdf_text):
+@tracing.traced()
+def scan_intake_tags(pdf_text):
+    """
+    Find the intake form tags in a single scan of the text:
+    [-name-], [-age-], [-gender-], [-pronouns-], [-enable start-] and [-enable end-]
+
+    Args:
+        pdf_text (string): PDF string text
+    
+    Returns:
+        dict: The first match for each tag found, keyed by tag name (e.g. 'name', 'enable start').
+        match.group(2) is the value after the tag, match.start()/match.end() its position.
+    """
+    tags = {}
+    for match in INTAKE_TAG_PATTERN.finditer(pdf_text):
+        tags.setdefault(match.group(1), match)
+    return tags
+
+
+@tracing.traced()
+def extract_patient_info(pdf_text, tags=None):
     """
     Extract Name, Age, Gender, and Pronoun from text. They are values that exist after header fields, as shown below.
     
@@ -59,38 +387,24 @@ def extract_patient_info(pdf_text):
     
     Args:
         pdf_text (string): PDF string text
+        tags (dict): Result of scan_intake_tags, if already computed
     
     Returns:
         tuple: A tuple containing values for name, age, gender, and pronouns fields. If a field is not found, a blank space is returned for that field.
     """
-    patterns = {
-        'name': r'\[-name-\]\s*(.*)',
-        'age': r'\[-age-\]\s*(.*)',
-        'gender': r'\[-gender-\]\s*(.*)',
-        'pronouns': r'\[-pronouns-\]\s*(.*)'
-    }    
-    
-    # Initialize variables for each field
-    name = age = gender = pronouns = ""
-
-    # Iterate through each field pattern
-    for field, pattern in patterns.items():
-        match = re.search(pattern, pdf_text)
-        if match:
-            # Assign value to corresponding variable based on the field
-            if field == "name":
-                name = match.group(1)
-            elif field == "age":
-                age = match.group(1)
-            elif field == "gender":
-                gender = match.group(1)
-            elif field == "pronouns":
-                pronouns = match.group(1)
-    
+    if tags is None:
+        tags = scan_intake_tags(pdf_text)
+
+    name, age, gender, pronouns = (
+        tags[field].group(2) if field in tags else ""
+        for field in ("name", "age", "gender", "pronouns")
+    )
+
     # Return values for each field
     return name, age, gender, pronouns
 
 
+@tracing.traced()
 def extract_occupation(pdf_text):
     """
     Extract occuption from 35.1
@@ -112,6 +426,7 @@ def extract_occupation(pdf_text):
         return ''
 
 
+@tracing.traced()
 def extract_employer(pdf_text):
     """
     Extract employer from 35.2
@@ -133,6 +448,7 @@ def extract_employer(pdf_text):
         return ''
 
 
+@tracing.traced()
 def extract_live_with_people(pdf_text):
     """
     Extract employer from 31.1
@@ -154,6 +470,7 @@ def extract_live_with_people(pdf_text):
         return ''
 
 
+@tracing.traced()
 def extract_text_between_markers(pdf_text, start_marker, end_marker):
     """
     Extracts text between two specified markers in a given text.
@@ -171,20 +488,15 @@ def extract_text_between_markers(pdf_text, start_marker, end_marker):
     end_marker_escaped = re.escape(end_marker)
 
     # If start marker does not exist, default to after Pronouns
-    start_match = re.search(start_marker_escaped, pdf_text, re.DOTALL)
-    if start_match is None:
-        start_marker_escaped = r'\[-pronouns-\].*?(?=\n|$)'
+    if start_marker not in pdf_text:
+        start_marker_escaped = PRONOUNS_LINE_PATTERN
 
     # If end marker does not exist, default to 1. Name
-    end_match = re.search(end_marker_escaped, pdf_text, re.DOTALL)
-    if end_match is None:
-        end_marker_escaped = re.escape('1.\nName')
-    
-    # Regular expression to find text between markers
-    pattern = rf'{start_marker_escaped}(.*?){end_marker_escaped}'
+    if end_marker not in pdf_text:
+        end_marker_escaped = NAME_QUESTION_PATTERN
 
     # Using re.DOTALL to make '.' match newlines as well
-    match = re.search(pattern, pdf_text, re.DOTALL)
+    match = _between_markers_pattern(start_marker_escaped, end_marker_escaped).search(pdf_text)
 
     if match:
         # Extracted text between the markers
@@ -193,6 +505,39 @@ def extract_text_between_markers(pdf_text, start_marker, end_marker):
         return ""  # Return an empty string if no text is found between the markers
 
 
+@lru_cache(maxsize=32)
+def _between_markers_pattern(start_marker_escaped, end_marker_escaped):
+    """
+    Compile (once per marker pair) the pattern that finds text between two markers.
+    """
+    return re.compile(rf'{start_marker_escaped}(.*?){end_marker_escaped}', re.DOTALL)
+
+
+@tracing.traced()
+def extract_enable_text(pdf_text, tags=None):
+    """
+    Extract the text between [-enable start-] and [-enable end-].
+    Same result as extract_text_between_markers(pdf_text, '[-enable start-]', '[-enable end-]'),
+    but reuses the tag positions from scan_intake_tags when both markers are present.
+
+    Parameters:
+    - pdf_text (str): PDF text to search within.
+    - tags (dict): Result of scan_intake_tags, if already computed
+
+    Returns:
+    - string: The extracted text between the markers
+    """
+    if tags is None:
+        tags = scan_intake_tags(pdf_text)
+
+    start_match = tags.get('enable start')
+    end_match = tags.get('enable end')
+    if start_match is not None and end_match is not None and end_match.start() >= start_match.end():
+        return pdf_text[start_match.end():end_match.start()].strip()
+
+    return extract_text_between_markers(pdf_text, '[-enable start-]', '[-enable end-]')
+
+
 def check_required_headers_exist(text):
     """
     Checks if at least 5 out of 7 specified headers are present in the given text string.
@@ -203,23 +548,55 @@ def check_required_headers_exist(text):
     Returns:
     bool: True if at least 5 headers are found, False otherwise.
     """
-    headers = [
-        "Past medical",
-        "Surgical history",
-        "Current medications",
-        "Allergies",
-        "Family History",
-        "Social History",
-        "Functional History"
-    ]
-
     # Count the number of headers present in the text
-    headers_found = sum(1 for header in headers if header.lower() in text.lower())
+    headers_found = len(split_sections(text))
 
     # Return True if at least 5 headers are found, otherwise return False
     return headers_found >= 5
 
 
+@tracing.traced()
+def split_sections(text_between_markers):
+    """
+    Split the text into sections in a single pass over the text.
+    Headers are matched case-insensitively and may appear in any order. When a header appears more
+    than once, its first occurrence at the start of a line is used (falling back to its first occurrence
+    anywhere), so a mention like "no known allergies" inside another section does not split it.
+    Each section runs until the next header.
+
+    Parameters:
+    - text_between_markers (str): Text between markers.
+
+    Returns:
+    - dict: Section text keyed by lower case section header (e.g. "past medical"). Missing sections are not included.
+    """
+    first_match = {}
+    first_line_start_match = {}
+
+    for match in SECTION_HEADER_PATTERN.finditer(text_between_markers):
+        header = match.group(2).lower()
+        if header not in first_match:
+            first_match[header] = match
+        if match.group(1) is not None and header not in first_line_start_match:
+            first_line_start_match[header] = match
+
+    header_matches = sorted(
+        ((header, first_line_start_match.get(header, match)) for header, match in first_match.items()),
+        key=lambda item: item[1].start(2)
+    )
+
+    sections = {}
+    for i, (header, match) in enumerate(header_matches):
+        if i + 1 < len(header_matches):
+            end_index = header_matches[i + 1][1].start(2)
+        else:
+            end_index = len(text_between_markers)
+        sections[header] = text_between_markers[match.end(2):end_index].strip()
+
+    return sections
+
+
+@tracing.traced()
 def extract_summary_text(text_between_markers):
     """
     Extract summary text, which is all text before the "Past Medical" section.
@@ -230,7 +607,7 @@ def extract_summary_text(text_between_markers):
     Returns:
     - string: The extracted text before the "Past Medical" section.
     """
-    result = re.search(r'^(.*?)Past medical', text_between_markers, re.DOTALL | re.MULTILINE)
+    result = SUMMARY_PATTERN.search(text_between_markers)
     
     summary_text = result.group(1)
     
@@ -248,41 +625,22 @@ def extract_section_text(text_between_markers, section_header):
     - Social History
     - Functional History
 
+    Use split_sections to get every section from one pass over the text.
+
     Parameters:
     - text_between_markers (str): Text between markers.
     - section_header (str): The section header to search for.
 
     Returns:
-    - string: The extracted text under the specified section header.
+    - string: The extracted text under the specified section header, or None if the header is not found.
     """
-    sections = [
-        "Past medical", "Surgical history", "Current medications", 
-        "Allergies", "Family History", "Social History", "Functional History"
-    ]
-    
-    section_header_lower = section_header.lower()
-    
-    start_index = -1
-    for i, section in enumerate(sections):
-        if section_header_lower == section.lower():
-            start_index = text_between_markers.find(section)
-            break
-    
-    if start_index == -1:
-        return None
-    
-    end_index = len(text_between_markers)
-    for section in sections[i+1:]:
-        section_index = text_between_markers.find(section, start_index + len(section_header))
-        if section_index != -1 and section_index < end_index:
-            end_index = section_index
-    
-    return text_between_markers[start_index + len(section_header):end_index].strip()
+    return split_sections(text_between_markers).get(section_header.lower())
 
 
 def load_default_text(section_header):
     """
-    Load the default text from the corresponding file.
+    Load the default text from the corresponding file. The text comes from the in-memory prompt
+    registry, which only reads the file again when it changes on disk.
 
     Parameters:
     - section_header (str): The input string used to construct the filename.
@@ -290,35 +648,42 @@ def load_default_text(section_header):
     Returns:
     - str: The default text loaded from the file.
     """
-    filename = f"prompts/default_{section_header}.txt"
-    with open(filename, "r") as file:
-        default_text = file.read()
-    return default_text
+    return prompt_registry.get_registry().get_text(section_header)
+
+
+def load_default_prompts():
+    """
+    Load the default prompt for every reworded section.
+
+    Returns:
+    - dict: Prompt text keyed by section key (see SECTION_PROMPT_NAMES)
+    """
+    return {key: load_default_text(name) for key, name in SECTION_PROMPT_NAMES.items()}
+
+
+def default_prompt_versions():
+    """
+    Version label of the default prompt for every reworded section, for recording which prompts produced an output.
+
+    Returns:
+    - dict: Version label (see prompt_registry.PromptRegistry.get_version) keyed by section key
+    """
+    registry = prompt_registry.get_registry()
+    return {key: registry.get_version(name) for key, name in SECTION_PROMPT_NAMES.items()}
 
 
 def contains_pii(input_string):
     """
-    Checks if the input string contains any of the specified keywords.
+    Checks if the input string describes people by relationship (e.g. "wife and son") rather than
+    naming them, see pii_masking.RELATIONSHIP_KEYWORDS.
 
     Args:
     input_string (str): The input string to be checked.
 
     Returns:
-    bool: True if the input string contains any of the specified keywords, False otherwise.
+    bool: True if the input string contains any of the keywords, False otherwise.
     """
-    # Define the list of keywords
-    keywords = ["common law", "self employ", "wife", "husband", "partner",
-                "son", "daughter", "child", "baby", "girl", "boy"]
-    
-    # Convert input string to lowercase for case-insensitive comparison
-    input_lower = input_string.lower()
-
-    # Check if any of the keywords are present in the input string
-    for keyword in keywords:
-        if keyword in input_lower:
-            return True
-    
-    return False
+    return pii_masking.contains_relationship_keyword(input_string)
 
 
 def is_na_string(text):
@@ -336,42 +701,373 @@ def is_na_string(text):
         return True
     else:
         # Remove non-alphabetic characters using regular expression
-        text_alpha = re.sub(r'[^a-zA-Z]', '', text)
+        text_alpha = NON_ALPHA_PATTERN.sub('', text)
         na_patterns = ["none", "no", "na", "n", ""]
         return text_alpha.lower() in na_patterns
 
 
-def call_chatgpt(prompt, api_key, model, temperature):
+def get_openai_client(api_key, base_url=None, max_connections=OPENAI_MAX_CONNECTIONS,
+                      max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS, timeout=OPENAI_TIMEOUT_SECONDS):
     """
-    Call ChatGPT
+    Return a shared OpenAI client for the given API key and base URL.
+    Clients are created once and cached for the life of the process, so keep-alive
+    connections (and their TLS sessions) are reused across sections, documents and sessions.
+
+    Args:
+        api_key (string): OpenAI API key
+        base_url (string): Alternative API base URL. None uses the OpenAI default.
+        max_connections (int): Maximum number of open connections in the pool
+        max_keepalive_connections (int): Maximum number of idle connections kept alive
+        timeout (float): Request timeout in seconds
+
+    Returns:
+        OpenAI: Cached client
+    """
+    client_key = (api_key, base_url, max_connections, max_keepalive_connections, timeout)
+
+    with _openai_clients_lock:
+        client = _openai_clients.get(client_key)
+        if client is None:
+            import httpx
+            from openai import OpenAI
+
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections),
+                timeout=timeout
+            )
+            client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=OPENAI_MAX_RETRIES, http_client=http_client)
+            _openai_clients[client_key] = client
+
+    return client
+
+
+def get_async_openai_client(api_key, base_url=None, max_connections=OPENAI_MAX_CONNECTIONS,
+                            max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS, timeout=OPENAI_TIMEOUT_SECONDS):
+    """
+    Return a shared AsyncOpenAI client for the given API key and base URL on the running event loop.
+    Same pooling as get_openai_client, for async callers such as api_service.
+
+    Args:
+        api_key (string): OpenAI API key
+        base_url (string): Alternative API base URL. None uses the OpenAI default.
+        max_connections (int): Maximum number of open connections in the pool
+        max_keepalive_connections (int): Maximum number of idle connections kept alive
+        timeout (float): Request timeout in seconds
+
+    Returns:
+        AsyncOpenAI: Cached client
+    """
+    client_key = (api_key, base_url, max_connections, max_keepalive_connections, timeout)
+
+    with _openai_clients_lock:
+        # Clients of closed loops are dropped, so a loop per call (asyncio.run) does not pile up
+        # clients. Keyed by the loop itself, which the dict keeps alive, so a new loop never gets
+        # a client bound to a closed one through a reused id.
+        for closed_loop in [loop for loop in _async_openai_clients if loop.is_closed()]:
+            del _async_openai_clients[closed_loop]
+        loop_clients = _async_openai_clients.setdefault(asyncio.get_running_loop(), {})
+        client = loop_clients.get(client_key)
+        if client is None:
+            import httpx
+            from openai import AsyncOpenAI
+
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive_connections),
+                timeout=timeout
+            )
+            client = AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=OPENAI_MAX_RETRIES, http_client=http_client)
+            loop_clients[client_key] = client
+
+    return client
+
+
+def build_chat_messages(prompt):
+    """
+    Chat messages sent to ChatGPT for a prompt
     
     Args:
         prompt (string): prompt to pass to ChatGPT API
     
     Returns:
-        string: Response from ChatGPT
+        list: Messages for the chat completions API
     """
-    from openai import OpenAI
-    
-    client = OpenAI(api_key=api_key)
-    
     messages = [
         {
             "role": "user",
             "content": prompt,
         }
     ]
+    return messages
 
-    response = client.chat.completions.create(
-        model=model,
-        messages=messages,
-        temperature=temperature
-    )
+
+def build_section_prompt(prompt, section_text):
+    """
+    Full ChatGPT prompt for one section: the section instructions followed by the section text
+
+    Args:
+        prompt (string): The ChatGPT prompt (instructions)
+        section_text (string): Section Text to be reworded
+
+    Returns:
+        string: Prompt to pass to ChatGPT API
+    """
+    return "INSTRUCTIONS:\n\n" + prompt + "\n\nGIVEN INFORMATION:\n\n" + section_text
+
+
+def build_section_prompts(model, prompt, section_text):
+    """
+    ChatGPT prompts for one section: a single prompt, or one prompt per chunk of the section text
+    when the whole section does not fit the model's prompt budget (see token_budget.prompt_token_budget).
+    The reworded chunks are joined with newlines, in order.
+
+    Args:
+        model (string): ChatGPT model
+        prompt (string): The ChatGPT prompt (instructions)
+        section_text (string): Section Text to be reworded
+
+    Returns:
+        list: Prompts to pass to ChatGPT API, in section order
+    """
+    return build_section_prompts_with_counts(model, prompt, section_text)[0]
+
+
+def build_section_prompts_with_counts(model, prompt, section_text):
+    """
+    build_section_prompts, also returning the prompts' token count as counted while splitting the section.
+
+    Returns:
+        tuple: (prompts, total prompt tokens)
+    """
+    instructions_tokens = token_budget.count_tokens(build_section_prompt(prompt, ''), model)
+    chunks, chunk_tokens = token_budget.split_text_with_counts(section_text, token_budget.prompt_token_budget(model) - instructions_tokens, model)
+    chatgpt_prompts = [build_section_prompt(prompt, chunk) for chunk in chunks]
+    return chatgpt_prompts, instructions_tokens * len(chunks) + sum(chunk_tokens)
+
+
+def _prompt_size_attributes(chatgpt_prompts, prompt_tokens):
+    """
+    Span attributes describing the prompts of one section, measured before they are sent.
+    Empty when no trace is active, so untraced calls skip the measuring.
+    """
+    if not tracing.is_active():
+        return {}
+    return {
+        'prompt_bytes': sum(len(chatgpt_prompt.encode('utf-8')) for chatgpt_prompt in chatgpt_prompts),
+        'counted_prompt_tokens': prompt_tokens,
+        'chunks': len(chatgpt_prompts)
+    }
+
+
+def call_chatgpt(prompt, api_key, model, temperature, base_url=None, response_format=None):
+    """
+    Call ChatGPT
+    
+    Args:
+        prompt (string): prompt to pass to ChatGPT API
+        base_url (string): Alternative API base URL. None uses the OpenAI default.
+        response_format (dict): Optional response format, e.g. {"type": "json_object"}
+    
+    Returns:
+        string: Response from ChatGPT
+    """
+    client = get_openai_client(api_key, base_url)
+    
+    messages = build_chat_messages(prompt)
+
+    options = {}
+    if response_format is not None:
+        options['response_format'] = response_format
+
+    def send(timeout):
+        return client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            timeout=timeout,
+            **options
+        )
+
+    # Rate limited, retried on 429/5xx, and bounded by a deadline
+    scheduler = rate_limit.get_scheduler()
+    estimated_tokens = token_budget.estimate_request_tokens(prompt, model)
+    response = scheduler.run(send, estimated_tokens)
+
+    if response.usage is not None:
+        scheduler.token_bucket.adjust(response.usage.total_tokens - estimated_tokens)
+        tracing.add_to_attributes(prompt_tokens=response.usage.prompt_tokens, completion_tokens=response.usage.completion_tokens)
+
+    response_message = response.choices[0].message.content
+    return response_message
+
+def call_chatgpt_stream(prompt, api_key, model, temperature, base_url=None):
+    """
+    Call ChatGPT and yield the response as it is generated
+    
+    Args:
+        prompt (string): prompt to pass to ChatGPT API
+        base_url (string): Alternative API base URL. None uses the OpenAI default.
+    
+    Yields:
+        string: Response tokens from ChatGPT, in order
+    """
+    client = get_openai_client(api_key, base_url)
+    
+    messages = build_chat_messages(prompt)
+
+    def send(timeout):
+        return client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=timeout
+        )
+
+    # Only opening the stream is retried; the request slot is held until the stream is read or closed
+    scheduler = rate_limit.get_scheduler()
+    estimated_tokens = token_budget.estimate_request_tokens(prompt, model)
+
+    for chunk in scheduler.run_stream(send, estimated_tokens):
+        if len(chunk.choices) > 0 and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+        if chunk.usage is not None:
+            scheduler.token_bucket.adjust(chunk.usage.total_tokens - estimated_tokens)
+            tracing.add_to_attributes(prompt_tokens=chunk.usage.prompt_tokens, completion_tokens=chunk.usage.completion_tokens)
+
+
+async def call_chatgpt_async(prompt, api_key, model, temperature, base_url=None, response_format=None):
+    """
+    Call ChatGPT without blocking the event loop. Same as call_chatgpt, under the same rate limits.
+    
+    Args:
+        prompt (string): prompt to pass to ChatGPT API
+        base_url (string): Alternative API base URL. None uses the OpenAI default.
+        response_format (dict): Optional response format, e.g. {"type": "json_object"}
+    
+    Returns:
+        string: Response from ChatGPT
+    """
+    client = get_async_openai_client(api_key, base_url)
+    
+    messages = build_chat_messages(prompt)
+
+    options = {}
+    if response_format is not None:
+        options['response_format'] = response_format
+
+    async def send(timeout):
+        return await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            timeout=timeout,
+            **options
+        )
+
+    scheduler = rate_limit.get_scheduler()
+    estimated_tokens = token_budget.estimate_request_tokens(prompt, model)
+    response = await scheduler.run_async(send, estimated_tokens)
+
+    if response.usage is not None:
+        scheduler.token_bucket.adjust(response.usage.total_tokens - estimated_tokens)
+        tracing.add_to_attributes(prompt_tokens=response.usage.prompt_tokens, completion_tokens=response.usage.completion_tokens)
 
     response_message = response.choices[0].message.content
     return response_message
 
-def reword_section_text(api_key, model, temperature, prompt, section_header, section_text):
+async def call_chatgpt_stream_async(prompt, api_key, model, temperature, base_url=None):
+    """
+    Call ChatGPT and yield the response as it is generated, without blocking the event loop.
+    
+    Args:
+        prompt (string): prompt to pass to ChatGPT API
+        base_url (string): Alternative API base URL. None uses the OpenAI default.
+    
+    Yields:
+        string: Response tokens from ChatGPT, in order
+    """
+    client = get_async_openai_client(api_key, base_url)
+    
+    messages = build_chat_messages(prompt)
+
+    async def send(timeout):
+        return await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=timeout
+        )
+
+    # Only opening the stream is retried; the request slot is held until the stream is read or closed
+    scheduler = rate_limit.get_scheduler()
+    estimated_tokens = token_budget.estimate_request_tokens(prompt, model)
+
+    # Closed explicitly, so the slot is released as soon as this generator is closed, not when it is garbage collected
+    async with contextlib.aclosing(scheduler.run_stream_async(send, estimated_tokens)) as stream:
+        async for chunk in stream:
+            if len(chunk.choices) > 0 and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if chunk.usage is not None:
+                scheduler.token_bucket.adjust(chunk.usage.total_tokens - estimated_tokens)
+                tracing.add_to_attributes(prompt_tokens=chunk.usage.prompt_tokens, completion_tokens=chunk.usage.completion_tokens)
+
+
+def _section_span(model, temperature, section_header, chatgpt_prompts, prompt_tokens, stream=False):
+    """
+    Trace span of one reworded section, with the size of its prompts.
+    """
+    attributes = _prompt_size_attributes(chatgpt_prompts, prompt_tokens)
+    if stream:
+        attributes['stream'] = True
+    return tracing.span("reword_section_text", section=section_header.strip('*'), model=model, temperature=temperature, **attributes)
+
+
+def _section_cache_key(model, temperature, prompt, section_text, base_url, use_cache):
+    """
+    Response cache key of a section, or None if its response is not cached.
+    Responses at temperature > 0 are meant to vary, so they are never cached.
+    """
+    if use_cache and temperature == 0:
+        return response_cache.make_cache_key(model, temperature, prompt, section_text, base_url)
+    return None
+
+
+def _get_section_response(cache_key, span_attributes):
+    """
+    Cached response of a section, recording the hit or miss in span_attributes.
+
+    Returns:
+    - string: The cached response, or None if there is none or cache_key is None
+    """
+    if cache_key is None:
+        return None
+    chatgpt_response = response_cache.get_cached_response(cache_key)
+    span_attributes['cache_hit'] = chatgpt_response is not None
+    return chatgpt_response
+
+
+def _set_section_response(cache_key, chatgpt_response, span_attributes):
+    """
+    Record the size of a section's response in span_attributes, and cache it if cache_key is set.
+    """
+    span_attributes['response_bytes'] = len(chatgpt_response.encode('utf-8'))
+    if cache_key is not None:
+        response_cache.set_cached_response(cache_key, chatgpt_response)
+
+
+def _add_stream_token(tokens, token, span_attributes):
+    """
+    Collect a streamed token, recording the time to the first one in span_attributes.
+    """
+    if len(tokens) == 0:
+        span_attributes['first_token_ms'] = round(tracing.elapsed_ms(), 1)
+    tokens.append(token)
+
+
+def reword_section_text(api_key, model, temperature, prompt, section_header, section_text, base_url=None, use_cache=True):
     """
     Reword section text using ChatGPT
 
@@ -381,13 +1077,669 @@ def reword_section_text(api_key, model, temperature, prompt, section_header, sec
     - prompt (str): The ChatGPT prompt.
     - section_header (str): Section Header Text
     - section_text (str): Section Text to be reworded
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - use_cache (bool): Reuse a cached response for unchanged sections. Only temperature 0 responses are cached.
 
     Returns:
     - string: The reworded output from ChatPGT
     """
     if is_na_string(section_text) == True:
         return f"{section_header}:\nN/A"
-    else:
-        chatgpt_prompt = "INSTRUCTIONS:\n\n" + prompt + "\n\nGIVEN INFORMATION:\n\n" + section_text
-        chatgpt_response = call_chatgpt(chatgpt_prompt, api_key, model, temperature)
-        return f"{section_header}:\n" + chatgpt_response
+
+    chatgpt_prompts, prompt_tokens = build_section_prompts_with_counts(model, prompt, section_text)
+
+    with _section_span(model, temperature, section_header, chatgpt_prompts, prompt_tokens) as span_attributes:
+        cache_key = _section_cache_key(model, temperature, prompt, section_text, base_url, use_cache)
+        chatgpt_response = _get_section_response(cache_key, span_attributes)
+        if chatgpt_response is not None:
+            return f"{section_header}:\n" + chatgpt_response
+
+        if len(chatgpt_prompts) == 1:
+            chatgpt_response = call_chatgpt(chatgpt_prompts[0], api_key, model, temperature, base_url)
+        else:
+            # Section too long for one request: reword its chunks at the same time and join them in order
+            with ThreadPoolExecutor(max_workers=len(chatgpt_prompts)) as executor:
+                futures = [
+                    executor.submit(contextvars.copy_context().run, call_chatgpt, chatgpt_prompt, api_key, model, temperature, base_url)
+                    for chatgpt_prompt in chatgpt_prompts
+                ]
+                chatgpt_response = "\n".join(future.result() for future in futures)
+
+        _set_section_response(cache_key, chatgpt_response, span_attributes)
+
+    return f"{section_header}:\n" + chatgpt_response
+
+
+def reword_section_text_stream(api_key, model, temperature, prompt, section_header, section_text, base_url=None, use_cache=True):
+    """
+    Reword section text using ChatGPT, yielding the output as it arrives.
+    Joining everything yielded gives the same string reword_section_text returns.
+
+    Parameters:
+    - api_key
+    - model
+    - prompt (str): The ChatGPT prompt.
+    - section_header (str): Section Header Text
+    - section_text (str): Section Text to be reworded
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - use_cache (bool): Reuse a cached response for unchanged sections. Only temperature 0 responses are cached.
+
+    Yields:
+    - string: The section header, then the reworded output from ChatGPT token by token
+    """
+    yield f"{section_header}:\n"
+
+    if is_na_string(section_text) == True:
+        yield "N/A"
+        return
+
+    chatgpt_prompts, prompt_tokens = build_section_prompts_with_counts(model, prompt, section_text)
+
+    with _section_span(model, temperature, section_header, chatgpt_prompts, prompt_tokens, stream=True) as span_attributes:
+        cache_key = _section_cache_key(model, temperature, prompt, section_text, base_url, use_cache)
+        chatgpt_response = _get_section_response(cache_key, span_attributes)
+        if chatgpt_response is not None:
+            yield chatgpt_response
+            return
+
+        # Chunks of a section too long for one request are streamed one after another
+        tokens = []
+        for i, chatgpt_prompt in enumerate(chatgpt_prompts):
+            if i > 0:
+                tokens.append("\n")
+                yield "\n"
+            for token in call_chatgpt_stream(chatgpt_prompt, api_key, model, temperature, base_url):
+                _add_stream_token(tokens, token, span_attributes)
+                yield token
+
+        _set_section_response(cache_key, "".join(tokens), span_attributes)
+
+
+async def reword_section_text_async(api_key, model, temperature, prompt, section_header, section_text, base_url=None, use_cache=True):
+    """
+    Async version of reword_section_text. The response cache (local SQLite) is read and
+    written in a thread so the event loop is never blocked on disk.
+
+    Parameters:
+    - api_key
+    - model
+    - prompt (str): The ChatGPT prompt.
+    - section_header (str): Section Header Text
+    - section_text (str): Section Text to be reworded
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - use_cache (bool): Reuse a cached response for unchanged sections. Only temperature 0 responses are cached.
+
+    Returns:
+    - string: The reworded output from ChatPGT
+    """
+    if is_na_string(section_text) == True:
+        return f"{section_header}:\nN/A"
+
+    # Token counting (and loading the encoding on first use) would block the event loop
+    chatgpt_prompts, prompt_tokens = await asyncio.to_thread(build_section_prompts_with_counts, model, prompt, section_text)
+
+    with _section_span(model, temperature, section_header, chatgpt_prompts, prompt_tokens) as span_attributes:
+        cache_key = _section_cache_key(model, temperature, prompt, section_text, base_url, use_cache)
+        chatgpt_response = await asyncio.to_thread(_get_section_response, cache_key, span_attributes)
+        if chatgpt_response is not None:
+            return f"{section_header}:\n" + chatgpt_response
+
+        # A section too long for one request has its chunks reworded at the same time, joined in order
+        chatgpt_response = "\n".join(await asyncio.gather(*[
+            call_chatgpt_async(chatgpt_prompt, api_key, model, temperature, base_url)
+            for chatgpt_prompt in chatgpt_prompts
+        ]))
+
+        await asyncio.to_thread(_set_section_response, cache_key, chatgpt_response, span_attributes)
+
+    return f"{section_header}:\n" + chatgpt_response
+
+
+async def reword_section_text_stream_async(api_key, model, temperature, prompt, section_header, section_text, base_url=None, use_cache=True):
+    """
+    Async version of reword_section_text_stream.
+
+    Parameters:
+    - api_key
+    - model
+    - prompt (str): The ChatGPT prompt.
+    - section_header (str): Section Header Text
+    - section_text (str): Section Text to be reworded
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - use_cache (bool): Reuse a cached response for unchanged sections. Only temperature 0 responses are cached.
+
+    Yields:
+    - string: The section header, then the reworded output from ChatGPT token by token
+    """
+    yield f"{section_header}:\n"
+
+    if is_na_string(section_text) == True:
+        yield "N/A"
+        return
+
+    # Token counting (and loading the encoding on first use) would block the event loop
+    chatgpt_prompts, prompt_tokens = await asyncio.to_thread(build_section_prompts_with_counts, model, prompt, section_text)
+
+    with _section_span(model, temperature, section_header, chatgpt_prompts, prompt_tokens, stream=True) as span_attributes:
+        cache_key = _section_cache_key(model, temperature, prompt, section_text, base_url, use_cache)
+        chatgpt_response = await asyncio.to_thread(_get_section_response, cache_key, span_attributes)
+        if chatgpt_response is not None:
+            yield chatgpt_response
+            return
+
+        tokens = []
+        for i, chatgpt_prompt in enumerate(chatgpt_prompts):
+            if i > 0:
+                tokens.append("\n")
+                yield "\n"
+            async for token in call_chatgpt_stream_async(chatgpt_prompt, api_key, model, temperature, base_url):
+                _add_stream_token(tokens, token, span_attributes)
+                yield token
+
+        await asyncio.to_thread(_set_section_response, cache_key, "".join(tokens), span_attributes)
+
+
+def section_checkpoint_key(model, job):
+    """
+    Key identifying one section job's result, for checkpointing finished sections between attempts.
+
+    Parameters:
+    - model (str): ChatGPT model, unless the job was routed to another one (see model_routing)
+    - job (dict): Section job (see prepare_document)
+
+    Returns:
+    - string: SHA-256 hex digest of the model and the job's inputs
+    """
+    payload = json.dumps([job.get('model', model), job['temperature'], job['prompt'], job['section_header'], job['section_text']], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def reword_sections_parallel(api_key, model, section_jobs, max_workers=10, base_url=None, use_cache=True, checkpoint=None):
+    """
+    Reword several independent sections at once using a thread pool.
+    Total wait is roughly the slowest single ChatGPT call instead of the sum of all calls.
+
+    Parameters:
+    - api_key
+    - model
+    - section_jobs (list): One dict per section with keys 'temperature', 'prompt', 'section_header' and 'section_text',
+      and optionally 'model' to use instead of model (see model_routing)
+    - max_workers (int): Maximum number of ChatGPT calls in flight. 1 rewords the sections one after another.
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - use_cache (bool): Reuse cached responses for unchanged sections.
+    - checkpoint (dict): Optional store of finished sections (see section_checkpoint_key). Sections found
+      in it are not reworded again, and every section that finishes is added to it, even if another
+      section fails, so a retry only re-runs the failed or changed sections.
+
+    Returns:
+    - list: The reworded output for each section, in the same order as section_jobs
+    """
+    outputs = [None] * len(section_jobs)
+    pending = []
+    for i, job in enumerate(section_jobs):
+        checkpoint_key = section_checkpoint_key(model, job) if checkpoint is not None else None
+        if checkpoint_key is not None and checkpoint_key in checkpoint:
+            outputs[i] = checkpoint[checkpoint_key]
+        else:
+            pending.append((i, job, checkpoint_key))
+
+    if len(pending) == 0:
+        return outputs
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as executor:
+        # Each thread runs in a copy of this context so its spans are recorded in the current trace
+        futures = [
+            executor.submit(contextvars.copy_context().run, reword_section_text, api_key, job.get('model', model), job['temperature'], job['prompt'], job['section_header'], job['section_text'], base_url, use_cache)
+            for i, job, checkpoint_key in pending
+        ]
+        # Results are collected in submission order so the sections stay in document order
+        for (i, job, checkpoint_key), future in zip(pending, futures):
+            try:
+                outputs[i] = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            if checkpoint_key is not None:
+                checkpoint[checkpoint_key] = outputs[i]
+
+    if len(errors) > 0:
+        raise errors[0]
+
+    return outputs
+
+
+def reword_sections_stream(api_key, model, section_jobs, max_workers=10, base_url=None, use_cache=True, checkpoint=None):
+    """
+    Stream several independent sections at once using a thread pool (see reword_section_text_stream).
+    Tokens of every section are yielded as they arrive, so sections are shown side by side
+    instead of one after another.
+
+    Parameters:
+    - api_key
+    - model
+    - section_jobs (list): One dict per section with keys 'temperature', 'prompt', 'section_header' and 'section_text',
+      and optionally 'model' to use instead of model (see model_routing)
+    - max_workers (int): Maximum number of sections streamed at once
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - use_cache (bool): Reuse cached responses for unchanged sections.
+    - checkpoint (dict): Optional store of finished sections, as in reword_sections_parallel. Sections
+      found in it are yielded whole.
+
+    Yields:
+    - tuple: Index of the section in section_jobs, and the next piece of its output. Joining the
+      pieces of a section gives the same string reword_section_text returns.
+    """
+    events = queue.Queue()
+    pending = []
+    for i, job in enumerate(section_jobs):
+        checkpoint_key = section_checkpoint_key(model, job) if checkpoint is not None else None
+        if checkpoint_key is not None and checkpoint_key in checkpoint:
+            yield i, checkpoint[checkpoint_key]
+        else:
+            pending.append((i, job, checkpoint_key))
+
+    def stream_section(i, job, checkpoint_key):
+        tokens = []
+        try:
+            for token in reword_section_text_stream(api_key, job.get('model', model), job['temperature'], job['prompt'], job['section_header'], job['section_text'], base_url, use_cache):
+                tokens.append(token)
+                events.put((i, token, None))
+        except Exception as e:
+            events.put((i, None, e))
+            return
+        if checkpoint_key is not None:
+            checkpoint[checkpoint_key] = "".join(tokens)
+        events.put((i, None, None))
+
+    errors = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending) or 1))) as executor:
+        # Each thread runs in a copy of this context so its spans are recorded in the current trace
+        for i, job, checkpoint_key in pending:
+            executor.submit(contextvars.copy_context().run, stream_section, i, job, checkpoint_key)
+
+        # A (i, None, error) event marks the end of a section
+        finished = 0
+        while finished < len(pending):
+            i, token, error = events.get()
+            if token is not None:
+                yield i, token
+                continue
+            finished += 1
+            if error is not None:
+                errors.append(error)
+
+    if len(errors) > 0:
+        raise errors[0]
+
+
+async def reword_sections_async(api_key, model, section_jobs, base_url=None, use_cache=True):
+    """
+    Reword several independent sections at once on the event loop. The number of calls actually
+    in flight is capped by the shared rate_limit scheduler.
+
+    Parameters:
+    - api_key
+    - model
+    - section_jobs (list): One dict per section with keys 'temperature', 'prompt', 'section_header' and 'section_text',
+      and optionally 'model' to use instead of model (see model_routing)
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - use_cache (bool): Reuse cached responses for unchanged sections.
+
+    Returns:
+    - list: The reworded output for each section, in the same order as section_jobs
+    """
+    return await asyncio.gather(*[
+        reword_section_text_async(api_key, job.get('model', model), job['temperature'], job['prompt'], job['section_header'], job['section_text'], base_url, use_cache)
+        for job in section_jobs
+    ])
+
+
+@tracing.traced()
+def build_batched_prompt(section_jobs):
+    """
+    Combine several section jobs into one ChatGPT prompt that asks for a JSON object keyed by section key.
+    The shared "I am a medical professional" opening of each section prompt is stated once.
+
+    Parameters:
+    - section_jobs (list): Section jobs (see prepare_document)
+
+    Returns:
+    - string: The combined prompt
+    """
+    keys = [job['key'] for job in section_jobs]
+    prompt = (
+        BATCHED_PROMPT_PREAMBLE + "\n\n"
+        "Below are " + str(len(section_jobs)) + " sections of a patient record. Each section has its own INSTRUCTIONS "
+        "and GIVEN INFORMATION. Follow the instructions of each section using only that section's information.\n\n"
+        "Reply with a single JSON object with exactly these keys: " + ", ".join(keys) + ". "
+        "The value of each key is the reworded text for that section, as a string.\n"
+    )
+    for job in section_jobs:
+        instructions = PROMPT_PREAMBLE_PATTERN.sub('', job['prompt'], count=1)
+        prompt += (
+            "\n### SECTION " + job['key'] + "\n\n"
+            "INSTRUCTIONS:\n\n" + instructions + "\n\nGIVEN INFORMATION:\n\n" + job['section_text'] + "\n"
+        )
+    return prompt
+
+
+def parse_batched_response(response, keys):
+    """
+    Parse the JSON response of a batched request.
+
+    Parameters:
+    - response (str): ChatGPT response
+    - keys (list): Section keys that were requested
+
+    Returns:
+    - dict: Reworded text keyed by section key, for every key answered with a non-empty string.
+      Empty if the response is not a JSON object.
+    """
+    try:
+        parsed = json.loads(response)
+    except ValueError:
+        return {}
+    if not isinstance(parsed, dict):
+        return {}
+
+    return {
+        key: parsed[key].strip()
+        for key in keys
+        if isinstance(parsed.get(key), str) and parsed[key].strip() != ''
+    }
+
+
+def reword_sections_batched(api_key, model, section_jobs, max_workers=10, base_url=None, use_cache=True, checkpoint=None):
+    """
+    Reword several sections with one ChatGPT request per temperature and model instead of one request per section.
+    Sections missing from the response (or all of them, if the response is not valid JSON) are
+    reworded with per-section calls instead.
+
+    Parameters:
+    - api_key
+    - model
+    - section_jobs (list): One dict per section with keys 'key', 'temperature', 'prompt', 'section_header' and 'section_text',
+      and optionally 'model' to use instead of model (see model_routing)
+    - max_workers (int): Maximum number of ChatGPT calls in flight for batches and fallback calls
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - use_cache (bool): Reuse cached responses for unchanged sections.
+    - checkpoint (dict): Optional store of finished sections (see reword_sections_parallel)
+
+    Returns:
+    - list: The reworded output for each section, in the same order as section_jobs
+    """
+    results = {}
+
+    # N/A, checkpointed and cached sections need no request
+    batches = {}
+    for job in section_jobs:
+        if checkpoint is not None and section_checkpoint_key(model, job) in checkpoint:
+            results[job['key']] = checkpoint[section_checkpoint_key(model, job)]
+            continue
+
+        if is_na_string(job['section_text']) == True:
+            results[job['key']] = f"{job['section_header']}:\nN/A"
+            continue
+
+        job_model = job.get('model', model)
+        if use_cache and job['temperature'] == 0:
+            cached_response = response_cache.get_cached_response(
+                response_cache.make_cache_key(job_model, job['temperature'], job['prompt'], job['section_text'], base_url, mode="batched")
+            )
+            if cached_response is not None:
+                results[job['key']] = f"{job['section_header']}:\n" + cached_response
+                continue
+
+        batches.setdefault((job['temperature'], job_model), []).append(job)
+
+    def run_batch(temperature, batch_model, batch_jobs):
+        keys = [job['key'] for job in batch_jobs]
+        with tracing.span("reword_sections_batched", model=batch_model, temperature=temperature, sections=len(batch_jobs)) as span_attributes:
+            batched_prompt = build_batched_prompt(batch_jobs)
+            span_attributes['counted_prompt_tokens'] = token_budget.count_tokens(batched_prompt, batch_model)
+            if span_attributes['counted_prompt_tokens'] > token_budget.prompt_token_budget(batch_model):
+                # Too long for one request. Every section falls back to its own request (split into chunks if needed).
+                answered = {}
+                span_attributes['over_budget'] = True
+            else:
+                try:
+                    response = call_chatgpt(batched_prompt, api_key, batch_model, temperature, base_url,
+                                            response_format={"type": "json_object"})
+                    answered = parse_batched_response(response, keys)
+                except Exception as e:
+                    # e.g. a model without JSON mode. Every section falls back to its own request.
+                    answered = {}
+                    span_attributes['error'] = f"{type(e).__name__}: {e}"
+            span_attributes['answered'] = len(answered)
+
+        for job in batch_jobs:
+            if job['key'] in answered:
+                if use_cache and temperature == 0:
+                    response_cache.set_cached_response(
+                        response_cache.make_cache_key(batch_model, temperature, job['prompt'], job['section_text'], base_url, mode="batched"),
+                        answered[job['key']]
+                    )
+                results[job['key']] = f"{job['section_header']}:\n" + answered[job['key']]
+                if checkpoint is not None:
+                    checkpoint[section_checkpoint_key(model, job)] = results[job['key']]
+
+        # Fall back to one request per section for anything the batch did not answer
+        fallback_jobs = [job for job in batch_jobs if job['key'] not in answered]
+        for job, output in zip(fallback_jobs, reword_sections_parallel(api_key, model, fallback_jobs, max_workers, base_url, use_cache, checkpoint)):
+            results[job['key']] = output
+
+    if len(batches) > 0:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(batches)))) as executor:
+            futures = [
+                executor.submit(contextvars.copy_context().run, run_batch, temperature, batch_model, batch_jobs)
+                for (temperature, batch_model), batch_jobs in batches.items()
+            ]
+            # Let every batch finish (and checkpoint its sections) before raising
+            errors = [future.exception() for future in futures]
+            errors = [error for error in errors if error is not None]
+            if len(errors) > 0:
+                raise errors[0]
+
+    return [results[job['key']] for job in section_jobs]
+
+
+@lru_cache(maxsize=64)
+def _pii_masker(replacements):
+    """
+    PiiMasker for a tuple of (placeholder, value) pairs, built once and reused for every section.
+    """
+    return pii_masking.PiiMasker(replacements)
+
+
+def mask_document_pii(texts, name_txt, occupation_txt, employer_txt, live_with_people_txt):
+    """
+    Replace patient specific values in every section text with placeholders before they are sent to ChatGPT
+    (see pii_masking.PiiMasker). A value is never masked inside another value's placeholder.
+
+    Parameters:
+    - texts (list): Section texts. Missing (None) and N/A sections are passed through unchanged.
+    - name_txt (str): Patient name
+    - occupation_txt (str): Occupation from 35.1
+    - employer_txt (str): Employer from 35.2
+    - live_with_people_txt (str): People the patient lives with from 31.1
+
+    Returns:
+    - tuple: The masked texts, and a list of (placeholder, value) pairs to pass to unmask_pii. Only
+      the values found in the texts are listed.
+    """
+    # N/A sections are never sent, so they are neither masked nor checked for placeholder clashes
+    sent_texts = [text for text in texts if is_na_string(text) == False]
+    replacements = pii_masking.patient_replacements(name_txt, occupation_txt, employer_txt, live_with_people_txt, sent_texts)
+    masked_sent_texts, used_replacements = _pii_masker(tuple(replacements)).mask_texts(sent_texts)
+    masked_sent_texts = iter(masked_sent_texts)
+    return [text if is_na_string(text) == True else next(masked_sent_texts) for text in texts], used_replacements
+
+
+def unmask_pii(text, replacements):
+    """
+    Put the values removed by mask_document_pii back into the reworded text.
+
+    Parameters:
+    - text (str): Reworded text containing placeholders
+    - replacements (list): (placeholder, value) pairs
+
+    Returns:
+    - string: Text with the original values restored
+    """
+    return _pii_masker(tuple(tuple(replacement) for replacement in replacements)).unmask(text)
+
+
+@tracing.traced()
+def parse_document(pdf_txt):
+    """
+    Pull everything the pipeline needs out of the extracted PDF text. Depends only on the text,
+    not on the prompts, so the result can be cached per document.
+
+    Parameters:
+    - pdf_txt (str): Text from pdf_file_extract_text
+
+    Returns:
+    - dict: 'name', 'age', 'gender', 'pronouns', 'occupation', 'employer', 'live_with_people',
+      'txt_between_markers' and 'section_texts' (keyed by section key, see DOCUMENT_SECTIONS)
+    """
+    # [Find name/age/gender/pronouns and enable markers in one scan]
+    tags = scan_intake_tags(pdf_txt)
+
+    # [Get patient info]
+    name_txt, age_txt, gender_txt, pronouns_txt = extract_patient_info(pdf_txt, tags)
+
+    # [Get text between Markers]
+    txt_between_markers = extract_enable_text(pdf_txt, tags)
+
+    # [Get Section Text]
+    sections = split_sections(txt_between_markers)
+    section_texts = {}
+    for key, pdf_header, display_header in DOCUMENT_SECTIONS:
+        if pdf_header is None:
+            section_texts[key] = extract_summary_text(txt_between_markers)
+        else:
+            section_texts[key] = sections.get(pdf_header)
+
+    return {
+        'name': name_txt,
+        'age': age_txt,
+        'gender': gender_txt,
+        'pronouns': pronouns_txt,
+        'occupation': extract_occupation(pdf_txt),
+        'employer': extract_employer(pdf_txt),
+        'live_with_people': extract_live_with_people(pdf_txt),
+        'txt_between_markers': txt_between_markers,
+        'section_texts': section_texts
+    }
+
+
+def prepare_document(pdf_txt, prompts, raw_questionaire_txt='N/A', raw_icbc_txt='N/A', parsed=None):
+    """
+    Split the extracted PDF text into sections and build the ChatGPT job for each section.
+
+    Parameters:
+    - pdf_txt (str): Text from pdf_file_extract_text
+    - prompts (dict): Prompt text keyed by section key (see SECTION_PROMPT_NAMES)
+    - raw_questionaire_txt (str): Optional questionaire notes, 'N/A' to skip
+    - raw_icbc_txt (str): Optional ICBC/WBC notes, 'N/A' to skip
+    - parsed (dict): Result of parse_document(pdf_txt), if already available
+
+    Returns:
+    - dict: 'txt_between_markers', 'section_jobs' (in output order), 'original_txt' and 'pii_replacements'
+    """
+    if parsed is None:
+        parsed = parse_document(pdf_txt)
+    section_texts = parsed['section_texts']
+
+    original_txt = ''
+    section_jobs = []
+
+    # [Optional raw notes]
+    if is_na_string(raw_questionaire_txt) == False:
+        section_jobs.append({'key': 'questionaire', 'temperature': 0.7, 'prompt': prompts['questionaire'], 'section_header': '**Questionaire Summary**', 'section_text': raw_questionaire_txt})
+        original_txt += '**Questionaire Summary**:\n' + raw_questionaire_txt + '\n\n'
+
+    if is_na_string(raw_icbc_txt) == False:
+        section_jobs.append({'key': 'icbc', 'temperature': 0, 'prompt': prompts['icbc'], 'section_header': '**ICBC/WBC**', 'section_text': raw_icbc_txt})
+        original_txt += '**ICBC/WBC**:\n' + raw_icbc_txt + '\n\n'
+
+    # [PDF sections]
+    for key, pdf_header, display_header in DOCUMENT_SECTIONS:
+        section_txt = section_texts[key]
+
+        # A section missing from the document (None) is shown as N/A, as is an empty Functional History
+        if section_txt is None or (key == 'func_history' and is_na_string(section_txt) == True):
+            original_txt += ('' if key == 'summary' else '\n\n') + display_header + ':\nN/A'
+        else:
+            original_txt += ('' if key == 'summary' else '\n\n') + display_header + ':\n' + section_txt
+
+        section_jobs.append({'key': key, 'temperature': 0, 'prompt': prompts[key], 'section_header': display_header, 'section_text': section_txt})
+
+    # [Remove PII] from every section sent to ChatGPT, raw notes included
+    masked_texts, pii_replacements = mask_document_pii([job['section_text'] for job in section_jobs], parsed['name'], parsed['occupation'], parsed['employer'], parsed['live_with_people'])
+    for job, masked_text in zip(section_jobs, masked_texts):
+        job['section_text'] = masked_text
+
+    return {
+        'txt_between_markers': parsed['txt_between_markers'],
+        'section_jobs': section_jobs,
+        'original_txt': original_txt,
+        'pii_replacements': pii_replacements
+    }
+
+
+def combine_reworded_sections(document, reworded):
+    """
+    Join the reworded sections into the final text, putting the masked PII back.
+
+    Parameters:
+    - document (dict): Result of prepare_document
+    - reworded (dict): Reworded output keyed by section key
+
+    Returns:
+    - string: The combined rewordified text
+    """
+    combine_sections = ''
+    for key in ('questionaire', 'icbc'):
+        if key in reworded:
+            combine_sections += reworded[key] + '\n\n'
+
+    combine_sections += '\n\n'.join(reworded[key] for key, pdf_header, display_header in DOCUMENT_SECTIONS)
+
+    return unmask_pii(combine_sections, document['pii_replacements'])
+
+
+def rewordify_document(pdf_txt, prompts, api_key, model, raw_questionaire_txt='N/A', raw_icbc_txt='N/A',
+                       max_workers=10, base_url=None, use_cache=True, batched=False, checkpoint=None, routing=None):
+    """
+    Run the whole rewordify pipeline on extracted PDF text.
+
+    Parameters:
+    - pdf_txt (str): Text from pdf_file_extract_text
+    - prompts (dict): Prompt text keyed by section key (see SECTION_PROMPT_NAMES)
+    - api_key
+    - model
+    - raw_questionaire_txt (str): Optional questionaire notes, 'N/A' to skip
+    - raw_icbc_txt (str): Optional ICBC/WBC notes, 'N/A' to skip
+    - max_workers (int): Maximum number of ChatGPT calls in flight
+    - base_url (str): Alternative API base URL. None uses the OpenAI default.
+    - use_cache (bool): Reuse cached responses for unchanged sections.
+    - batched (bool): Reword all sections in one request (see reword_sections_batched)
+    - checkpoint (dict): Optional store of finished sections (see reword_sections_parallel)
+    - routing (dict): Model routing policy (see model_routing.routing_policy). None sends every section to model.
+
+    Returns:
+    - tuple: The prepare_document dict (with each section job's routed 'model' and 'route') and the combined rewordified text
+    """
+    document = prepare_document(pdf_txt, prompts, raw_questionaire_txt, raw_icbc_txt)
+    document['section_jobs'] = model_routing.route_section_jobs(document['section_jobs'], model, routing)
+    section_jobs = document['section_jobs']
+
+    reword_sections = reword_sections_batched if batched else reword_sections_parallel
+    reworded = dict(zip(
+        [job['key'] for job in section_jobs],
+        reword_sections(api_key, model, section_jobs, max_workers=max_workers, base_url=base_url, use_cache=use_cache, checkpoint=checkpoint)
+    ))
+
+    return document, combine_reworded_sections(document, reworded)